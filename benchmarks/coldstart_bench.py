@@ -0,0 +1,165 @@
+"""Cold-start benchmark for the Lambda handlers.
+
+Loads each handler in a fresh interpreter under `python -X importtime`, the way a new Lambda
+container does, and reports the module import cost, the heaviest imports, and which heavy
+modules an early-return invocation (an empty event) ends up loading.
+
+    python benchmarks/coldstart_bench.py
+    python benchmarks/coldstart_bench.py --handlers organa-search-handler --budget-ms 150
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+LAMBDA_DIR = ROOT / 'lamda_functions'
+RESULTS_DIR = BENCH_DIR / 'results'
+
+HEAVY_MODULES = ['boto3', 'botocore', 'fitz', 'PIL.Image', 'numpy', 'openai', 'psycopg', 'pymysql']
+# modules the handlers import that may not be installed locally; an empty placeholder lets the
+# handler load, and its own import cost is reported as excluded rather than measured
+OPTIONAL_MODULES = ['datatier', 'openai', 'psycopg', 'pymysql']
+MARKER = '--- coldstart: loading handler ---'
+CALL_MARKER = '--- coldstart: early-return call ---'
+
+
+def child(name):
+    sys.path.insert(0, str(LAMBDA_DIR))
+    excluded = []
+    for module in OPTIONAL_MODULES:
+        if importlib.util.find_spec(module) is None:
+            sys.modules[module] = types.ModuleType(module)
+            excluded.append(module)
+
+    sys.stderr.write(MARKER + '\n')
+    sys.stderr.flush()
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), LAMBDA_DIR / f"{name}.py")
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+    init_ms = (time.perf_counter() - start) * 1000
+    loaded_at_init = [module for module in HEAVY_MODULES if module in sys.modules and module not in excluded]
+
+    sys.stderr.write(CALL_MARKER + '\n')
+    sys.stderr.flush()
+
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = handler.lambda_handler({}, None)
+        status = response.get('statusCode') if isinstance(response, dict) else None
+    except Exception as e:
+        status = type(e).__name__
+    early_return_ms = (time.perf_counter() - start) * 1000
+    loaded_after_call = [module for module in HEAVY_MODULES if module in sys.modules and module not in excluded]
+
+    print(json.dumps({
+        'init_ms': round(init_ms, 3),
+        'early_return_status': status,
+        'early_return_ms': round(early_return_ms, 3),
+        'heavy_loaded_at_init': loaded_at_init,
+        'heavy_loaded_after_early_return': loaded_after_call,
+        'excluded': excluded
+    }))
+
+
+def parse_importtime(lines):
+    # "import time: self [us] | cumulative | imported package", two spaces of indent per nesting level
+    top_level = []
+    for line in lines:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, package = line[len('import time:'):].split('|')
+        if package.startswith('  '):
+            continue
+        top_level.append((package.strip(), int(cumulative) / 1000))
+    return top_level
+
+
+def measure(name, workdir):
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(pathlib.Path(__file__).resolve()), '--child', name],
+        cwd=workdir, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} failed to load:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    lines = completed.stderr.splitlines()
+    init_lines = lines[lines.index(MARKER) + 1:lines.index(CALL_MARKER)]
+    call_lines = lines[lines.index(CALL_MARKER) + 1:]
+    imports = parse_importtime(init_lines)
+    result['import_ms'] = round(sum(ms for _, ms in imports), 3)
+    result['top_imports'] = [[package, round(ms, 3)] for package, ms in sorted(imports, key=lambda item: -item[1])[:5]]
+    result['early_return_import_ms'] = round(sum(ms for _, ms in parse_importtime(call_lines)), 3)
+    return result
+
+
+def run(handlers, repeat):
+    # an empty working directory means no organa-config.ini, so nothing reaches AWS or a database
+    workdir = tempfile.mkdtemp(prefix='organa-coldstart-')
+    results = {}
+    for name in handlers:
+        runs = [measure(name, workdir) for _ in range(repeat)]
+        result = runs[-1]
+        result['import_ms'] = round(statistics.median(run['import_ms'] for run in runs), 3)
+        result['init_ms'] = round(statistics.median(run['init_ms'] for run in runs), 3)
+        result['early_return_import_ms'] = round(statistics.median(run['early_return_import_ms'] for run in runs), 3)
+        results[name] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--handlers', default=None, help='comma-separated handler names (default: all organa-* handlers)')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters per handler; the median is reported')
+    parser.add_argument('--budget-ms', type=float, default=None, help='exit non-zero if any handler imports take longer')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    if args.handlers:
+        handlers = args.handlers.split(',')
+    else:
+        handlers = sorted(path.stem for path in LAMBDA_DIR.glob('organa-*.py'))
+
+    results = run(handlers, args.repeat)
+
+    print(f"{'handler':<38}{'import ms':>11}{'init ms':>10}{'empty event':>13}  heavy modules after an empty event")
+    for name, result in results.items():
+        heavy = ', '.join(result['heavy_loaded_after_early_return']) or '-'
+        print(f"{name:<38}{result['import_ms']:>11.1f}{result['init_ms']:>10.1f}{str(result['early_return_status']):>13}  {heavy}")
+    excluded = sorted({module for result in results.values() for module in result['excluded']})
+    if excluded:
+        print(f"\nNot installed, excluded from the numbers: {', '.join(excluded)}")
+
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    output = pathlib.Path(args.output) if args.output else RESULTS_DIR / f"coldstart-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({'meta': {'timestamp': stamp, 'repeat': args.repeat, 'python': sys.version.split()[0]}, 'handlers': results}, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.budget_ms is not None:
+        over = [name for name, result in results.items() if result['import_ms'] > args.budget_ms]
+        if over:
+            print(f"\nOver the {args.budget_ms} ms import budget: {', '.join(over)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
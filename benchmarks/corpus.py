@@ -0,0 +1,91 @@
+import random
+
+import fitz
+from PIL import Image, ImageDraw, ImageFilter
+
+WORDS = (
+    "analysis theorem lecture syllabus invoice contract protein enzyme neural network gradient "
+    "budget quarterly revenue tenant lease statute appellate court thermodynamics entropy "
+    "photosynthesis chloroplast manuscript citation hypothesis regression variance sample "
+    "catalyst polymer reactor circuit voltage resistor capacitor algorithm complexity graph "
+    "semester assignment midterm grading rubric seminar archive minutes agenda committee"
+).split()
+
+PAGE_SIZES = {
+    'letter': (612, 792),
+    'a4': (595, 842),
+    'a5': (420, 595),
+    'legal': (612, 1008)
+}
+
+KINDS = ['text', 'scan', 'photo', 'mixed']
+
+
+def make_lines(rng, count, words_per_line=10):
+    return [" ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(count)]
+
+
+def render_scan(lines, width, height, rng, noise=True):
+    # a rasterised page with slight skew and speckle, the way a phone or camera capture looks
+    scale = 2
+    image = Image.new("RGB", (width * scale, height * scale), (245, 243, 238))
+    draw = ImageDraw.Draw(image)
+    y = 60
+    for line in lines:
+        draw.text((60, y), line, fill=(30, 30, 30))
+        y += 28
+        if y > height * scale - 60:
+            break
+    if noise:
+        for _ in range(width * height // 200):
+            x, y = rng.randrange(width * scale), rng.randrange(height * scale)
+            draw.point((x, y), fill=(rng.randrange(120, 200),) * 3)
+    image = image.rotate(rng.uniform(-2.0, 2.0), expand=False, fillcolor=(245, 243, 238))
+    return image.filter(ImageFilter.GaussianBlur(0.6))
+
+
+def render_photo(width, height, rng):
+    image = Image.effect_noise((width, height), 48).convert("RGB")
+    overlay = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    return Image.blend(image, overlay, 0.5)
+
+
+def image_bytes(image, fmt="JPEG"):
+    from io import BytesIO
+
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=85)
+    return buffer.getvalue()
+
+
+def make_pdf(pages=1, kind='text', page_size='letter', seed=0, lines_per_page=30):
+    """Builds a synthetic PDF and returns (pdf_bytes, text_lines_per_page)."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    text_pages = []
+
+    for index in range(pages):
+        size_name = rng.choice(list(PAGE_SIZES)) if page_size == 'mixed' else page_size
+        width, height = PAGE_SIZES[size_name]
+        page_kind = rng.choice(['text', 'scan', 'photo']) if kind == 'mixed' else kind
+        lines = make_lines(rng, lines_per_page)
+        page = doc.new_page(width=width, height=height)
+
+        if page_kind == 'text':
+            y = 72
+            for line in lines:
+                page.insert_text((72, y), line, fontsize=10)
+                y += 14
+                if y > height - 72:
+                    break
+        elif page_kind == 'scan':
+            page.insert_image(page.rect, stream=image_bytes(render_scan(lines, int(width), int(height), rng)))
+        else:
+            page.insert_image(page.rect, stream=image_bytes(render_photo(int(width), int(height), rng)))
+            lines = []
+
+        text_pages.append(lines)
+
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes, text_pages
@@ -0,0 +1,364 @@
+"""End-to-end pipeline benchmark.
+
+Runs the real handlers from lamda_functions/ (upload -> process -> extract -> embed -> search)
+against local stand-ins for S3, MySQL, Postgres/pgvector, Textract and OpenAI, and reports
+throughput plus p50/p95/p99 latency per stage and per traced span.
+
+    python benchmarks/pipeline_bench.py --documents 20 --pages 1,5,20 --kind mixed
+    python benchmarks/pipeline_bench.py --documents 50 --pages 1 --embed-batch 25
+    python benchmarks/pipeline_bench.py --compare benchmarks/results/baseline.json
+"""
+import argparse
+import base64
+import contextlib
+import importlib.util
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+LAMBDA_DIR = ROOT / 'lamda_functions'
+RESULTS_DIR = BENCH_DIR / 'results'
+
+sys.path.insert(0, str(LAMBDA_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import corpus
+import standins
+
+BUCKET = 'organa-bench'
+USER_ID = 80001
+USERNAME = 'bench'
+
+CONFIG_TEMPLATE = """[s3]
+bucket_name = {bucket}
+region_name = us-east-2
+
+[s3readwrite]
+region_name = us-east-2
+aws_access_key_id = local
+aws_secret_access_key = local
+
+[rds]
+endpoint = localhost
+port_number = 3306
+user_name = bench
+user_pwd = bench
+db_name = organa
+
+[mysql]
+endpoint = localhost
+port_number = 3306
+user_name = bench
+user_pwd = bench
+db_name = organa
+
+[postgres]
+endpoint = {pg_host}
+port_number = {pg_port}
+db_name = {pg_dbname}
+user_name = {pg_user}
+user_pwd = {pg_password}
+
+[openai]
+api_key = local
+
+[textract]
+shard_pages = {shard_pages}
+"""
+
+STAGES = [
+    ('process', 'organa-pdf-processing-handler'),
+    ('extract', 'organa-text-extraction-handler'),
+    ('embed', 'organa-embeddings-handler')
+]
+
+SEARCH_QUERIES = [
+    "quarterly revenue budget",
+    "neural network gradient",
+    "court statute appellate",
+    "enzyme protein catalyst",
+    "midterm grading rubric"
+]
+
+
+def load_handler(name):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), LAMBDA_DIR / f"{name}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def s3_event(bucket, *keys):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}} for key in keys]}
+
+
+def next_key(stage, key):
+    if stage == 'process':
+        return key.replace('organa-original/', 'organa-processed/')
+    if stage == 'extract':
+        return key.replace('organa-processed/', 'organa-extracted-text/').replace('.pdf', '.txt')
+    return None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(max(samples), 3)
+    }
+
+
+def parse_pg(dsn):
+    settings = {'host': 'localhost', 'port': '5432', 'dbname': 'organa', 'user': 'postgres', 'password': ''}
+    for part in (dsn or '').split():
+        name, _, value = part.partition('=')
+        settings[name] = value
+    return settings
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def timed(samples, fn, *args):
+    start = time.perf_counter()
+    response = fn(*args)
+    samples.append((time.perf_counter() - start) * 1000)
+    return response
+
+
+def build_corpus(args):
+    page_counts = [int(count) for count in args.pages.split(',')]
+    documents = []
+    for index in range(args.documents):
+        pages = page_counts[index % len(page_counts)]
+        pdf_bytes, text_pages = corpus.make_pdf(pages=pages, kind=args.kind, page_size=args.page_size, seed=args.seed + index)
+        documents.append({'filename': f"bench-{index:04d}.pdf", 'pages': pages, 'pdf': pdf_bytes, 'text': text_pages})
+    return documents
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='organa-bench-')
+    pg = parse_pg(args.postgres)
+    with open(os.path.join(workdir, 'organa-config.ini'), 'w') as config_file:
+        config_file.write(CONFIG_TEMPLATE.format(
+            bucket=BUCKET,
+            pg_host=pg['host'],
+            pg_port=pg['port'],
+            pg_dbname=pg['dbname'],
+            pg_user=pg['user'],
+            pg_password=pg['password'],
+            shard_pages=args.shard_pages
+        ))
+
+    print(f"Building corpus of {args.documents} documents ({args.kind}, pages {args.pages})")
+    documents = build_corpus(args)
+
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    span_records = []
+    stage_samples = defaultdict(list)
+    failures = defaultdict(int)
+
+    handler_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    try:
+        with handler_output, standins.StandIns(workdir, [(USER_ID, USERNAME, 'x')], real_postgres=args.postgres is not None, textract_polls=args.textract_polls) as env:
+            import tracing
+            import textcodec
+            tracing.set_sink(span_records)
+
+            upload = load_handler('organa-upload-handler')
+            stage_handlers = {stage: load_handler(name) for stage, name in STAGES}
+            search = load_handler('organa-search-handler')
+
+            # with --embed-batch N the embeddings handler gets N extracted documents per invocation
+            per_document_stages = STAGES if args.embed_batch <= 1 else STAGES[:-1]
+            pending_embeds = []
+            extracted_keys = []
+
+            def embed_pending():
+                response = timed(stage_samples['embed'], stage_handlers['embed'].lambda_handler, s3_event(BUCKET, *pending_embeds), None)
+                if response['statusCode'] != 200:
+                    failures['embed'] += len(pending_embeds)
+                pending_embeds.clear()
+
+            start = time.perf_counter()
+            for document in documents:
+                body = json.dumps({'filename': document['filename'], 'data': base64.b64encode(document['pdf']).decode('utf-8')})
+                response = timed(stage_samples['upload'], upload.lambda_handler, {'pathParameters': {'userid': str(USER_ID)}, 'body': body}, None)
+                if response['statusCode'] != 200:
+                    failures['upload'] += 1
+                    continue
+
+                key = json.loads(response['body'])['file_path']
+                env.textract.record_text(next_key('process', key), document['text'])
+
+                for stage, _ in per_document_stages:
+                    timed(stage_samples[stage], stage_handlers[stage].lambda_handler, s3_event(BUCKET, key), None)
+                    produced = next_key(stage, key)
+                    if produced and (BUCKET, produced) not in env.s3.objects:
+                        failures[stage] += 1
+                        break
+                    key = produced
+                    if stage == 'extract':
+                        extracted_keys.append(key)
+                else:
+                    if per_document_stages is not STAGES:
+                        pending_embeds.append(key)
+                        if len(pending_embeds) >= args.embed_batch:
+                            embed_pending()
+            if pending_embeds:
+                embed_pending()
+            pipeline_seconds = time.perf_counter() - start
+
+            # resuming at the embed stage copies the extracted text onto itself; it must still decode
+            resume = load_handler('organa-resume-handler')
+            for key in extracted_keys:
+                expected = textcodec.read_text(env.s3.get_object(Bucket=BUCKET, Key=key))
+                resume.retrigger(env.s3, BUCKET, key)
+                try:
+                    resumed = textcodec.read_text(env.s3.get_object(Bucket=BUCKET, Key=key))
+                except UnicodeDecodeError:
+                    resumed = None
+                if resumed != expected:
+                    failures['resume'] += 1
+
+            for index in range(args.queries):
+                query = SEARCH_QUERIES[index % len(SEARCH_QUERIES)]
+                event = {
+                    'pathParameters': {'userid': str(USER_ID)},
+                    'queryStringParameters': {'query': query, 'limit': '5', 'threshold': '0'}
+                }
+                response = timed(stage_samples['search'], search.lambda_handler, event, None)
+                if response['statusCode'] != 200:
+                    failures['search'] += 1
+
+            tracing.set_sink(None)
+            openai_stats = dict(env.openai_stats)
+            stored_bytes = sum(len(obj['Body']) for obj in env.s3.objects.values())
+    finally:
+        os.chdir(previous_cwd)
+
+    span_samples = defaultdict(list)
+    for record in span_records:
+        if 'Duration' in record:
+            span_samples[record['span']].append(record['Duration'])
+
+    total_pages = sum(document['pages'] for document in documents)
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'git_revision': git_revision(),
+            'documents': args.documents,
+            'pages': args.pages,
+            'kind': args.kind,
+            'page_size': args.page_size,
+            'seed': args.seed,
+            'queries': args.queries,
+            'embed_batch': args.embed_batch,
+            'shard_pages': args.shard_pages,
+            'postgres': 'real' if args.postgres else 'fake'
+        },
+        'throughput': {
+            'pipeline_seconds': round(pipeline_seconds, 3),
+            'documents_per_second': round(len(documents) / pipeline_seconds, 3) if pipeline_seconds else None,
+            'pages_per_second': round(total_pages / pipeline_seconds, 3) if pipeline_seconds else None
+        },
+        'stages': {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        'spans': {name: summarize(samples) for name, samples in sorted(span_samples.items())},
+        'failures': dict(failures),
+        'openai': openai_stats,
+        's3_stored_bytes': stored_bytes
+    }
+
+
+def compare(current, baseline, tolerance):
+    regressions = []
+    print(f"{'stage':<36}{'baseline p50':>14}{'current p50':>14}{'baseline p95':>14}{'current p95':>14}")
+    for section in ('stages', 'spans'):
+        for name, stats in current[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before or not stats.get('count') or not before.get('count'):
+                continue
+            print(f"{name:<36}{before['p50_ms']:>14.2f}{stats['p50_ms']:>14.2f}{before['p95_ms']:>14.2f}{stats['p95_ms']:>14.2f}")
+            for metric in ('p50_ms', 'p95_ms'):
+                if before[metric] > 0 and stats[metric] > before[metric] * (1 + tolerance):
+                    regressions.append(f"{section}.{name}.{metric}: {before[metric]:.2f} -> {stats[metric]:.2f}")
+    return regressions
+
+
+def print_report(results):
+    throughput = results['throughput']
+    print(f"\nPipeline: {throughput['pipeline_seconds']}s, {throughput['documents_per_second']} docs/s, {throughput['pages_per_second']} pages/s")
+    print(f"{'stage':<36}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for section in ('stages', 'spans'):
+        for name, stats in results[section].items():
+            if stats.get('count'):
+                print(f"{name:<36}{stats['count']:>7}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    if results['failures']:
+        print(f"Failures: {results['failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=10)
+    parser.add_argument('--pages', default='1,5', help='comma-separated page counts cycled across documents')
+    parser.add_argument('--kind', choices=corpus.KINDS, default='mixed', help='born-digital text, scans, photos or a mix')
+    parser.add_argument('--page-size', default='letter', choices=list(corpus.PAGE_SIZES) + ['mixed'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--embed-batch', type=int, default=1, help='extracted documents per embeddings invocation (exercises the batched writer)')
+    parser.add_argument('--shard-pages', type=int, default=0, help='[textract] shard_pages: split longer documents into concurrent Textract jobs (0 = off)')
+    parser.add_argument('--textract-polls', type=int, default=0, help='IN_PROGRESS responses before each fake job succeeds')
+    parser.add_argument('--postgres', default=None, help='libpq-style "host=... dbname=..." to use a real Postgres+pgvector')
+    parser.add_argument('--output', default=None, help='results JSON path (default benchmarks/results/pipeline-<timestamp>.json)')
+    parser.add_argument('--compare', default=None, help='baseline results JSON to compare against')
+    parser.add_argument('--verbose', action='store_true', help='show handler output')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed p50/p95 slowdown before flagging a regression')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+
+    output = pathlib.Path(args.output) if args.output else RESULTS_DIR / f"pipeline-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(pathlib.Path(args.compare).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions beyond tolerance.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Micro-benchmark for process_pdf and pdf_page_to_pil.
+
+Each case runs in a fresh process so peak RSS is attributable to that case alone.
+
+    python benchmarks/process_pdf_bench.py --kinds text,scan,photo,mixed --pages 1,10,100
+    python benchmarks/process_pdf_bench.py --kinds scan --pages 50 --profile cprofile
+"""
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import pathlib
+import resource
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+LAMBDA_DIR = ROOT / 'lamda_functions'
+RESULTS_DIR = BENCH_DIR / 'results'
+PROCESSOR = 'organa-pdf-processing-handler'
+
+
+def load_processor():
+    sys.path.insert(0, str(LAMBDA_DIR))
+    sys.path.insert(0, str(BENCH_DIR))
+    # datatier.py itself is always on the path; it is the PyMySQL it loads that may be missing
+    if importlib.util.find_spec('pymysql') is None:
+        import standins
+        sys.modules['datatier'] = standins.make_datatier_module(':memory:')
+
+    import tracing
+    tracing.set_sink([])
+
+    spec = importlib.util.spec_from_file_location(PROCESSOR.replace('-', '_'), LAMBDA_DIR / f"{PROCESSOR}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(pdf_bytes, pages, repeat, profiler, profile_path):
+    processor = load_processor()
+    import fitz
+
+    baseline_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    for page in document:
+        processor.pdf_page_to_pil(page)
+    document.close()
+    to_pil_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    output_bytes = 0
+    profile = None
+    if profiler == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+    elif profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+        profile = Profiler()
+
+    for iteration in range(repeat):
+        if profile is not None and iteration == 0:
+            profile.enable() if profiler == 'cprofile' else profile.start()
+        start = time.perf_counter()
+        output = processor.process_pdf(pdf_bytes)
+        timings.append((time.perf_counter() - start) * 1000)
+        if profile is not None and iteration == 0:
+            profile.disable() if profiler == 'cprofile' else profile.stop()
+        output_bytes = len(output)
+        del output
+
+    if profiler == 'cprofile':
+        profile.dump_stats(profile_path)
+    elif profiler == 'pyinstrument':
+        pathlib.Path(profile_path).write_text(profile.output_html())
+
+    best_ms = min(timings)
+    return {
+        'pages': pages,
+        'input_bytes': len(pdf_bytes),
+        'process_pdf_ms': [round(timing, 3) for timing in timings],
+        'per_page_ms': round(best_ms / pages, 3),
+        'pdf_page_to_pil_per_page_ms': round(to_pil_ms / pages, 3),
+        'output_bytes': output_bytes,
+        'output_bytes_per_page': output_bytes // pages,
+        'baseline_rss_mb': round(baseline_rss, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'profile': profile_path if profiler else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--kinds', default='text,scan,photo,mixed')
+    parser.add_argument('--pages', default='1,10,50', help='comma-separated page counts, up to 500')
+    parser.add_argument('--page-size', default='mixed')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BENCH_DIR))
+    import corpus
+
+    context = multiprocessing.get_context('spawn')
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+
+    cases = []
+    print(f"{'kind':<8}{'pages':>6}{'ms/page':>10}{'to_pil ms/page':>16}{'out KB/page':>13}{'peak RSS MB':>13}")
+    for kind in args.kinds.split(','):
+        for pages in [int(count) for count in args.pages.split(',')]:
+            pdf_bytes, _ = corpus.make_pdf(pages=pages, kind=kind, page_size=args.page_size, seed=args.seed)
+            profile_path = None
+            if args.profile:
+                extension = 'prof' if args.profile == 'cprofile' else 'html'
+                profile_path = str(RESULTS_DIR / f"process_pdf-{kind}-{pages}-{stamp}.{extension}")
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (pdf_bytes, pages, args.repeat, args.profile, profile_path))
+            result['kind'] = kind
+            cases.append(result)
+            print(f"{kind:<8}{pages:>6}{result['per_page_ms']:>10.2f}{result['pdf_page_to_pil_per_page_ms']:>16.2f}"
+                  f"{result['output_bytes_per_page'] / 1024:>13.1f}{result['peak_rss_mb']:>13.1f}")
+
+    output = pathlib.Path(args.output) if args.output else RESULTS_DIR / f"process_pdf-{stamp}.json"
+    output.write_text(json.dumps({
+        'meta': {'timestamp': stamp, 'page_size': args.page_size, 'repeat': args.repeat, 'seed': args.seed},
+        'cases': cases
+    }, indent=2))
+    print(f"\nResults written to {output}")
+
+
+if __name__ == '__main__':
+    main()
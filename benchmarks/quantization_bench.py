@@ -0,0 +1,233 @@
+"""Recall / latency / storage benchmark for compact embedding representations.
+
+Compares the float column against halfvec, int8 scalar quantization and binary quantization
+(each with float re-ranking of k * factor candidates) on synthetic ada-002-shaped vectors.
+By default everything runs in NumPy; --postgres repeats the float/half/binary comparison
+with the same SQL shapes the search handler uses, against a real pgvector 0.7+ database.
+
+    python benchmarks/quantization_bench.py --documents 20000 --queries 200
+    python benchmarks/quantization_bench.py --postgres "host=localhost dbname=organa user=postgres" --index
+"""
+import argparse
+import json
+import pathlib
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / 'results'
+
+DIMENSIONS = 1536
+# pgvector on-disk sizes: 8-byte header plus the payload
+STORAGE_BYTES = {
+    'float': lambda d: 8 + 4 * d,
+    'half': lambda d: 8 + 2 * d,
+    'int8': lambda d: 8 + d,
+    'binary': lambda d: 8 + d // 8
+}
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def synthetic_vectors(count, topics, seed, dimensions=DIMENSIONS):
+    # ada-002 vectors share a strong common direction (pairwise cosine ~0.7-0.9) plus topic structure
+    rng = np.random.default_rng(seed)
+    common = rng.normal(size=dimensions)
+    centers = rng.normal(size=(topics, dimensions))
+    assignment = rng.integers(topics, size=count)
+    vectors = 2.5 * common + centers[assignment] + 0.8 * rng.normal(size=(count, dimensions))
+    return normalize(vectors).astype(np.float32)
+
+
+def exact_top_k(documents, queries, k):
+    scores = queries @ documents.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def rerank(documents, query, candidates, k):
+    scores = documents[candidates] @ query
+    return candidates[np.argsort(-scores)[:k]]
+
+
+def search_half(documents, queries, k, factor):
+    stored = documents.astype(np.float16).astype(np.float32)
+    return [rerank(documents, query, np.argsort(-(stored @ query))[:k * factor], k) for query in queries]
+
+
+def search_int8(documents, queries, k, factor):
+    low, high = documents.min(axis=0), documents.max(axis=0)
+    scale = np.maximum(high - low, 1e-12) / 255
+    stored = np.round((documents - low) / scale).astype(np.uint8)
+    restored = stored.astype(np.float32) * scale + low
+    return [rerank(documents, query, np.argsort(-(restored @ query))[:k * factor], k) for query in queries]
+
+
+def search_binary(documents, queries, k, factor):
+    stored = np.packbits(documents > 0, axis=1)
+    results = []
+    for query in queries:
+        hamming = POPCOUNT[np.bitwise_xor(stored, np.packbits(query > 0))].sum(axis=1)
+        candidates = np.argpartition(hamming, k * factor)[:k * factor]
+        results.append(rerank(documents, query, candidates, k))
+    return results
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f.tolist()) & set(t.tolist())) / len(t) for f, t in zip(found, truth)]))
+
+
+def timed_per_query(fn, documents, queries, *args):
+    start = time.perf_counter()
+    found = fn(documents, queries, *args)
+    return found, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def run_numpy(documents, queries, k, factors):
+    truth, exact_ms = timed_per_query(exact_top_k, documents, queries, k)
+    results = {'float': {'recall': 1.0, 'ms_per_query': round(exact_ms, 3), 'bytes_per_vector': STORAGE_BYTES['float'](documents.shape[1])}}
+    for mode, fn in (('half', search_half), ('int8', search_int8), ('binary', search_binary)):
+        for factor in factors[mode]:
+            found, ms = timed_per_query(fn, documents, queries, k, factor)
+            results[f"{mode}x{factor}"] = {
+                'recall': round(recall(found, truth), 4),
+                'ms_per_query': round(ms, 3),
+                'bytes_per_vector': STORAGE_BYTES[mode](documents.shape[1]),
+                'rerank_factor': factor
+            }
+    return results
+
+
+def run_postgres(dsn, documents, queries, k, factors, build_index):
+    import psycopg
+
+    d = documents.shape[1]
+    literal = lambda vector: '[' + ','.join(f"{value:.7g}" for value in vector) + ']'
+    results = {}
+    with psycopg.connect(dsn, autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS quantization_bench")
+        cur.execute(f"""
+            CREATE TABLE quantization_bench (
+                id INT PRIMARY KEY,
+                embedding vector({d}),
+                embedding_half halfvec({d}),
+                embedding_bits bit({d})
+            )
+        """)
+        with cur.copy("COPY quantization_bench (id, embedding) FROM STDIN") as copy:
+            for index, vector in enumerate(documents):
+                copy.write_row((index, literal(vector)))
+        cur.execute(f"UPDATE quantization_bench SET embedding_half = embedding::halfvec({d}), embedding_bits = binary_quantize(embedding)::bit({d})")
+        if build_index:
+            cur.execute("CREATE INDEX ON quantization_bench USING hnsw (embedding vector_l2_ops)")
+            cur.execute("CREATE INDEX ON quantization_bench USING hnsw (embedding_half halfvec_l2_ops)")
+            cur.execute("CREATE INDEX ON quantization_bench USING hnsw (embedding_bits bit_hamming_ops)")
+        cur.execute("ANALYZE quantization_bench")
+
+        cur.execute("""
+            SELECT AVG(pg_column_size(embedding)), AVG(pg_column_size(embedding_half)), AVG(pg_column_size(embedding_bits)),
+                   pg_total_relation_size('quantization_bench')
+            FROM quantization_bench
+        """)
+        float_bytes, half_bytes, bits_bytes, table_bytes = cur.fetchone()
+        sizes = {'float': float(float_bytes), 'half': float(half_bytes), 'binary': float(bits_bytes)}
+
+        exact_sql = "SELECT id FROM quantization_bench ORDER BY embedding <-> %s::vector LIMIT %s"
+        truth, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            cur.execute(exact_sql, (literal(query), k))
+            timings.append((time.perf_counter() - start) * 1000)
+            truth.append(np.array([row[0] for row in cur.fetchall()]))
+        results['float'] = {'recall': 1.0, 'ms_per_query': round(float(np.mean(timings)), 3), 'bytes_per_vector': sizes['float']}
+
+        order = {
+            'half': f"embedding_half <-> %s::vector::halfvec({d})",
+            'binary': f"embedding_bits <~> binary_quantize(%s::vector)::bit({d})"
+        }
+        for mode in ('half', 'binary'):
+            for factor in factors[mode]:
+                sql = f"""
+                    SELECT id FROM (
+                        SELECT id, embedding FROM quantization_bench ORDER BY {order[mode]} LIMIT %s
+                    ) candidates
+                    ORDER BY embedding <-> %s::vector
+                    LIMIT %s
+                """
+                found, timings = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    cur.execute(sql, (literal(query), k * factor, literal(query), k))
+                    timings.append((time.perf_counter() - start) * 1000)
+                    found.append(np.array([row[0] for row in cur.fetchall()]))
+                results[f"{mode}x{factor}"] = {
+                    'recall': round(recall(found, truth), 4),
+                    'ms_per_query': round(float(np.mean(timings)), 3),
+                    'bytes_per_vector': sizes[mode],
+                    'rerank_factor': factor
+                }
+        results['table_bytes'] = int(table_bytes)
+        cur.execute("DROP TABLE quantization_bench")
+    return results
+
+
+def print_table(title, results):
+    print(f"\n{title}")
+    print(f"{'representation':<16}{'recall@k':>10}{'ms/query':>11}{'bytes/vector':>14}")
+    for name, stats in results.items():
+        if isinstance(stats, dict):
+            print(f"{name:<16}{stats['recall']:>10.4f}{stats['ms_per_query']:>11.3f}{stats['bytes_per_vector']:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--topics', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--half-factors', default='1,2')
+    parser.add_argument('--int8-factors', default='1,2')
+    parser.add_argument('--binary-factors', default='4,10,20')
+    parser.add_argument('--postgres', default=None, help='libpq DSN of a pgvector 0.7+ database (creates and drops quantization_bench)')
+    parser.add_argument('--index', action='store_true', help='build HNSW indexes in --postgres mode')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    factors = {
+        'half': [int(value) for value in args.half_factors.split(',')],
+        'int8': [int(value) for value in args.int8_factors.split(',')],
+        'binary': [int(value) for value in args.binary_factors.split(',')]
+    }
+    vectors = synthetic_vectors(args.documents + args.queries, args.topics, args.seed)
+    documents, queries = vectors[:args.documents], vectors[args.documents:]
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'documents': args.documents,
+            'queries': args.queries,
+            'k': args.k,
+            'dimensions': DIMENSIONS
+        },
+        'numpy': run_numpy(documents, queries, args.k, factors)
+    }
+    print_table('NumPy brute force', results['numpy'])
+
+    if args.postgres:
+        results['postgres'] = run_postgres(args.postgres, documents, queries, args.k, factors, args.index)
+        print_table('Postgres / pgvector', results['postgres'])
+
+    output = pathlib.Path(args.output) if args.output else RESULTS_DIR / f"quantization-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,630 @@
+import hashlib
+import contextlib
+import io
+import json
+import math
+import re
+import sqlite3
+import sys
+import types
+import uuid
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+EMBEDDING_DIMENSIONS = 1536
+TEXTRACT_PAGE_SIZE = 1000
+
+
+class FakeBody:
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self._stream.read(size)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class FakeS3:
+    """Dictionary-backed S3 client covering the calls the handlers make."""
+
+    def __init__(self):
+        self.objects = {}
+        self.multipart = {}
+
+    def _not_found(self, operation):
+        raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+    def put_object(self, Bucket, Key, Body, ContentType='binary/octet-stream', Metadata=None, ContentEncoding=None, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        self.objects[(Bucket, Key)] = {
+            'Body': bytes(Body),
+            'ContentType': ContentType,
+            'ContentEncoding': ContentEncoding,
+            'Metadata': dict(Metadata or {})
+        }
+        return {'ETag': hashlib.md5(Body).hexdigest()}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'Not Found'}}, 'GetObject')
+        data = obj['Body']
+        response = {}
+        if kwargs.get('Range'):
+            # bytes=first-last, clamped to the object like S3 does
+            first, last = kwargs['Range'].split('=', 1)[1].split('-')
+            first, last = int(first), min(int(last), len(data) - 1)
+            response['ContentRange'] = f"bytes {first}-{last}/{len(data)}"
+            data = data[first:last + 1]
+        response.update({
+            'Body': FakeBody(data),
+            'ContentLength': len(data),
+            'ContentType': obj['ContentType'],
+            'Metadata': dict(obj['Metadata'])
+        })
+        if obj['ContentEncoding']:
+            response['ContentEncoding'] = obj['ContentEncoding']
+        return response
+
+    def head_object(self, Bucket, Key, **kwargs):
+        obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            self._not_found('HeadObject')
+        response = {
+            'ContentLength': len(obj['Body']),
+            'ContentType': obj['ContentType'],
+            'Metadata': dict(obj['Metadata'])
+        }
+        if obj['ContentEncoding']:
+            response['ContentEncoding'] = obj['ContentEncoding']
+        return response
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None, MetadataDirective='COPY', ContentType=None, ContentEncoding=None, **kwargs):
+        source = self.objects.get((CopySource['Bucket'], CopySource['Key']))
+        if source is None:
+            self._not_found('CopyObject')
+        copied = dict(source)
+        if MetadataDirective == 'REPLACE':
+            # like S3, REPLACE keeps only the headers passed with the copy
+            copied['Metadata'] = dict(Metadata or {})
+            copied['ContentType'] = ContentType or 'binary/octet-stream'
+            copied['ContentEncoding'] = ContentEncoding
+        self.objects[(Bucket, Key)] = copied
+        return {}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        obj = self.objects.get((Bucket, Key))
+        if obj is None:
+            self._not_found('HeadObject')
+        with open(Filename, 'wb') as file:
+            file.write(obj['Body'])
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        extra = ExtraArgs or {}
+        with open(Filename, 'rb') as file:
+            self.put_object(Bucket, Key, file.read(), ContentType=extra.get('ContentType', 'binary/octet-stream'), Metadata=extra.get('Metadata'))
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        return f"https://local-s3/{params.get('Bucket')}/{params.get('Key')}?method={ClientMethod}&expires={ExpiresIn}"
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = str(uuid.uuid4())
+        self.multipart[upload_id] = {'Bucket': Bucket, 'Key': Key, 'Parts': {}}
+        return {'UploadId': upload_id}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload = self.multipart.pop(UploadId)
+        data = b''.join(upload['Parts'].get(part['PartNumber'], b'') for part in MultipartUpload['Parts'])
+        self.put_object(Bucket, Key, data)
+        return {}
+
+
+class FakeBucket:
+    def __init__(self, s3, name):
+        self.s3 = s3
+        self.name = name
+
+    def upload_file(self, Filename, Key, ExtraArgs=None, **kwargs):
+        self.s3.upload_file(Filename, self.name, Key, ExtraArgs=ExtraArgs)
+
+
+class FakeS3Resource:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def Bucket(self, name):
+        return FakeBucket(self.s3, name)
+
+
+class FakeTextract:
+    """Replays Textract Block JSON recorded (or synthesised) per S3 key."""
+
+    def __init__(self, s3, recordings=None, polls_before_success=0):
+        self.s3 = s3
+        self.recordings = recordings or {}
+        self.polls_before_success = polls_before_success
+        self.jobs = {}
+
+    def record_text(self, key, pages):
+        # pages is a list of lists of lines, stored as LINE blocks the way Textract returns them
+        blocks = []
+        for page_number, lines in enumerate(pages, start=1):
+            blocks.append({'BlockType': 'PAGE', 'Page': page_number, 'Id': str(uuid.uuid4())})
+            for line in lines:
+                blocks.append({'BlockType': 'LINE', 'Page': page_number, 'Text': line, 'Id': str(uuid.uuid4())})
+        self.recordings[key] = blocks
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes=None, **kwargs):
+        key = DocumentLocation['S3Object']['Name']
+        if key in self.recordings:
+            blocks = self.recordings[key]
+        else:
+            blocks = self.recordings.get(self._recording_key(key), [])
+            shard = re.search(r"pages-(\d+)-(\d+)\.pdf$", key)
+            if shard:
+                # a page-range shard only sees its own pages, numbered from 1 like a separate document
+                first, last = int(shard.group(1)), int(shard.group(2))
+                blocks = [dict(block, Page=block['Page'] - first + 1) for block in blocks if first <= block['Page'] <= last]
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = {'Blocks': blocks, 'Polls': 0}
+        return {'JobId': job_id}
+
+    def _recording_key(self, key):
+        # shards and reprocessed copies share the recording of their source document
+        for recorded_key in self.recordings:
+            if pathlib_stem(recorded_key) in key:
+                return recorded_key
+        return key
+
+    def get_document_analysis(self, JobId, NextToken=None, **kwargs):
+        job = self.jobs[JobId]
+        if NextToken is None and job['Polls'] < self.polls_before_success:
+            job['Polls'] += 1
+            return {'JobStatus': 'IN_PROGRESS', 'Blocks': []}
+        start = int(NextToken or 0)
+        end = start + TEXTRACT_PAGE_SIZE
+        response = {'JobStatus': 'SUCCEEDED', 'Blocks': job['Blocks'][start:end]}
+        if end < len(job['Blocks']):
+            response['NextToken'] = str(end)
+        return response
+
+
+def pathlib_stem(key):
+    return key.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+
+
+class AttrDict(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def fake_embedding(text):
+    # deterministic bag-of-words hashing so similar texts land near each other
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for token in re.findall(r'\w+', text.lower()):
+        digest = hashlib.md5(token.encode('utf-8')).digest()
+        index = int.from_bytes(digest[:4], 'little') % EMBEDDING_DIMENSIONS
+        vector[index] += 1.0 if digest[4] % 2 == 0 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def make_openai_module(stats):
+    openai = types.ModuleType('openai')
+    openai.api_key = None
+
+    class Embedding:
+        @staticmethod
+        def create(input, model, **kwargs):
+            inputs = input if isinstance(input, list) else [input]
+            stats['requests'] += 1
+            stats['inputs'] += len(inputs)
+            tokens = sum(len(text.split()) for text in inputs)
+            stats['tokens'] += tokens
+            return AttrDict({
+                'data': [AttrDict({'index': i, 'embedding': fake_embedding(text)}) for i, text in enumerate(inputs)],
+                'model': model,
+                'usage': AttrDict({'prompt_tokens': tokens, 'total_tokens': tokens})
+            })
+
+    openai.Embedding = Embedding
+    openai.error = types.SimpleNamespace(RateLimitError=type('RateLimitError', (Exception,), {}),
+                                         APIError=type('APIError', (Exception,), {}),
+                                         Timeout=type('Timeout', (Exception,), {}),
+                                         ServiceUnavailableError=type('ServiceUnavailableError', (Exception,), {}),
+                                         APIConnectionError=type('APIConnectionError', (Exception,), {}))
+    return openai
+
+
+# ---------------------------------------------------------------- MySQL (datatier) shim
+
+MYSQL_SCHEMA = """
+CREATE TABLE users (
+    userid INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    pwdhash TEXT NOT NULL
+);
+CREATE TABLE documents (
+    doc_id TEXT PRIMARY KEY,
+    userid INTEGER,
+    original_bucket_key TEXT,
+    processed_bucket_key TEXT,
+    extracted_text_bucket_key TEXT,
+    status TEXT NOT NULL,
+    upload_date timestamp DEFAULT CURRENT_TIMESTAMP,
+    processed_date timestamp,
+    extraction_date timestamp,
+    failed_stage TEXT,
+    last_error TEXT,
+    process_attempts INTEGER NOT NULL DEFAULT 0,
+    extract_attempts INTEGER NOT NULL DEFAULT 0,
+    preview_pages INTEGER,
+    updated_at timestamp DEFAULT (strftime('%Y-%m-%d %H:%M:%f000', 'now'))
+);
+-- stands in for ON UPDATE CURRENT_TIMESTAMP(6)
+CREATE TRIGGER documents_updated_at AFTER UPDATE ON documents
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE documents SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now') WHERE doc_id = NEW.doc_id;
+END;
+"""
+
+
+def translate_mysql(sql):
+    sql = re.sub(r"NOW\(\)\s*-\s*INTERVAL\s+%s\s+SECOND", "datetime('now', '-' || %s || ' seconds')", sql)
+    sql = re.sub(r"\bIF\(", "IIF(", sql)
+    sql = sql.replace('NOW()', "datetime('now')")
+    return sql.replace('%s', '?')
+
+
+def make_datatier_module(db_path):
+    datatier = types.ModuleType('datatier')
+
+    def get_dbConn(endpoint, portnum, username, pwd, dbname):
+        conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, isolation_level=None)
+        return conn
+
+    def retrieve_one_row(dbConn, sql, parameters=[]):
+        return dbConn.execute(translate_mysql(sql), list(parameters)).fetchone()
+
+    def retrieve_all_rows(dbConn, sql, parameters=[]):
+        return dbConn.execute(translate_mysql(sql), list(parameters)).fetchall()
+
+    def perform_action(dbConn, sql, parameters=[]):
+        return dbConn.execute(translate_mysql(sql), list(parameters)).rowcount
+
+    def perform_many(dbConn, sql, rows):
+        if not rows:
+            return 0
+        return dbConn.executemany(translate_mysql(sql), [list(row) for row in rows]).rowcount
+
+    def stream_rows(dbConn, sql, parameters=[], batch_size=500):
+        cursor = dbConn.execute(translate_mysql(sql), list(parameters))
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    @contextlib.contextmanager
+    def transaction(dbConn):
+        dbConn.execute("BEGIN")
+        try:
+            yield dbConn
+            dbConn.execute("COMMIT")
+        except Exception:
+            dbConn.execute("ROLLBACK")
+            raise
+
+    datatier.get_dbConn = get_dbConn
+    datatier.retrieve_one_row = retrieve_one_row
+    datatier.retrieve_all_rows = retrieve_all_rows
+    datatier.perform_action = perform_action
+    datatier.perform_many = perform_many
+    datatier.stream_rows = stream_rows
+    datatier.transaction = transaction
+    return datatier
+
+
+def init_mysql(db_path, users):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(MYSQL_SCHEMA)
+    conn.executemany("INSERT INTO users (userid, username, pwdhash) VALUES (?, ?, ?)", users)
+    conn.commit()
+    conn.close()
+
+
+# ---------------------------------------------------------------- Postgres (psycopg + pgvector) fake
+
+POSTGRES_SCHEMA = """
+CREATE TABLE document_embeddings (
+    doc_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    processeddatafile TEXT,
+    extractedtextpath TEXT,
+    upload_date timestamp DEFAULT CURRENT_TIMESTAMP,
+    model_version TEXT NOT NULL DEFAULT 'text-embedding-ada-002',
+    embedding TEXT
+);
+CREATE TABLE embedding_models (
+    model_version TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'backfilling',
+    created_at timestamp DEFAULT CURRENT_TIMESTAMP,
+    activated_at timestamp
+);
+INSERT INTO embedding_models (model_version, status, activated_at) VALUES ('text-embedding-ada-002', 'active', CURRENT_TIMESTAMP);
+CREATE TABLE document_embedding_versions (
+    doc_id TEXT NOT NULL,
+    model_version TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    embedding TEXT NOT NULL,
+    created_at timestamp DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (doc_id, model_version)
+);
+CREATE TABLE user_corpus_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at timestamp DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE document_groups (
+    group_id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    user_id TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    description TEXT,
+    created_at timestamp DEFAULT CURRENT_TIMESTAMP,
+    updated_at timestamp DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id, group_name)
+);
+CREATE TABLE document_group_assignments (
+    assignment_id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+    doc_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    assigned_at timestamp DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(doc_id, group_id)
+);
+"""
+
+
+def _vector(value):
+    if value is None:
+        return None
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def l2_distance(a, b):
+    a, b = _vector(a), _vector(b)
+    if a is None or b is None:
+        return None
+    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+def cosine_distance(a, b):
+    a, b = _vector(a), _vector(b)
+    if a is None or b is None:
+        return None
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b)) or 1.0
+    return 1 - dot / norm
+
+
+def inner_product(a, b):
+    a, b = _vector(a), _vector(b)
+    if a is None or b is None:
+        return None
+    return -sum(x * y for x, y in zip(a, b))
+
+
+def translate_postgres(sql):
+    sql = re.sub(r"([\w.]+|\?|%s(?:::\w+)?)\s*<->\s*(%s::\w+|[\w.]+)", r"l2_distance(\1, \2)", sql)
+    sql = re.sub(r"([\w.]+|%s(?:::\w+)?)\s*<=>\s*(%s::\w+|[\w.]+)", r"cosine_distance(\1, \2)", sql)
+    sql = re.sub(r"([\w.]+|%s(?:::\w+)?)\s*<#>\s*(%s::\w+|[\w.]+)", r"inner_product(\1, \2)", sql)
+    sql = re.sub(r"::\w+(\[\])?", "", sql)
+    sql = sql.replace('gen_random_uuid()', "lower(hex(randomblob(16)))")
+    sql = re.sub(r"\bNOW\(\)", "CURRENT_TIMESTAMP", sql)
+    # SQLite reads ON CONFLICT right after INSERT ... SELECT ... FROM as a join constraint
+    sql = re.sub(r"(FROM\s+\([^()]*\)\s+src)\s+ON CONFLICT", r"\1 WHERE true ON CONFLICT", sql)
+    return sql.replace('%s', '?')
+
+
+def _adapt(value):
+    if isinstance(value, (list, tuple)):
+        return json.dumps(list(value))
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+class UniqueViolation(Exception):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._cursor = conn._db.cursor()
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        return False
+
+    def execute(self, sql, params=()):
+        try:
+            self._cursor.execute(translate_postgres(sql), [_adapt(p) for p in params])
+        except sqlite3.IntegrityError as e:
+            raise UniqueViolation(str(e))
+        self.rowcount = self._cursor.rowcount
+        return self
+
+    def executemany(self, sql, params_seq):
+        translated = translate_postgres(sql)
+        try:
+            self._cursor.executemany(translated, [[_adapt(p) for p in params] for params in params_seq])
+        except sqlite3.IntegrityError as e:
+            raise UniqueViolation(str(e))
+        self.rowcount = self._cursor.rowcount
+        return self
+
+    def _row(self, row):
+        if row is None:
+            return None
+        if self.conn.row_factory is None:
+            return tuple(row)
+        return {description[0]: row[i] for i, description in enumerate(self._cursor.description)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+
+class FakePgConnection:
+    def __init__(self, db_path, row_factory=None, autocommit=False):
+        self._db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, isolation_level=None if autocommit else 'DEFERRED')
+        self._db.create_function('l2_distance', 2, l2_distance, deterministic=True)
+        self._db.create_function('cosine_distance', 2, cosine_distance, deterministic=True)
+        self._db.create_function('inner_product', 2, inner_product, deterministic=True)
+        self.row_factory = row_factory
+        self.autocommit = autocommit
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def execute(self, sql, params=()):
+        cur = self.cursor()
+        return cur.execute(sql, params)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self._db.execute("BEGIN")
+        try:
+            yield self
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.commit()
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.rollback()
+
+    def close(self):
+        self._db.close()
+
+
+def make_psycopg_modules(db_path):
+    psycopg = types.ModuleType('psycopg')
+    rows = types.ModuleType('psycopg.rows')
+    errors = types.ModuleType('psycopg.errors')
+
+    rows.dict_row = 'dict_row'
+    errors.UniqueViolation = UniqueViolation
+
+    def connect(conninfo='', row_factory=None, autocommit=False, **kwargs):
+        return FakePgConnection(db_path, row_factory=row_factory, autocommit=autocommit)
+
+    psycopg.connect = connect
+    psycopg.rows = rows
+    psycopg.errors = errors
+    return {'psycopg': psycopg, 'psycopg.rows': rows, 'psycopg.errors': errors}
+
+
+def init_postgres(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(POSTGRES_SCHEMA)
+    conn.commit()
+    conn.close()
+
+
+# ---------------------------------------------------------------- wiring
+
+class StandIns:
+    """Installs the local stand-ins into sys.modules and boto3 for the duration of a run."""
+
+    def __init__(self, workdir, users, real_postgres=False, textract_polls=0):
+        self.workdir = workdir
+        self.users = users
+        self.real_postgres = real_postgres
+        self.s3 = FakeS3()
+        self.textract = FakeTextract(self.s3, polls_before_success=textract_polls)
+        self.openai_stats = {'requests': 0, 'inputs': 0, 'tokens': 0}
+        self.mysql_path = f"{workdir}/mysql.sqlite"
+        self.postgres_path = f"{workdir}/postgres.sqlite"
+        self._saved_modules = {}
+        self._saved_boto3 = {}
+
+    def _install_module(self, name, module):
+        self._saved_modules[name] = sys.modules.get(name)
+        sys.modules[name] = module
+
+    def __enter__(self):
+        import boto3
+
+        init_mysql(self.mysql_path, self.users)
+        self._install_module('datatier', make_datatier_module(self.mysql_path))
+        self._install_module('openai', make_openai_module(self.openai_stats))
+        if not self.real_postgres:
+            init_postgres(self.postgres_path)
+            for name, module in make_psycopg_modules(self.postgres_path).items():
+                self._install_module(name, module)
+
+        clients = {'s3': self.s3, 'textract': self.textract}
+        self._saved_boto3 = {
+            'client': boto3.client,
+            'resource': boto3.resource,
+            'setup_default_session': boto3.setup_default_session
+        }
+        boto3.client = lambda service, *args, **kwargs: clients[service]
+        boto3.resource = lambda service, *args, **kwargs: FakeS3Resource(self.s3)
+        boto3.setup_default_session = lambda *args, **kwargs: None
+        return self
+
+    def __exit__(self, *exc):
+        import boto3
+
+        for name, module in self._saved_boto3.items():
+            setattr(boto3, name, module)
+        for name, module in self._saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        return False
@@ -0,0 +1,222 @@
+import json
+import pathlib
+import re
+from collections import Counter
+import coldstart
+import tracing
+
+np = coldstart.lazy_import('numpy')
+
+# documents without a cluster needed before new clusters are formed from them
+MIN_DOCUMENTS = 6
+MIN_CLUSTER_SIZE = 2
+MAX_CLUSTERS = 20
+MAX_POOL = 500
+# unclustered documents that must arrive after a clustering pass before the pool is clustered again
+REGROW_DOCUMENTS = 6
+# cosine distance beyond which a document is left unassigned rather than stretching a cluster
+ASSIGN_MAX_DISTANCE = 0.25
+# k is a rough guess, so centres closer than this are merged back together
+MERGE_DISTANCE = 0.1
+BATCH_SIZE = 64
+ITERATIONS = 50
+
+UUID_REGEX = re.compile(r'-?[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+def to_array(value):
+    # pgvector comes back as text ("[0.1,0.2,...]") unless an adapter is registered
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def choose_k(n):
+    return max(1, min(MAX_CLUSTERS, int(round(np.sqrt(n / 2)))))
+
+def kmeans_plus_plus(X, k, rng):
+    centroids = [X[rng.integers(len(X))]]
+    closest = 1 - X @ centroids[0]
+    for _ in range(1, k):
+        weights = np.maximum(closest, 0) ** 2
+        total = weights.sum()
+        index = rng.choice(len(X), p=weights / total) if total > 0 else rng.integers(len(X))
+        centroids.append(X[index])
+        closest = np.minimum(closest, 1 - X @ X[index])
+    return np.vstack(centroids)
+
+def minibatch_kmeans(X, k, batch_size=BATCH_SIZE, iterations=ITERATIONS, seed=0):
+    # spherical mini-batch k-means (Sculley 2010) on unit vectors; returns (centroids, labels)
+    X = normalize(np.asarray(X, dtype=np.float32))
+    rng = np.random.default_rng(seed)
+    k = min(k, len(X))
+    centroids = kmeans_plus_plus(X, k, rng)
+    counts = np.zeros(k)
+
+    for _ in range(iterations):
+        batch = X[rng.choice(len(X), size=min(batch_size, len(X)), replace=False)]
+        labels = np.argmax(batch @ centroids.T, axis=1)
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        counts += batch_counts
+        updated = batch_counts > 0
+        # per-centre learning rate 1/count, applied to the whole mini-batch at once
+        centroids[updated] += (sums[updated] - batch_counts[updated, None] * centroids[updated]) / counts[updated, None]
+        centroids = normalize(centroids)
+
+    labels = np.argmax(X @ centroids.T, axis=1)
+    return centroids, labels
+
+def merge_close(X, centroids, labels, max_distance=MERGE_DISTANCE):
+    centroids = centroids.copy()
+    alive = list(range(len(centroids)))
+    while len(alive) > 1:
+        similarities = centroids[alive] @ centroids[alive].T
+        np.fill_diagonal(similarities, -1)
+        i, j = np.unravel_index(np.argmax(similarities), similarities.shape)
+        if 1 - similarities[i, j] > max_distance:
+            break
+        keep, drop = alive[i], alive[j]
+        labels = np.where(labels == drop, keep, labels)
+        centroids[keep] = normalize(X[labels == keep].mean(axis=0))
+        alive.remove(drop)
+    return centroids, labels
+
+def make_label(paths, index):
+    # the words most member filenames share, e.g. "Invoice" or "Lecture / Thermodynamics"
+    counts = Counter()
+    for path in paths:
+        stem = UUID_REGEX.sub('', pathlib.Path(path or '').stem)
+        counts.update({word for word in re.findall(r"[a-zA-Z]{3,}", stem.lower())})
+    common = [word for word, count in counts.most_common(2) if count * 2 >= len(paths)]
+    if common:
+        return " / ".join(word.title() for word in common)
+    return f"Suggested group {index + 1}"
+
+def grown_pool(cur, user_id):
+    # the number of unclustered documents if enough arrived since the last pass to run k-means again, else None;
+    # the remainder of the last pass is stored per user, and lowered when documents leave the pool some other way
+    with tracing.span('psycopg.execute', query='unclustered_count'):
+        cur.execute("""
+            SELECT COUNT(*) AS unclustered
+            FROM document_embeddings e
+            LEFT JOIN document_cluster_members m ON m.doc_id = e.doc_id
+            WHERE e.user_id = %s AND m.doc_id IS NULL
+        """, (user_id,))
+        unclustered = cur.fetchone()['unclustered']
+        cur.execute("SELECT unclustered FROM document_cluster_runs WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+    if unclustered < MIN_DOCUMENTS:
+        return None
+    if row is None or unclustered >= row['unclustered'] + REGROW_DOCUMENTS:
+        return unclustered
+    if unclustered < row['unclustered']:
+        cur.execute("UPDATE document_cluster_runs SET unclustered = %s WHERE user_id = %s", (unclustered, user_id))
+    return None
+
+def record_run(cur, user_id, unclustered):
+    cur.execute("""
+        INSERT INTO document_cluster_runs (user_id, unclustered)
+        VALUES (%s, %s)
+        ON CONFLICT (user_id) DO UPDATE
+            SET unclustered = EXCLUDED.unclustered, updated_at = NOW()
+    """, (user_id, unclustered))
+
+def form_clusters(cur, user_id, unclustered=None):
+    # clusters only the user's unassigned documents, so existing clusters are never recomputed
+    with tracing.span('psycopg.execute', query='unclustered_documents'):
+        cur.execute("""
+            SELECT e.doc_id, e.embedding::text AS embedding, e.processeddatafile
+            FROM document_embeddings e
+            LEFT JOIN document_cluster_members m ON m.doc_id = e.doc_id
+            WHERE e.user_id = %s AND m.doc_id IS NULL
+            ORDER BY e.doc_id
+            LIMIT %s
+        """, (user_id, MAX_POOL))
+        pool = cur.fetchall()
+
+    # the pool is capped at MAX_POOL; the stored remainder counts every unclustered document
+    unclustered = len(pool) if unclustered is None else unclustered
+    if len(pool) < MIN_DOCUMENTS:
+        record_run(cur, user_id, unclustered)
+        return []
+
+    with tracing.span('clustering.minibatch_kmeans', documents=len(pool)):
+        X = normalize(np.vstack([to_array(row['embedding']) for row in pool]))
+        centroids, labels = minibatch_kmeans(X, choose_k(len(pool)))
+        centroids, labels = merge_close(X, centroids, labels)
+        distances = 1 - np.einsum('ij,ij->i', X, centroids[labels])
+
+    created, clustered = [], 0
+    for cluster in range(len(centroids)):
+        members = [i for i in np.flatnonzero(labels == cluster) if distances[i] <= ASSIGN_MAX_DISTANCE]
+        if len(members) < MIN_CLUSTER_SIZE:
+            continue
+        centroid = normalize(X[members].mean(axis=0))
+        label = make_label([pool[i]['processeddatafile'] for i in members], len(created))
+        with tracing.span('psycopg.execute', query='create_cluster'):
+            cur.execute("""
+                INSERT INTO document_clusters (user_id, centroid, member_count, label)
+                VALUES (%s, %s::vector, %s, %s)
+                RETURNING cluster_id
+            """, (user_id, centroid.tolist(), len(members), label))
+            cluster_id = cur.fetchone()['cluster_id']
+            cur.executemany("""
+                INSERT INTO document_cluster_members (doc_id, cluster_id, distance)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (doc_id) DO NOTHING
+            """, [(pool[i]['doc_id'], cluster_id, float(distances[i])) for i in members])
+        created.append(cluster_id)
+        clustered += len(members)
+    record_run(cur, user_id, unclustered - clustered)
+    return created
+
+def assign_document(conn, user_id, doc_id, embedding):
+    # nearest existing cluster (moving its centroid incrementally), else a chance to form new clusters
+    x = normalize(to_array(embedding))
+    with conn.transaction(), conn.cursor() as cur:
+        with tracing.span('psycopg.execute', query='load_clusters'):
+            cur.execute("""
+                UPDATE document_clusters c
+                SET member_count = c.member_count - 1, updated_at = NOW()
+                FROM document_cluster_members m
+                WHERE m.doc_id = %s AND c.cluster_id = m.cluster_id
+            """, (doc_id,))
+            cur.execute("DELETE FROM document_cluster_members WHERE doc_id = %s", (doc_id,))
+            cur.execute("""
+                SELECT cluster_id, centroid::text AS centroid, member_count
+                FROM document_clusters
+                WHERE user_id = %s
+                FOR UPDATE
+            """, (user_id,))
+            clusters = cur.fetchall()
+
+        if clusters:
+            centroids = normalize(np.vstack([to_array(row['centroid']) for row in clusters]))
+            similarities = centroids @ x
+            best = int(np.argmax(similarities))
+            distance = 1 - float(similarities[best])
+            if distance <= ASSIGN_MAX_DISTANCE:
+                cluster = clusters[best]
+                count = max(cluster['member_count'], 0)
+                centroid = normalize(centroids[best] * count + x)
+                with tracing.span('psycopg.execute', query='assign_cluster'):
+                    cur.execute("""
+                        UPDATE document_clusters
+                        SET centroid = %s::vector, member_count = member_count + 1, updated_at = NOW()
+                        WHERE cluster_id = %s
+                    """, (centroid.tolist(), cluster['cluster_id']))
+                    cur.execute("""
+                        INSERT INTO document_cluster_members (doc_id, cluster_id, distance)
+                        VALUES (%s, %s, %s)
+                    """, (doc_id, cluster['cluster_id'], distance))
+                return {'cluster_id': str(cluster['cluster_id']), 'created': []}
+
+        unclustered = grown_pool(cur, user_id)
+        if unclustered is None:
+            return {'cluster_id': None, 'created': []}
+        created = form_clusters(cur, user_id, unclustered)
+        return {'cluster_id': None, 'created': [str(cluster_id) for cluster_id in created]}
@@ -0,0 +1,57 @@
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+from configparser import ConfigParser
+
+CONFIG_FILE = 'organa-config.ini'
+
+_configs = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    # stands in for a heavy module (boto3, fitz, PIL, numpy, openai, psycopg) until the first
+    # attribute access, so early-return paths never pay for importing it
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        module = object.__getattribute__(self, '_module')
+        if module is None:
+            with _lock:
+                module = object.__getattribute__(self, '_module')
+                if module is None:
+                    module = importlib.import_module(object.__getattribute__(self, '_name'))
+                    object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if object.__getattribute__(self, '_module') is not None else 'not loaded'
+        return f"<lazy module '{object.__getattribute__(self, '_name')}' ({state})>"
+
+
+def lazy_import(name):
+    # a missing layer still fails at init, only the import itself is deferred
+    if name not in sys.modules and importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return LazyModule(name)
+
+
+def load_config(config_file=CONFIG_FILE):
+    # parsed on the first invocation of a container and reused by every warm invocation after it
+    path = os.path.abspath(config_file)
+    configur = _configs.get(path)
+    if configur is None:
+        configur = ConfigParser()
+        if configur.read(config_file):
+            _configs[path] = configur
+    return configur
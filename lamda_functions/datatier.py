@@ -0,0 +1,149 @@
+import random
+import time
+from contextlib import contextmanager
+import coldstart
+import tracing
+
+pymysql = coldstart.lazy_import('pymysql')
+
+CONNECT_TIMEOUT = 5
+# a cached connection idle for longer than this is pinged before reuse
+HEALTH_CHECK_IDLE_SECONDS = 30
+
+MAX_ATTEMPTS = 3
+BASE_DELAY = 0.05
+MAX_DELAY = 1.0
+
+STREAM_BATCH_SIZE = 500
+
+# errors where the statement is known not to have run: safe to retry reads and writes alike
+RETRY_ALWAYS = {
+    1205,  # lock wait timeout (statement rolled back)
+    1213,  # deadlock (transaction rolled back)
+    2003,  # can't connect
+    2006,  # server has gone away
+}
+# the connection dropped mid-statement, so a write may or may not have been applied
+RETRY_READS = RETRY_ALWAYS | {2013}
+
+# one connection per container, reused by warm invocations
+_connections = {}
+
+
+def get_dbConn(endpoint, portnum, username, pwd, dbname):
+    key = (endpoint, portnum, username, dbname)
+    cached = _connections.get(key)
+    if cached is not None and cached.open:
+        if time.monotonic() - cached.last_used > HEALTH_CHECK_IDLE_SECONDS:
+            try:
+                with tracing.span('datatier.ping'):
+                    cached.ping(reconnect=True)
+            except Exception as err:
+                print(f"Discarding unhealthy connection: {str(err)}")
+                cached = None
+        if cached is not None:
+            cached.last_used = time.monotonic()
+            return cached
+
+    dbConn = _retry(lambda: pymysql.connect(
+        host=endpoint,
+        port=portnum,
+        user=username,
+        passwd=pwd,
+        database=dbname,
+        connect_timeout=CONNECT_TIMEOUT,
+        # each statement commits on the server; no separate COMMIT round trip outside transaction()
+        autocommit=True
+    ), RETRY_ALWAYS)
+    dbConn.last_used = time.monotonic()
+    dbConn.in_transaction = False
+    _connections[key] = dbConn
+    return dbConn
+
+
+def _error_code(err):
+    return err.args[0] if err.args and isinstance(err.args[0], int) else None
+
+
+def _retry(operation, retryable, dbConn=None):
+    # full-jitter exponential backoff; inside a transaction nothing is retried, since the earlier statements are gone
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return operation()
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError) as err:
+            in_transaction = dbConn is not None and getattr(dbConn, 'in_transaction', False)
+            if attempt == MAX_ATTEMPTS or in_transaction or _error_code(err) not in retryable:
+                raise
+            delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+            print(f"Transient MySQL error {_error_code(err)}, retrying in {delay * 1000:.0f} ms (attempt {attempt})")
+            time.sleep(delay)
+            if dbConn is not None:
+                dbConn.ping(reconnect=True)
+
+
+def _execute(dbConn, sql, parameters, fetch, retryable, many=False):
+    def run():
+        dbCursor = dbConn.cursor()
+        try:
+            if many:
+                dbCursor.executemany(sql, parameters)
+            else:
+                dbCursor.execute(sql, parameters)
+            return fetch(dbCursor)
+        finally:
+            dbCursor.close()
+
+    dbConn.last_used = time.monotonic()
+    return _retry(run, retryable, dbConn)
+
+
+def retrieve_one_row(dbConn, sql, parameters=[]):
+    return _execute(dbConn, sql, parameters, lambda cursor: cursor.fetchone(), RETRY_READS)
+
+
+def retrieve_all_rows(dbConn, sql, parameters=[]):
+    return _execute(dbConn, sql, parameters, lambda cursor: cursor.fetchall(), RETRY_READS)
+
+
+def perform_action(dbConn, sql, parameters=[]):
+    return _execute(dbConn, sql, parameters, lambda cursor: cursor.rowcount, RETRY_ALWAYS)
+
+
+def perform_many(dbConn, sql, rows):
+    # PyMySQL folds INSERT ... VALUES (...) into multi-row INSERTs, one round trip per max_allowed_packet
+    if not rows:
+        return 0
+    return _execute(dbConn, sql, rows, lambda cursor: cursor.rowcount, RETRY_ALWAYS, many=True)
+
+
+def stream_rows(dbConn, sql, parameters=[], batch_size=STREAM_BATCH_SIZE):
+    # unbuffered cursor: rows are read off the socket as they are consumed, so memory stays flat;
+    # the connection cannot run other statements until the generator is exhausted or closed
+    dbConn.last_used = time.monotonic()
+    dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
+    try:
+        _retry(lambda: dbCursor.execute(sql, parameters), RETRY_ALWAYS, dbConn)
+        while True:
+            rows = dbCursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        dbCursor.close()
+
+
+@contextmanager
+def transaction(dbConn):
+    # statements inside commit together; PyMySQL interpolates parameters client-side, so each
+    # statement is still one round trip, but there is a single COMMIT instead of one per statement
+    dbConn.last_used = time.monotonic()
+    _retry(dbConn.begin, RETRY_ALWAYS)
+    dbConn.in_transaction = True
+    try:
+        yield dbConn
+        dbConn.commit()
+    except Exception:
+        dbConn.rollback()
+        raise
+    finally:
+        dbConn.in_transaction = False
@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import coldstart
+import tracing
+
+openai = coldstart.lazy_import('openai')
+
+DEFAULT_REQUESTS_PER_MINUTE = 3000
+DEFAULT_TOKENS_PER_MINUTE = 1000000
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 5
+
+# the API accepts up to 2048 inputs per request; small texts are packed until either limit is hit
+MAX_BATCH_INPUTS = 256
+MAX_BATCH_TOKENS = 100000
+
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+
+RETRYABLE_ERRORS = ['RateLimitError', 'APIError', 'Timeout', 'ServiceUnavailableError', 'APIConnectionError']
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; only used for budgeting, usage comes from the response
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    # refills continuously at capacity per minute; a request larger than the bucket waits for a full one
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float) -> float:
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                delay = (amount - self.available) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds: float):
+        # after a 429 nobody in this container should send until the server's retry-after has passed
+        with self.lock:
+            self.available = min(self.available, -seconds * self.rate)
+
+
+class EmbeddingClient:
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        # vectors come back in input order whatever order the batched requests finish in
+        if not texts:
+            return []
+        batches = self.plan_batches(texts)
+        results = [None] * len(texts)
+        with tracing.span('openai.embed', inputs=len(texts), requests=len(batches), model=model):
+            if len(batches) == 1:
+                completed = [self.request(texts, batches[0], model)]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                    completed = list(executor.map(tracing.bind(lambda batch: self.request(texts, batch, model)), batches))
+        for batch, embeddings in zip(batches, completed):
+            for index, embedding in zip(batch, embeddings):
+                results[index] = embedding
+        return results
+
+    def embed_one(self, text: str, model: str) -> List[float]:
+        return self.embed([text], model)[0]
+
+    def plan_batches(self, texts: List[str]) -> List[List[int]]:
+        batches, current, current_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= MAX_BATCH_INPUTS or current_tokens + tokens > MAX_BATCH_TOKENS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        batches.append(current)
+        return batches
+
+    def request(self, texts: List[str], batch: List[int], model: str) -> List[List[float]]:
+        inputs = [texts[index] for index in batch]
+        estimated = sum(estimate_tokens(text) for text in inputs)
+        retryable = tuple(getattr(openai.error, name) for name in RETRYABLE_ERRORS)
+
+        for attempt in range(self.max_retries + 1):
+            queue_wait = self.requests.acquire(1) + self.tokens.acquire(estimated)
+            try:
+                with tracing.span('openai.Embedding.create', inputs=len(inputs), input_chars=sum(len(text) for text in inputs), model=model, attempt=attempt + 1):
+                    response = openai.Embedding.create(
+                        input=inputs,
+                        model=model,
+                        request_timeout=self.timeout
+                    )
+            except retryable as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay(e, attempt)
+                if type(e).__name__ == 'RateLimitError':
+                    self.requests.penalize(delay)
+                tracing.emit({'Retries': (1, 'Count'), 'RetryDelay': (round(delay * 1000, 3), 'Milliseconds')},
+                             {'span': 'openai.retry', 'model': model, 'error': type(e).__name__})
+                print(f"OpenAI {type(e).__name__}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+                continue
+
+            usage = response.get('usage') or {}
+            tracing.emit({
+                'QueueWait': (round(queue_wait * 1000, 3), 'Milliseconds'),
+                'Tokens': (usage.get('total_tokens', estimated), 'Count'),
+                'Inputs': (len(inputs), 'Count')
+            }, {'span': 'openai.usage', 'model': model})
+            data = sorted(response['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in data]
+
+    def retry_delay(self, error, attempt: int) -> float:
+        headers = getattr(error, 'headers', None) or {}
+        for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+            value = headers.get(name) or headers.get(name.title())
+            if value is not None:
+                try:
+                    return min(MAX_DELAY, float(value) * scale)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+# one client per container, so warm invocations share their budget
+_clients = {}
+
+
+def get_client(configur, section='openai', requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+    # background jobs read their own section with a smaller default share of the account limits
+    settings = (
+        configur.getint(section, 'requests_per_minute', fallback=requests_per_minute),
+        configur.getint(section, 'tokens_per_minute', fallback=tokens_per_minute),
+        configur.getint(section, 'max_concurrency', fallback=DEFAULT_MAX_CONCURRENCY),
+        configur.getint(section, 'timeout', fallback=DEFAULT_TIMEOUT),
+        configur.getint(section, 'max_retries', fallback=DEFAULT_MAX_RETRIES)
+    )
+    if settings not in _clients:
+        _clients[settings] = EmbeddingClient(*settings)
+    return _clients[settings]
@@ -0,0 +1,108 @@
+import time
+import quantization
+import searchcache
+import tracing
+
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_SECONDS = 5.0
+
+# below this many rows executemany (pipelined by psycopg 3) beats creating and filling a staging table
+COPY_MIN_ROWS = 200
+
+FIELDS = ['doc_id', 'user_id', 'processeddatafile', 'extractedtextpath', 'model_version']
+
+STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS embedding_staging (
+        doc_id UUID,
+        user_id VARCHAR(64),
+        processeddatafile VARCHAR(256),
+        extractedtextpath VARCHAR(256),
+        model_version VARCHAR(64),
+        v VECTOR({quantization.DIMENSIONS})
+    ) ON COMMIT DELETE ROWS
+"""
+
+def upsert_sql(columns, staged=False):
+    # the vector is sent once and every stored representation is derived from it in SQL;
+    # a retried batch overwrites its own rows instead of failing on the key
+    names = ''.join(f", {quantization.COLUMNS[column][0]}" for column in columns)
+    values = ''.join(f", {quantization.COLUMNS[column][1]}" for column in columns)
+    updates = ''.join(f", {quantization.COLUMNS[column][0]} = EXCLUDED.{quantization.COLUMNS[column][0]}" for column in columns)
+    if staged:
+        selected, source = ', '.join(f"src.{field}" for field in FIELDS), "embedding_staging src"
+    else:
+        selected, source = ', '.join(['%s'] * len(FIELDS)), "(SELECT %s::vector AS v) src"
+    return f"""
+    INSERT INTO document_embeddings
+    ({', '.join(FIELDS)}, embedding{names})
+    SELECT {selected}, src.v{values}
+    FROM {source}
+    ON CONFLICT (doc_id) DO UPDATE
+        SET user_id = EXCLUDED.user_id,
+            processeddatafile = EXCLUDED.processeddatafile,
+            extractedtextpath = EXCLUDED.extractedtextpath,
+            model_version = EXCLUDED.model_version,
+            embedding = EXCLUDED.embedding{updates}
+    """
+
+def vector_literal(embedding):
+    return '[' + ','.join(str(float(value)) for value in embedding) + ']'
+
+class EmbeddingWriter:
+    # buffers rows for document_embeddings and writes each buffer in one transaction
+    def __init__(self, conn, quantized_columns=(), max_rows=DEFAULT_MAX_ROWS, max_seconds=DEFAULT_MAX_SECONDS):
+        self.conn = conn
+        self.quantized_columns = list(quantized_columns)
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        # keyed by doc_id: one statement cannot upsert the same row twice, so a repeat replaces the buffered row
+        self.rows = {}
+        self.first_added = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    def add(self, doc_id, user_id, processed_bucket_key, extracted_path, embedding, model_version):
+        if not self.rows:
+            self.first_added = time.monotonic()
+        self.rows[str(doc_id)] = (doc_id, user_id, processed_bucket_key, extracted_path, model_version, embedding)
+        if len(self.rows) >= self.max_rows or time.monotonic() - self.first_added >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return 0
+        rows, self.rows = list(self.rows.values()), {}
+        method = 'copy' if len(rows) >= COPY_MIN_ROWS else 'executemany'
+        with tracing.span('embeddings.flush', rows=len(rows), method=method):
+            # an explicit transaction: the connection is autocommit, so this is the batch's only COMMIT
+            with self.conn.transaction(), self.conn.cursor() as cur:
+                if method == 'copy':
+                    self.copy_rows(cur, rows)
+                else:
+                    cur.executemany(upsert_sql(self.quantized_columns), rows)
+                searchcache.bump_corpus_version(self.conn, [row[1] for row in rows])
+        print(f"Flushed {len(rows)} embeddings ({method})")
+        return len(rows)
+
+    def copy_rows(self, cur, rows):
+        # text COPY into a session-local staging table, then one set-based upsert; binary COPY of
+        # vector needs the pgvector adapters, and the vectors are only parsed once either way
+        cur.execute(STAGING_SQL)
+        with cur.copy(f"COPY embedding_staging ({', '.join(FIELDS)}, v) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row[:-1] + (vector_literal(row[-1]),))
+        cur.execute(upsert_sql(self.quantized_columns, staged=True))
+
+def get_writer(conn, configur, quantized_columns=()):
+    return EmbeddingWriter(
+        conn,
+        quantized_columns,
+        configur.getint('embeddings', 'flush_rows', fallback=DEFAULT_MAX_ROWS),
+        configur.getfloat('embeddings', 'flush_seconds', fallback=DEFAULT_MAX_SECONDS)
+    )
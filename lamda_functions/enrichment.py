@@ -0,0 +1,118 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+import datatier
+import uploads
+import textcodec
+import tracing
+
+FIELDS = ['groups', 'document', 'snippet']
+
+SNIPPET_CHARS = 240
+SNIPPET_SCAN_BYTES = 256 * 1024
+SNIPPET_WORKERS = 4
+MIN_TERM_LENGTH = 3
+
+def parse_fields(value):
+    # "groups,document", "snippet" or "all"; no value keeps the plain search response
+    if not value:
+        return set()
+    fields = {field.strip().lower() for field in value.split(',') if field.strip()}
+    if 'all' in fields:
+        return set(FIELDS)
+    unknown = fields - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+def groups_lateral(alias):
+    # one json array of {group_id, group_name} per hit, joined in the same statement as the search
+    return f"""
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object('group_id', dg.group_id, 'group_name', dg.group_name)
+                            ORDER BY dg.group_name) AS groups
+            FROM document_group_assignments a
+            JOIN document_groups dg ON dg.group_id = a.group_id
+            WHERE a.doc_id = {alias}.doc_id AND dg.user_id = %s
+        ) g ON TRUE
+    """
+
+def get_document_details(dbConn, user_id, doc_ids):
+    if not doc_ids:
+        return {}
+
+    placeholders = ', '.join(['%s'] * len(doc_ids))
+    sql = f"""
+        SELECT doc_id, original_bucket_key, upload_date, status
+        FROM documents
+        WHERE userid = %s AND doc_id IN ({placeholders});
+    """
+    with tracing.span('datatier.retrieve_all_rows', query='search_document_details', doc_ids=len(doc_ids)):
+        rows = datatier.retrieve_all_rows(dbConn, sql, [user_id] + list(doc_ids))
+
+    return {
+        str(row[0]): {
+            'title': uploads.original_filename(row[1], str(row[0])),
+            'originaldatafile': row[1],
+            'upload_date': row[2].strftime("%Y-%m-%d %H:%M:%S") if row[2] else None,
+            'status': row[3]
+        }
+        for row in rows
+    }
+
+def query_terms(query):
+    return sorted({term for term in re.findall(r"\w+", query.lower()) if len(term) >= MIN_TERM_LENGTH})
+
+def make_snippet(text, query, length=SNIPPET_CHARS):
+    terms = query_terms(query)
+    matches = []
+    if terms:
+        pattern = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\w*", re.IGNORECASE)
+        matches = [match.span() for match in pattern.finditer(text)]
+
+    start = 0
+    if matches:
+        # the window that holds the most matches, with a little context before the first of them
+        best, right = 0, 0
+        for left in range(len(matches)):
+            while right < len(matches) and matches[right][1] - matches[left][0] <= length:
+                right += 1
+            if right - left > best:
+                best, start = right - left, matches[left][0]
+        start = max(0, start - length // 4)
+        if start > 0:
+            space = text.find(' ', start, start + 20)
+            if space != -1:
+                start = space + 1
+
+    end = min(len(text), start + length)
+    if end < len(text):
+        space = text.rfind(' ', end - 20, end)
+        if space > start:
+            end = space
+
+    return {
+        'text': re.sub(r"\s", " ", text[start:end]),
+        'highlights': [[s - start, e - start] for s, e in matches if s >= start and e <= end]
+    }
+
+def read_text_prefix(s3_client, bucketname, key):
+    # the leading part of the extracted text is enough to find a passage; no need to pull whole books
+    with tracing.span('s3.get_object', purpose='snippet'):
+        response = s3_client.get_object(Bucket=bucketname, Key=key, Range=f"bytes=0-{SNIPPET_SCAN_BYTES - 1}")
+        # a compressed prefix decodes as far as it goes, which is more text than the same range uncompressed
+        return textcodec.read_text(response, max_bytes=SNIPPET_SCAN_BYTES, errors='ignore')
+
+def add_snippets(s3_client, bucketname, results, query):
+    def snippet_for(result):
+        try:
+            text = read_text_prefix(s3_client, bucketname, result['extracted_text_path'])
+        except Exception as e:
+            print(f"Could not build snippet for {result['doc_id']}: {str(e)}")
+            return None
+        return make_snippet(text, query)
+
+    with ThreadPoolExecutor(max_workers=SNIPPET_WORKERS) as executor:
+        snippets = list(executor.map(tracing.bind(snippet_for), results))
+
+    for result, snippet in zip(results, snippets):
+        result['snippet'] = snippet
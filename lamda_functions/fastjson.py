@@ -0,0 +1,21 @@
+import json
+from datetime import date, datetime
+import coldstart
+
+try:
+    orjson = coldstart.lazy_import('orjson')
+except ModuleNotFoundError:
+    # optional: the standard library encoder produces the same output, only slower
+    orjson = None
+
+def _default(obj):
+    # what orjson does natively, so both encoders agree on the wire format
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+def dumps(obj):
+    # UUIDs and datetimes (psycopg row values) are encoded in place, without copying the rows first
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    return json.dumps(obj, default=_default, separators=(',', ':'))
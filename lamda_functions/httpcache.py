@@ -0,0 +1,35 @@
+import hashlib
+import time
+
+def make_etag(*parts):
+    # weak: two responses with the same tag hold the same data, though not byte for byte
+    # (presigned URLs are signed per request)
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+def expiry_window(seconds):
+    # a body carrying URLs signed for `seconds` stays valid until the end of the window it was built in,
+    # so a tag that includes the window stops matching before any of those URLs expires
+    return int(time.time() // seconds)
+
+def request_etags(event):
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    value = headers.get('if-none-match')
+    if not value:
+        return []
+    return [tag.strip() for tag in value.split(',') if tag.strip()]
+
+def _opaque(tag):
+    # If-None-Match uses the weak comparison: W/"x" and "x" match
+    return tag[2:] if tag.startswith('W/') else tag
+
+def is_not_modified(event, etag):
+    tags = request_etags(event)
+    return '*' in tags or _opaque(etag) in {_opaque(tag) for tag in tags}
+
+def not_modified_response(etag):
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag},
+        'body': ''
+    }
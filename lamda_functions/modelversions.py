@@ -0,0 +1,189 @@
+import re
+import quantization
+import tracing
+
+DEFAULT_MODEL = 'text-embedding-ada-002'
+
+# versions end up inside index names and partial index predicates
+VERSION_REGEX = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+BACKFILL_BATCH_SQL = """
+    SELECT e.doc_id, e.user_id, e.extractedtextpath
+    FROM document_embeddings e
+    WHERE e.doc_id > %s
+      AND e.model_version <> %s
+      AND NOT EXISTS (
+          SELECT 1 FROM document_embedding_versions v
+          WHERE v.doc_id = e.doc_id AND v.model_version = %s
+      )
+    ORDER BY e.doc_id
+    LIMIT %s
+"""
+
+MISSING_SQL = """
+    SELECT COUNT(*) AS missing
+    FROM document_embeddings e
+    WHERE e.model_version <> %s
+      AND NOT EXISTS (
+          SELECT 1 FROM document_embedding_versions v
+          WHERE v.doc_id = e.doc_id AND v.model_version = %s
+      )
+"""
+
+FIRST_DOC_ID = '00000000-0000-0000-0000-000000000000'
+
+def configured_model(configur):
+    # [embeddings] model is only used until embedding_models has an active row
+    return configur.get('embeddings', 'model', fallback=DEFAULT_MODEL)
+
+def validate(version):
+    if not version or not VERSION_REGEX.match(version):
+        raise ValueError(f"Invalid model version: {version}")
+    return version
+
+def index_name(version):
+    return f"document_embeddings_{re.sub(r'[^a-z0-9]+', '_', version.lower())}_hnsw_idx"[:63]
+
+def get_versions(conn, configur):
+    # read on every invocation, so a cutover applies to the next request without a redeploy
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='embedding_model_versions'):
+        cur.execute("""
+            SELECT model_version, status
+            FROM embedding_models
+            WHERE status IN ('active', 'backfilling')
+            ORDER BY created_at
+        """)
+        rows = cur.fetchall()
+    active = [row['model_version'] for row in rows if row['status'] == 'active']
+    return {
+        'active': active[0] if active else configured_model(configur),
+        'backfilling': [row['model_version'] for row in rows if row['status'] == 'backfilling']
+    }
+
+def store_version(conn, doc_id, user_id, version, embedding):
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='store_embedding_version'):
+        cur.execute("""
+            INSERT INTO document_embedding_versions (doc_id, model_version, user_id, embedding)
+            VALUES (%s, %s, %s, %s::vector)
+            ON CONFLICT (doc_id, model_version) DO UPDATE
+                SET embedding = EXCLUDED.embedding, created_at = NOW()
+        """, (doc_id, version, user_id, embedding))
+
+def start_backfill(conn, version):
+    # registers the version and gives it an (empty) partial index on the live table before any vector lands there
+    validate(version)
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='start_backfill'):
+        cur.execute("""
+            INSERT INTO embedding_models (model_version, status)
+            VALUES (%s, 'backfilling')
+            ON CONFLICT (model_version) DO UPDATE
+                SET status = 'backfilling'
+                WHERE embedding_models.status <> 'active'
+        """, (version,))
+        cur.execute("""
+            INSERT INTO embedding_backfill_checkpoints (model_version, last_doc_id)
+            VALUES (%s, %s)
+            ON CONFLICT (model_version) DO UPDATE
+                SET last_doc_id = EXCLUDED.last_doc_id, completed_at = NULL, updated_at = NOW()
+        """, (version, FIRST_DOC_ID))
+        # CONCURRENTLY needs autocommit, which every handler connection uses
+        cur.execute(f"""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(version)}
+            ON document_embeddings USING hnsw (embedding vector_l2_ops)
+            WHERE model_version = '{version}'
+        """)
+
+def get_checkpoint(conn, version):
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='backfill_checkpoint'):
+        cur.execute("""
+            SELECT last_doc_id, embedded, failed, completed_at
+            FROM embedding_backfill_checkpoints
+            WHERE model_version = %s
+        """, (version,))
+        return cur.fetchone()
+
+def next_batch(conn, version, after_doc_id, size):
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='backfill_batch'):
+        cur.execute(BACKFILL_BATCH_SQL, (after_doc_id, version, version, size))
+        return cur.fetchall()
+
+def save_batch(conn, version, rows, last_doc_id, failed):
+    # vectors and the checkpoint commit together, so a rerun never skips or repeats a batch
+    with conn.transaction(), conn.cursor() as cur:
+        with tracing.span('psycopg.execute', query='save_backfill_batch', rows=len(rows)):
+            if rows:
+                cur.executemany("""
+                    INSERT INTO document_embedding_versions (doc_id, model_version, user_id, embedding)
+                    VALUES (%s, %s, %s, %s::vector)
+                    ON CONFLICT (doc_id, model_version) DO NOTHING
+                """, [(row['doc_id'], version, row['user_id'], row['embedding']) for row in rows])
+            cur.execute("""
+                UPDATE embedding_backfill_checkpoints
+                SET last_doc_id = %s, embedded = embedded + %s, failed = failed + %s, updated_at = NOW()
+                WHERE model_version = %s
+            """, (last_doc_id, len(rows), failed, version))
+
+def finish_backfill(conn, version):
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='finish_backfill'):
+        cur.execute("""
+            UPDATE embedding_backfill_checkpoints
+            SET completed_at = NOW(), updated_at = NOW()
+            WHERE model_version = %s
+        """, (version,))
+
+def count_missing(conn, version):
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='backfill_missing'):
+        cur.execute(MISSING_SQL, (version, version))
+        return cur.fetchone()['missing']
+
+def cutover(conn, version, quantized_columns=()):
+    # one transaction: searches see either every vector in the old space or every vector in the new one
+    validate(version)
+    extras = ''.join(f", {quantization.COLUMNS[column][0]} = {quantization.COLUMNS[column][1]}" for column in quantized_columns)
+    with conn.transaction(), conn.cursor() as cur:
+        with tracing.span('psycopg.execute', query='cutover_embeddings') as cutover_span:
+            # the outgoing vectors are kept, so cutting back over is the same operation
+            cur.execute("""
+                INSERT INTO document_embedding_versions (doc_id, model_version, user_id, embedding)
+                SELECT doc_id, model_version, user_id, embedding
+                FROM document_embeddings
+                WHERE model_version <> %s
+                ON CONFLICT (doc_id, model_version) DO NOTHING
+            """, (version,))
+            cur.execute(f"""
+                UPDATE document_embeddings e
+                SET embedding = src.v, model_version = %s{extras}
+                FROM (
+                    SELECT doc_id, embedding AS v
+                    FROM document_embedding_versions
+                    WHERE model_version = %s
+                ) src
+                WHERE e.doc_id = src.doc_id AND e.model_version <> %s
+            """, (version, version, version))
+            cutover_span['rows'] = cur.rowcount
+            swapped = cur.rowcount
+            cur.execute("DELETE FROM document_embedding_versions WHERE model_version = %s", (version,))
+
+        with tracing.span('psycopg.execute', query='cutover_models'):
+            cur.execute("UPDATE embedding_models SET status = 'retired' WHERE status = 'active'")
+            cur.execute("""
+                UPDATE embedding_models
+                SET status = 'active', activated_at = NOW()
+                WHERE model_version = %s
+            """, (version,))
+
+        # centroids live in the old space: pending suggestions are re-formed, the rest are re-averaged
+        with tracing.span('psycopg.execute', query='cutover_clusters'):
+            cur.execute("DELETE FROM document_clusters WHERE status = 'suggested'")
+            cur.execute("""
+                UPDATE document_clusters c
+                SET centroid = avg_centroid.v, updated_at = NOW()
+                FROM (
+                    SELECT m.cluster_id, AVG(e.embedding) AS v
+                    FROM document_cluster_members m
+                    JOIN document_embeddings e ON e.doc_id = m.doc_id
+                    GROUP BY m.cluster_id
+                ) avg_centroid
+                WHERE c.cluster_id = avg_centroid.cluster_id
+            """)
+    return swapped
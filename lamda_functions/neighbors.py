@@ -0,0 +1,118 @@
+import tracing
+
+DEFAULT_TOP_N = 10
+
+# cosine distance (<=>) so that 1 - distance is a similarity in [-1, 1] whatever the vector norm
+NEW_DOCUMENT_SQL = """
+    INSERT INTO document_neighbors (doc_id, neighbor_id, user_id, similarity)
+    SELECT t.doc_id, e.doc_id, t.user_id, 1 - (e.embedding <=> t.embedding)
+    FROM document_embeddings t
+    JOIN document_embeddings e ON e.user_id = t.user_id AND e.doc_id <> t.doc_id
+    WHERE t.doc_id = %s
+    ORDER BY e.embedding <=> t.embedding
+    LIMIT %s
+    ON CONFLICT (doc_id, neighbor_id) DO UPDATE
+        SET similarity = EXCLUDED.similarity, updated_at = NOW()
+"""
+
+# the new document enters another document's list when that list is short or it beats the weakest entry
+REVERSE_SQL = """
+    WITH target AS (
+        SELECT doc_id, user_id, embedding FROM document_embeddings WHERE doc_id = %s
+    ),
+    candidates AS (
+        SELECT e.doc_id, t.doc_id AS neighbor_id, t.user_id, 1 - (e.embedding <=> t.embedding) AS similarity
+        FROM target t
+        JOIN document_embeddings e ON e.user_id = t.user_id AND e.doc_id <> t.doc_id
+    ),
+    current_lists AS (
+        SELECT n.doc_id, COUNT(*) AS entries, MIN(n.similarity) AS weakest
+        FROM document_neighbors n
+        JOIN target t ON n.user_id = t.user_id
+        GROUP BY n.doc_id
+    )
+    INSERT INTO document_neighbors (doc_id, neighbor_id, user_id, similarity)
+    SELECT c.doc_id, c.neighbor_id, c.user_id, c.similarity
+    FROM candidates c
+    LEFT JOIN current_lists l ON l.doc_id = c.doc_id
+    WHERE l.doc_id IS NULL OR l.entries < %s OR c.similarity > l.weakest
+    ON CONFLICT (doc_id, neighbor_id) DO UPDATE
+        SET similarity = EXCLUDED.similarity, updated_at = NOW()
+    RETURNING doc_id
+"""
+
+TRIM_SQL = """
+    DELETE FROM document_neighbors n
+    USING (
+        SELECT doc_id, neighbor_id,
+               ROW_NUMBER() OVER (PARTITION BY doc_id ORDER BY similarity DESC) AS position
+        FROM document_neighbors
+        WHERE doc_id = ANY(%s)
+    ) ranked
+    WHERE n.doc_id = ranked.doc_id
+      AND n.neighbor_id = ranked.neighbor_id
+      AND ranked.position > %s
+"""
+
+RECOMPUTE_SQL = """
+    INSERT INTO document_neighbors (doc_id, neighbor_id, user_id, similarity)
+    SELECT d.doc_id, nb.doc_id, d.user_id, nb.similarity
+    FROM document_embeddings d
+    CROSS JOIN LATERAL (
+        SELECT e.doc_id, 1 - (e.embedding <=> d.embedding) AS similarity
+        FROM document_embeddings e
+        WHERE e.user_id = d.user_id AND e.doc_id <> d.doc_id
+        ORDER BY e.embedding <=> d.embedding
+        LIMIT %s
+    ) nb
+    WHERE d.user_id = %s
+"""
+
+def top_n(configur):
+    return configur.getint('neighbors', 'top_n', fallback=DEFAULT_TOP_N)
+
+def update_for_document(conn, doc_id, n=DEFAULT_TOP_N):
+    # incremental: the new document's own list, plus its entry in the lists it now belongs to
+    with conn.transaction(), conn.cursor() as cur:
+        with tracing.span('psycopg.execute', query='neighbors_new_document'):
+            cur.execute("DELETE FROM document_neighbors WHERE doc_id = %s", (doc_id,))
+            cur.execute(NEW_DOCUMENT_SQL, (doc_id, n))
+
+        with tracing.span('psycopg.execute', query='neighbors_reverse') as reverse_span:
+            cur.execute(REVERSE_SQL, (doc_id, n))
+            touched = [row['doc_id'] for row in cur.fetchall()]
+            reverse_span['rows'] = len(touched)
+
+        if touched:
+            with tracing.span('psycopg.execute', query='neighbors_trim'):
+                cur.execute(TRIM_SQL, (touched, n))
+    return len(touched)
+
+def recompute_user(conn, user_id, n=DEFAULT_TOP_N):
+    # full rebuild of one user's lists, e.g. after the embedding model changes
+    with conn.transaction(), conn.cursor() as cur:
+        with tracing.span('psycopg.execute', query='neighbors_recompute') as recompute_span:
+            cur.execute("DELETE FROM document_neighbors WHERE user_id = %s", (user_id,))
+            cur.execute(RECOMPUTE_SQL, (n, user_id))
+            recompute_span['rows'] = cur.rowcount
+    return cur.rowcount
+
+def get_neighbors(conn, doc_id, limit=DEFAULT_TOP_N):
+    sql = """
+        SELECT n.neighbor_id, n.similarity, e.processeddatafile, e.extractedtextpath
+        FROM document_neighbors n
+        JOIN document_embeddings e ON e.doc_id = n.neighbor_id
+        WHERE n.doc_id = %s
+        ORDER BY n.similarity DESC
+        LIMIT %s
+    """
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='neighbors_lookup'):
+        cur.execute(sql, (doc_id, limit))
+        rows = cur.fetchall()
+
+    return [{
+        'doc_id': str(row['neighbor_id']),
+        'file_path': row['processeddatafile'],
+        'extracted_text_path': row['extractedtextpath'],
+        'similarity_score': float(row['similarity'])
+    } for row in rows]
@@ -0,0 +1,74 @@
+import json
+import coldstart
+import suggestions
+import tracing
+
+psycopg = coldstart.lazy_import('psycopg')
+
+def lambda_handler(event, context):
+    print("**STARTING ACCEPT GROUP SUGGESTIONS FUNCTION**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-accept-group-suggestions-handler', stage='api')
+    print("Event:", json.dumps(event))
+    
+    try:
+        user_id = (event.get('pathParameters') or {}).get('userId')
+        if not user_id:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Missing userId in path parameters'})
+            }
+        
+        body = json.loads(event.get('body') or '{}')
+        # entries are cluster ids, or {"cluster_id": ..., "group_name": ...} to rename on accept
+        accept = [entry if isinstance(entry, dict) else {'cluster_id': entry} for entry in body.get('accept', [])]
+        dismiss = body.get('dismiss', [])
+        
+        if not accept and not dismiss:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Missing required parameter: accept or dismiss'})
+            }
+        
+        config = coldstart.load_config()
+        
+        pg_conn = psycopg.connect(
+            f"host={config.get('postgres', 'endpoint')} "
+            f"port={config.get('postgres', 'port_number')} "
+            f"dbname={config.get('postgres', 'db_name')} "
+            f"user={config.get('postgres', 'user_name')} "
+            f"password={config.get('postgres', 'user_pwd')}",
+            row_factory=psycopg.rows.dict_row,
+            autocommit=True
+        )
+        
+        try:
+            accepted = []
+            not_found = []
+            for entry in accept:
+                result = suggestions.accept(pg_conn, user_id, entry['cluster_id'], entry.get('group_name'))
+                if result is None:
+                    not_found.append(entry['cluster_id'])
+                else:
+                    accepted.append(result)
+                    print(f"Accepted suggestion {entry['cluster_id']} into group {result['group_id']} ({result['assigned']} documents)")
+            
+            dismissed = suggestions.dismiss(pg_conn, user_id, dismiss)
+        finally:
+            pg_conn.close()
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'accepted': accepted,
+                'dismissed': dismissed,
+                'not_found': not_found
+            })
+        }
+        
+    except Exception as e:
+        print(f"Error handling group suggestions: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': 'Failed to update group suggestions', 'details': str(e)})
+        }
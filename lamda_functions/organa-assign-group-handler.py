@@ -1,10 +1,14 @@
 import json
-import psycopg
-from psycopg.rows import dict_row
-from configparser import ConfigParser
+import coldstart
+import searchcache
+import tracing
+
+psycopg = coldstart.lazy_import('psycopg')
 
 def lambda_handler(event, context):
     print("**STARTING ASSIGN DOCUMENT TO GROUP FUNCTION**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-assign-group-handler', stage='api')
     print("Event:", json.dumps(event))
     
     try:
@@ -24,8 +28,7 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Missing required parameter: doc_id'})
             }
         
-        config = ConfigParser()
-        config.read('organa-config.ini')
+        config = coldstart.load_config()
         
         pg_conn = psycopg.connect(
             f"host={config.get('postgres', 'endpoint')} "
@@ -33,7 +36,7 @@ def lambda_handler(event, context):
             f"dbname={config.get('postgres', 'db_name')} "
             f"user={config.get('postgres', 'user_name')} "
             f"password={config.get('postgres', 'user_pwd')}",
-            row_factory=dict_row,
+            row_factory=psycopg.rows.dict_row,
             autocommit=True
         )
         
@@ -44,14 +47,17 @@ def lambda_handler(event, context):
                 ON CONFLICT DO NOTHING
                 RETURNING assignment_id, assigned_at;
             """
-            with pg_conn.cursor() as cur:
-                cur.execute(insert_sql, (doc_id, group_id))
+            # the assignment and the owner's corpus version commit together (search results list groups)
+            with pg_conn.transaction(), pg_conn.cursor() as cur:
+                with tracing.span('psycopg.execute'):
+                    cur.execute(insert_sql, (doc_id, group_id))
                 result = cur.fetchone()
                 if not result:
                     return {
                         'statusCode': 409,
                         'body': json.dumps({'error': 'Document is already assigned to this group or invalid group/document ID'})
                     }
+                searchcache.bump_for_group(pg_conn, group_id)
                 assignment_id = result['assignment_id']
                 assigned_at = result['assigned_at'].isoformat()
                 print(f"Document {doc_id} assigned to group {group_id} with assignment ID {assignment_id}")
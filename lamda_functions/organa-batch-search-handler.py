@@ -0,0 +1,217 @@
+import json
+import os
+from typing import List, Dict
+import coldstart
+import datatier
+import embedclient
+import enrichment
+import modelversions
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
+openai = coldstart.lazy_import('openai')
+psycopg = coldstart.lazy_import('psycopg')
+
+MAX_BATCH_QUERIES = 50
+MAX_LIMIT = 50
+
+def vector_array_literal(embeddings: List[List[float]]) -> str:
+    # a vector[] literal, e.g. {"[0.1,0.2]","[0.3,0.4]"}, so all queries travel as one parameter
+    return '{' + ','.join('"[' + ','.join(str(float(value)) for value in embedding) + ']"' for embedding in embeddings) + '}'
+
+def parse_queries(body: Dict) -> List[Dict]:
+    queries = []
+    seen = set()
+    for index, entry in enumerate(body.get('queries') or []):
+        if isinstance(entry, str):
+            entry = {'query': entry}
+        if not isinstance(entry, dict) or not str(entry.get('query', '')).strip():
+            raise ValueError(f"Query {index} is missing its text")
+        query_id = str(entry.get('id', entry['query']))
+        # results are keyed by id, so a repeated id would silently replace an earlier query's results
+        if query_id in seen:
+            raise ValueError(f"Duplicate query id: {query_id}")
+        seen.add(query_id)
+        queries.append({
+            'id': query_id,
+            'query': entry['query']
+        })
+    return queries
+
+def parse_limit(value) -> int:
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def batch_search(conn, user_id: str, embeddings: List[List[float]], limit: int, similarity_threshold: float, include_groups: bool, model_version: str) -> List[List[Dict]]:
+    groups_column = ", COALESCE(g.groups, '[]'::json) AS groups" if include_groups else ""
+    groups_join = enrichment.groups_lateral('h') if include_groups else ""
+
+    sql = f"""
+    SELECT
+        q.query_index,
+        h.doc_id,
+        h.processeddatafile,
+        h.extractedtextpath,
+        h.similarity{groups_column}
+    FROM unnest(%s::vector[]) WITH ORDINALITY AS q(embedding, query_index)
+    CROSS JOIN LATERAL (
+        SELECT
+            doc_id,
+            processeddatafile,
+            extractedtextpath,
+            1 - (e.embedding <-> q.embedding) AS similarity
+        FROM document_embeddings e
+        WHERE e.user_id = %s AND e.model_version = %s
+        ORDER BY e.embedding <-> q.embedding
+        LIMIT %s
+    ) h
+    {groups_join}
+    WHERE h.similarity >= %s
+    ORDER BY q.query_index, h.similarity DESC
+    """
+    parameters = (vector_array_literal(embeddings), user_id, model_version, limit)
+    if include_groups:
+        parameters += (user_id,)
+    parameters += (similarity_threshold,)
+
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='batch_similarity_search', queries=len(embeddings)) as search_span:
+        cur.execute(sql, parameters)
+        rows = cur.fetchall()
+        search_span['rows'] = len(rows)
+
+    results = [[] for _ in embeddings]
+    for row in rows:
+        hit = {
+            'doc_id': str(row['doc_id']),
+            'file_path': row['processeddatafile'],
+            'extracted_text_path': row['extractedtextpath'],
+            'similarity_score': float(row['similarity'])
+        }
+        if include_groups:
+            hit['groups'] = row['groups']
+        results[row['query_index'] - 1].append(hit)
+    return results
+
+def lambda_handler(event, context):
+    print("**STARTING BATCH SEARCH**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-batch-search-handler', stage='search')
+
+    try:
+        user_id = (event.get('pathParameters') or {}).get('userid')
+        if not user_id:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Missing userId in path parameters'})
+            }
+
+        body = json.loads(event.get('body') or '{}')
+        try:
+            queries = parse_queries(body)
+            fields = enrichment.parse_fields(body.get('fields'))
+            limit = parse_limit(body.get('limit', 5))
+            similarity_threshold = float(body.get('threshold', 0.1))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+
+        if not queries:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Missing required parameter: queries'})
+            }
+
+        if len(queries) > MAX_BATCH_QUERIES:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': f'At most {MAX_BATCH_QUERIES} queries per request'})
+            }
+
+        print(f"User ID: {user_id}, queries: {len(queries)}, limit: {limit}, threshold: {similarity_threshold}")
+
+        config = coldstart.load_config()
+        openai.api_key = config.get('openai', 'api_key')
+
+        # repeated query texts are embedded and searched once
+        texts = list(dict.fromkeys(query['query'] for query in queries))
+
+        with tracing.span('psycopg.connect'):
+            pg_conn = psycopg.connect(
+                f"host={config.get('postgres', 'endpoint')} "
+                f"port={config.get('postgres', 'port_number')} "
+                f"dbname={config.get('postgres', 'db_name')} "
+                f"user={config.get('postgres', 'user_name')} "
+                f"password={config.get('postgres', 'user_pwd')}",
+                row_factory=psycopg.rows.dict_row,
+                autocommit=True
+            )
+
+        try:
+            model_version = modelversions.get_versions(pg_conn, config)['active']
+            # packed into as few provider calls as the request / token limits allow
+            embeddings = embedclient.get_client(config).embed(texts, model_version)
+            hits = batch_search(pg_conn, user_id, embeddings, limit, similarity_threshold, 'groups' in fields, model_version)
+        finally:
+            pg_conn.close()
+
+        hits_by_text = dict(zip(texts, hits))
+
+        if 'document' in fields:
+            doc_ids = list(dict.fromkeys(hit['doc_id'] for text_hits in hits for hit in text_hits))
+            if doc_ids:
+                with tracing.span('datatier.get_dbConn'):
+                    dbConn = datatier.get_dbConn(
+                        config.get('rds', 'endpoint'),
+                        int(config.get('rds', 'port_number')),
+                        config.get('rds', 'user_name'),
+                        config.get('rds', 'user_pwd'),
+                        config.get('rds', 'db_name')
+                    )
+                details = enrichment.get_document_details(dbConn, user_id, doc_ids)
+                for text_hits in hits:
+                    for hit in text_hits:
+                        hit['document'] = details.get(hit['doc_id'])
+
+        if 'snippet' in fields:
+            os.environ['AWS_SHARED_CREDENTIALS_FILE'] = 'organa-config.ini'
+            boto3.setup_default_session(profile_name='s3readwrite')
+            s3_client = boto3.client('s3')
+            for text, text_hits in hits_by_text.items():
+                enrichment.add_snippets(s3_client, config.get('s3', 'bucket_name'), text_hits, text)
+
+        results = {}
+        for query in queries:
+            query_hits = hits_by_text[query['query']]
+            results[query['id']] = {
+                'query': query['query'],
+                'results': query_hits,
+                'total_results': len(query_hits)
+            }
+
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'results': results,
+                'fields': sorted(fields),
+                'model_version': model_version,
+                'total_queries': len(queries)
+            })
+        }
+
+    except Exception as e:
+        print(f"Fatal error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
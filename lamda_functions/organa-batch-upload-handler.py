@@ -0,0 +1,173 @@
+import json
+import os
+import uuid
+import base64
+import datatier
+import uploads
+import workqueue
+import coldstart
+import tracing
+from concurrent.futures import ThreadPoolExecutor
+
+boto3 = coldstart.lazy_import('boto3')
+
+MAX_BATCH_FILES = 50
+UPLOAD_WORKERS = 8
+
+def put_file(s3_client, bucketname, bucket_key, datastr, metadata):
+    file_bytes = base64.b64decode(datastr.encode())
+    with tracing.span('s3.put_object'):
+        s3_client.put_object(
+            Bucket=bucketname,
+            Key=bucket_key,
+            Body=file_bytes,
+            ContentType=uploads.UPLOAD_CONTENT_TYPE,
+            Metadata=metadata
+        )
+    return len(file_bytes)
+
+def lambda_handler(event, context):
+    try:
+        print("**STARTING ORGANA BATCH UPLOAD HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-batch-upload-handler', stage='upload')
+        
+        config_file = 'organa-config.ini'
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+        
+        configur = coldstart.load_config(config_file)
+        
+        s3_profile = 's3readwrite'
+        boto3.setup_default_session(profile_name=s3_profile)
+        
+        bucketname = configur.get('s3', 'bucket_name')
+        s3_client = boto3.client('s3')
+        
+        rds_endpoint = configur.get('rds', 'endpoint')
+        rds_portnum = int(configur.get('rds', 'port_number'))
+        rds_username = configur.get('rds', 'user_name')
+        rds_pwd = configur.get('rds', 'user_pwd')
+        rds_dbname = configur.get('rds', 'db_name')
+        
+        print("**Accessing event/pathParameters**")
+        userid = None
+        if "userid" in event:
+            userid = event["userid"]
+        elif "pathParameters" in event and "userid" in event["pathParameters"]:
+            userid = event["pathParameters"]["userid"]
+        else:
+            raise Exception("User ID not provided in event or pathParameters")
+        
+        print("User ID:", userid)
+        
+        print("**Parsing request body**")
+        if "body" not in event:
+            raise Exception("No body found in event")
+        
+        body = json.loads(event["body"])
+        files = body.get("files")
+        
+        if not files:
+            raise Exception("Files not found in request body")
+        
+        if len(files) > MAX_BATCH_FILES:
+            raise Exception(f"Too many files in batch, maximum is {MAX_BATCH_FILES}")
+        
+        for entry in files:
+            if not entry.get("filename"):
+                raise Exception("Filename not found for file in request body")
+        
+        print(f"Batch size: {len(files)}")
+        
+        print("**Verifying user ID**")
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        sql_verify = "SELECT * FROM users WHERE userid = %s;"
+        with tracing.span('datatier.retrieve_one_row'):
+            user_row = datatier.retrieve_one_row(dbConn, sql_verify, [userid])
+        
+        if not user_row:
+            raise Exception("No such user found in database")
+        
+        username = user_row[1]
+        print("User verified:", username)
+        
+        print("**Preparing S3 keys**")
+        results = []
+        accepted = []
+        for entry in files:
+            doc_id = str(uuid.uuid4())
+            result = {"filename": entry["filename"], "doc_id": doc_id}
+            results.append(result)
+            try:
+                result["file_path"] = uploads.build_bucket_key(username, entry["filename"], doc_id)
+            except Exception as key_err:
+                print(f"Skipping {entry['filename']}: {str(key_err)}")
+                result["error"] = str(key_err)
+                continue
+            accepted.append((entry, result))
+        
+        # rows go in before any object lands in organa-original/, so the processor always finds one;
+        # it picks up 'pending' documents as well as 'uploaded' ones
+        rows = [(result["doc_id"], userid, result["file_path"], 'pending') for _, result in accepted]
+        print(f"**Inserting {len(rows)} document records into database**")
+        with tracing.span('datatier.insert_documents'):
+            uploads.insert_documents(dbConn, rows)
+        
+        print("**Uploading files to S3 and presigning upload intents**")
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            futures = []
+            for entry, result in accepted:
+                metadata = uploads.object_metadata(result["doc_id"], userid)
+                if entry.get("data"):
+                    futures.append(executor.submit(tracing.bind(put_file), s3_client, bucketname, result["file_path"], entry["data"], metadata))
+                else:
+                    size = int(entry["size"]) if entry.get("size") is not None else None
+                    futures.append(executor.submit(tracing.bind(uploads.presign_upload), s3_client, bucketname, result["file_path"], size, metadata))
+        
+        uploaded = []
+        failed = []
+        for (entry, result), future in zip(accepted, futures):
+            try:
+                outcome = future.result()
+            except Exception as upload_err:
+                print(f"Error uploading {result['file_path']}: {str(upload_err)}")
+                result["error"] = str(upload_err)
+                failed.append(result)
+                continue
+            
+            if entry.get("data"):
+                result["status"] = 'uploaded'
+                uploaded.append(result)
+            else:
+                result["status"] = 'pending'
+                result["upload"] = outcome
+        
+        with tracing.span('datatier.perform_action', query='discard_pending'):
+            uploads.discard_pending(dbConn, [result["doc_id"] for result in failed])
+        with tracing.span('datatier.perform_action', query='mark_uploaded'):
+            uploads.mark_uploaded(dbConn, [result["doc_id"] for result in uploaded])
+        
+        orchestrator = workqueue.from_config(configur)
+        if orchestrator:
+            for result in uploaded:
+                orchestrator.enqueue('process', bucketname, result["file_path"], result["doc_id"], workqueue.PRIORITY_BULK)
+        
+        print("**Batch upload complete**")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                "message": "Batch upload processed",
+                "total_files": len(files),
+                "successful": len(accepted) - len(failed),
+                "documents": results
+            })
+        }
+    
+    except Exception as err:
+        print("**ERROR**")
+        print(str(err))
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": str(err)})
+        }
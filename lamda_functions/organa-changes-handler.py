@@ -0,0 +1,192 @@
+import json
+import os
+import base64
+import binascii
+from datetime import datetime, timedelta
+import datatier
+import previews
+import coldstart
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
+psycopg = coldstart.lazy_import('psycopg')
+
+# rows are read again for this long after the cursor: a write whose timestamp was taken before a
+# concurrent sync ran (a multi-statement transaction, a slow commit) still commits after it
+CURSOR_OVERLAP_SECONDS = 5
+
+FEEDS = ['documents', 'groups', 'assignments']
+
+DOCUMENTS_SQL = """
+    SELECT doc_id, original_bucket_key, upload_date, status, failed_stage, preview_pages, updated_at
+    FROM documents
+    WHERE userid = %s AND updated_at >= %s
+    ORDER BY updated_at;
+"""
+
+GROUPS_SQL = """
+    SELECT group_id, group_name, description, created_at, updated_at
+    FROM document_groups
+    WHERE user_id = %s AND updated_at >= %s
+    ORDER BY updated_at;
+"""
+
+ASSIGNMENTS_SQL = """
+    SELECT a.doc_id, a.group_id, a.assigned_at
+    FROM document_group_assignments a
+    JOIN document_groups g ON g.group_id = a.group_id
+    WHERE g.user_id = %s AND a.assigned_at >= %s
+    ORDER BY a.assigned_at;
+"""
+
+def timestamp(value):
+    if value is None:
+        return None
+    return value.isoformat(sep=' ') if isinstance(value, datetime) else str(value)
+
+def encode_cursor(marks):
+    # one high-water mark per feed: documents come from MySQL and groups from PostgreSQL, whose clocks differ
+    return base64.urlsafe_b64encode(json.dumps(marks, sort_keys=True).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return {}
+    try:
+        marks = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return {feed: datetime.fromisoformat(marks[feed]) for feed in FEEDS if marks.get(feed)}
+    except (binascii.Error, UnicodeError, ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def since(marks, feed):
+    mark = marks.get(feed)
+    return mark - timedelta(seconds=CURSOR_OVERLAP_SECONDS) if mark else datetime(1970, 1, 1)
+
+def lambda_handler(event, context):
+    print("**STARTING CHANGES FUNCTION**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-changes-handler', stage='api')
+    print("Event:", json.dumps(event))
+
+    try:
+        user_id = (event.get('pathParameters') or {}).get('userId')
+        if not user_id:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Missing userId in path parameters'})
+            }
+
+        params = event.get('queryStringParameters') or {}
+        try:
+            marks = decode_cursor(params.get('since'))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+
+        config_file = 'organa-config.ini'
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+        config = coldstart.load_config(config_file)
+
+        boto3.setup_default_session(profile_name='s3readwrite')
+        s3_client = boto3.client('s3')
+        bucketname = config.get('s3', 'bucket_name')
+
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(
+                config.get('rds', 'endpoint'),
+                int(config.get('rds', 'port_number')),
+                config.get('rds', 'user_name'),
+                config.get('rds', 'user_pwd'),
+                config.get('rds', 'db_name')
+            )
+
+        # status transitions show up as the document's new status and updated_at
+        with tracing.span('datatier.stream_rows', query='changed_documents') as stream_span:
+            document_rows = list(datatier.stream_rows(dbConn, DOCUMENTS_SQL, [user_id, since(marks, 'documents')]))
+            stream_span['rows'] = len(document_rows)
+
+        with tracing.span('psycopg.connect'):
+            pg_conn = psycopg.connect(
+                f"host={config.get('postgres', 'endpoint')} "
+                f"port={config.get('postgres', 'port_number')} "
+                f"dbname={config.get('postgres', 'db_name')} "
+                f"user={config.get('postgres', 'user_name')} "
+                f"password={config.get('postgres', 'user_pwd')}",
+                row_factory=psycopg.rows.dict_row,
+                autocommit=True
+            )
+
+        try:
+            with pg_conn.cursor() as cur:
+                with tracing.span('psycopg.execute', query='changed_groups'):
+                    cur.execute(GROUPS_SQL, (user_id, since(marks, 'groups')))
+                    group_rows = cur.fetchall()
+                with tracing.span('psycopg.execute', query='changed_assignments'):
+                    cur.execute(ASSIGNMENTS_SQL, (user_id, since(marks, 'assignments')))
+                    assignment_rows = cur.fetchall()
+        finally:
+            pg_conn.close()
+
+        documents = [
+            {
+                "documentid": row[0],
+                "originaldatafile": row[1],
+                "upload_date": row[2].strftime("%Y-%m-%d %H:%M:%S"),
+                "status": row[3],
+                "failed_stage": row[4],
+                "thumbnailUrl": previews.preview_url(s3_client, bucketname, previews.thumbnail_key(row[1])) if row[5] else None,
+                "updated_at": timestamp(row[6])
+            }
+            for row in document_rows
+        ]
+        groups = [
+            {
+                'group_id': str(row['group_id']),
+                'group_name': row['group_name'],
+                'description': row['description'],
+                'created_at': timestamp(row['created_at']),
+                'updated_at': timestamp(row['updated_at'])
+            }
+            for row in group_rows
+        ]
+        assignments = [
+            {
+                'doc_id': str(row['doc_id']),
+                'group_id': str(row['group_id']),
+                'assigned_at': timestamp(row['assigned_at'])
+            }
+            for row in assignment_rows
+        ]
+
+        # rows come back in timestamp order, so the last one is each feed's new high-water mark
+        latest = {
+            'documents': document_rows[-1][6] if document_rows else None,
+            'groups': group_rows[-1]['updated_at'] if group_rows else None,
+            'assignments': assignment_rows[-1]['assigned_at'] if assignment_rows else None
+        }
+        next_marks = {
+            feed: timestamp(latest[feed]) if latest[feed] is not None else timestamp(marks.get(feed))
+            for feed in FEEDS
+        }
+
+        print(f"Changes for user {user_id}: {len(documents)} documents, {len(groups)} groups, {len(assignments)} assignments")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'user_id': user_id,
+                'full': not marks,
+                'cursor': encode_cursor({feed: mark for feed, mark in next_marks.items() if mark}),
+                'documents': documents,
+                'groups': groups,
+                'assignments': assignments
+            })
+        }
+
+    except Exception as e:
+        print(f"Error retrieving changes: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -1,11 +1,14 @@
 import json
-import psycopg
-from psycopg.rows import dict_row
-from configparser import ConfigParser
+import coldstart
+import tracing
 import uuid 
 
+psycopg = coldstart.lazy_import('psycopg')
+
 def lambda_handler(event, context):
     print("**STARTING CREATE GROUP FUNCTION**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-create-group-handler', stage='api')
     print("Event:", json.dumps(event))
     
     try:
@@ -26,8 +29,7 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Missing userId in path parameters'})
             }
         
-        config = ConfigParser()
-        config.read('organa-config.ini')
+        config = coldstart.load_config()
         
         pg_conn = psycopg.connect(
             f"host={config.get('postgres', 'endpoint')} "
@@ -35,7 +37,7 @@ def lambda_handler(event, context):
             f"dbname={config.get('postgres', 'db_name')} "
             f"user={config.get('postgres', 'user_name')} "
             f"password={config.get('postgres', 'user_pwd')}",
-            row_factory=dict_row,
+            row_factory=psycopg.rows.dict_row,
             autocommit=True
         )
         
@@ -46,7 +48,8 @@ def lambda_handler(event, context):
                 RETURNING group_id, created_at;
             """
             with pg_conn.cursor() as cur:
-                cur.execute(insert_sql, (user_id, group_name, description))
+                with tracing.span('psycopg.execute'):
+                    cur.execute(insert_sql, (user_id, group_name, description))
                 result = cur.fetchone()
                 group_id = str(result['group_id'])   
                 created_at = result['created_at'].isoformat()
@@ -1,40 +1,123 @@
 import json
-import boto3
 import os
 import base64
 import datatier
-from configparser import ConfigParser
+import previews
+import textcodec
+import coldstart
+import tracing
+from concurrent.futures import ThreadPoolExecutor
 
-def get_file_content(s3_client, bucketname, s3_key):
+boto3 = coldstart.lazy_import('boto3')
+
+INLINE_CHUNK_SIZE = 3 * 256 * 1024
+# raw byte limits per artifact: together about 2.8 MiB, 3.8 MiB after base64 expansion, which leaves the
+# rest of the document and the JSON envelope well inside the 6 MB Lambda response cap
+DEFAULT_MAX_INLINE_BYTES = {
+    'processedData': 1024 * 1024,
+    'originalData': 1024 * 1024,
+    'extractedTextData': 768 * 1024,
+    'thumbnailData': 64 * 1024
+}
+PRESIGNED_URL_EXPIRY = 3600
+
+def get_file_content(s3_client, bucketname, s3_key, max_inline_bytes):
     try:
-        response = s3_client.get_object(
-            Bucket=bucketname,
-            Key=s3_key
-        )
-        file_content = response['Body'].read()
-        encoded_content = base64.b64encode(file_content).decode('utf-8')
+        with tracing.span('s3.get_object'):
+            response = s3_client.get_object(
+                Bucket=bucketname,
+                Key=s3_key
+            )
+        # compressed text is inlined decoded, so the limit applies to its decoded size
+        content_length = textcodec.text_length(response) or response.get('ContentLength', 0)
+        if content_length > max_inline_bytes:
+            response['Body'].close()
+            print(f"Content for key {s3_key} is {content_length} bytes, returning URL instead")
+            return None, get_file_url(s3_client, bucketname, s3_key)
+        
+        # encode in 3-byte aligned chunks straight into one buffer sized for the whole object: the raw object
+        # is never held whole, and the returned str is the only other copy of the base64
+        encoded = bytearray(4 * -(-content_length // 3))
+        position = 0
+        pending = b''
+        for chunk in textcodec.iter_bytes(response, INLINE_CHUNK_SIZE, max_inline_bytes):
+            pending += chunk
+            aligned = len(pending) - len(pending) % 3
+            part = base64.b64encode(pending[:aligned])
+            encoded[position:position + len(part)] = part
+            position += len(part)
+            pending = pending[aligned:]
+        part = base64.b64encode(pending)
+        encoded[position:position + len(part)] = part
+        position += len(part)
+        # a missing or stale length only costs a resize
+        del encoded[position:]
         print(f"Successfully retrieved and encoded content for key: {s3_key}")
-        return encoded_content
+        return encoded.decode('ascii'), None
     except Exception as e:
         print(f"Error retrieving file content for {s3_key}: {str(e)}")
+        return None, None
+
+def get_file_url(s3_client, bucketname, s3_key):
+    try:
+        return s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucketname, 'Key': s3_key},
+            ExpiresIn=PRESIGNED_URL_EXPIRY
+        )
+    except Exception as e:
+        print(f"Error generating URL for {s3_key}: {str(e)}")
         return None
 
+def get_inline_limits(configur):
+    return {
+        field: configur.getint('s3', f"max_inline_{field}", fallback=limit)
+        for field, limit in DEFAULT_MAX_INLINE_BYTES.items()
+    }
+
+def get_artifacts(s3_client, bucketname, document, inline_limits):
+    artifacts = {
+        'processedData': document['processedBucketKey'],
+        'originalData': document['originalBucketKey'],
+        'extractedTextData': document['extractedTextBucketKey'],
+        'thumbnailData': previews.thumbnail_key(document['originalBucketKey']) if document['previewPages'] else None
+    }
+    
+    # one worker per artifact, so no fetch waits behind another
+    with ThreadPoolExecutor(max_workers=len(artifacts)) as executor:
+        futures = {
+            field: executor.submit(tracing.bind(get_file_content), s3_client, bucketname, s3_key, inline_limits[field])
+            for field, s3_key in artifacts.items()
+            if s3_key
+        }
+    
+    for field, s3_key in artifacts.items():
+        if field in futures:
+            content, url = futures[field].result()
+        else:
+            content, url = None, None
+            print(f"No bucket key for {field} of document {document['doc_id']}")
+        document[field] = content
+        document[field.replace('Data', 'Url')] = url
+
 def lambda_handler(event, context):
     try:
         print("**STARTING ORGANA DOCUMENT VIEW HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-detailed-retriever-handler', stage='api')
         print("Event:", json.dumps(event))
         
         config_file = 'organa-config.ini'
         os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
         
-        configur = ConfigParser()
-        configur.read(config_file)
+        configur = coldstart.load_config(config_file)
         
         s3_profile = 's3readwrite'
         boto3.setup_default_session(profile_name=s3_profile)
         
         bucketname = configur.get('s3', 'bucket_name')
         s3_client = boto3.client('s3')
+        inline_limits = get_inline_limits(configur)
         
         rds_endpoint = configur.get('rds', 'endpoint')
         rds_portnum = int(configur.get('rds', 'port_number'))
@@ -48,7 +131,8 @@ def lambda_handler(event, context):
         
         print(f"Received request for document ID: {doc_id}")
         
-        dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
         
         sql = """
             SELECT 
@@ -59,11 +143,13 @@ def lambda_handler(event, context):
                 status,
                 upload_date,
                 processed_date,
-                extraction_date
+                extraction_date,
+                preview_pages
             FROM documents 
             WHERE doc_id = %s
         """
-        row = datatier.retrieve_one_row(dbConn, sql, [doc_id])
+        with tracing.span('datatier.retrieve_one_row'):
+            row = datatier.retrieve_one_row(dbConn, sql, [doc_id])
         if not row:
             return {
                 'statusCode': 404,
@@ -83,26 +169,12 @@ def lambda_handler(event, context):
             'status': row[4],
             'upload_date': row[5].isoformat() if row[5] else None,
             'processed_date': row[6].isoformat() if row[6] else None,
-            'extraction_date': row[7].isoformat() if row[7] else None
+            'extraction_date': row[7].isoformat() if row[7] else None,
+            'previewPages': row[8] or 0
         }
         
-        if document['processedBucketKey']:
-            document['processedData'] = get_file_content(s3_client, bucketname, document['processedBucketKey'])
-        else:
-            document['processedData'] = None
-            print(f"No processedBucketKey for document {doc_id}")
-        
-        if document['originalBucketKey']:
-            document['originalData'] = get_file_content(s3_client, bucketname, document['originalBucketKey'])
-        else:
-            document['originalData'] = None
-            print(f"No originalBucketKey for document {doc_id}")
-        
-        if document['extractedTextBucketKey']:
-            document['extractedTextData'] = get_file_content(s3_client, bucketname, document['extractedTextBucketKey'])
-        else:
-            document['extractedTextData'] = None
-            print(f"No extractedTextBucketKey for document {doc_id}")
+        get_artifacts(s3_client, bucketname, document, inline_limits)
+        document['previewUrls'] = previews.page_urls(s3_client, bucketname, document['originalBucketKey'], document['previewPages'])
         
         print(f"Document {doc_id} retrieved successfully.")
         
@@ -1,15 +1,26 @@
 import json
 import os
 from typing import List, Optional, Dict
-import boto3
-import openai
-import psycopg
-from psycopg.rows import dict_row
 import datatier 
+import embedclient
+import embeddingwriter
+import uploads
+import workqueue
+import textcodec
+import neighbors
+import clustering
+import modelversions
+import quantization
+import coldstart
+import tracing
 from configparser import ConfigParser
 import re
 import pathlib
 
+boto3 = coldstart.lazy_import('boto3')
+openai = coldstart.lazy_import('openai')
+psycopg = coldstart.lazy_import('psycopg')
+
 UUID_REGEX = re.compile(
     r'[0-9a-fA-F]{8}-'
     r'[0-9a-fA-F]{4}-'
@@ -18,16 +29,12 @@ UUID_REGEX = re.compile(
     r'[0-9a-fA-F]{12}'
 )
 
-def create_embedding(text: str) -> List[float]:
-    response = openai.Embedding.create(
-        input=text,
-        model="text-embedding-ada-002"  
-    )
-    return response['data'][0]['embedding']
-
 def get_original_path(extracted_path: str) -> str:
     return extracted_path.replace('organa-extracted-text/', 'organa-original/').replace('.txt', '.pdf')
 
+def get_processed_path(extracted_path: str) -> str:
+    return extracted_path.replace('organa-extracted-text/', 'organa-processed/').replace('.txt', '.pdf')
+
 def extract_doc_id(key: str) -> Optional[str]:
     basename_with_uuid = pathlib.Path(key).stem
     match = UUID_REGEX.search(basename_with_uuid)
@@ -42,7 +49,8 @@ def get_document_metadata(conn, original_path: str) -> Optional[Dict]:
     FROM documents 
     WHERE original_bucket_key = %s
     """
-    result = datatier.retrieve_one_row(conn, sql, [original_path])
+    with tracing.span('datatier.retrieve_one_row'):
+        result = datatier.retrieve_one_row(conn, sql, [original_path])
     if result is None:
         return None
     return {
@@ -51,45 +59,123 @@ def get_document_metadata(conn, original_path: str) -> Optional[Dict]:
         'doc_id': result[2]
     }
 
-def store_embedding(conn, user_id: str, doc_id: str, processed_bucket_key: str, extracted_path: str, embedding: List[float]):
+def get_document_by_id(conn, doc_id: str) -> Optional[Dict]:
     sql = """
-    INSERT INTO document_embeddings 
-    (doc_id, user_id, processeddatafile, extractedtextpath, embedding)
-    VALUES (%s, %s, %s, %s, %s)
+    SELECT userid, processed_bucket_key, doc_id
+    FROM documents 
+    WHERE doc_id = %s
     """
+    with tracing.span('datatier.retrieve_one_row'):
+        result = datatier.retrieve_one_row(conn, sql, [doc_id])
+    if result is None:
+        return None
+    return {
+        'userid': result[0],
+        'processed_bucket_key': result[1],
+        'doc_id': result[2]
+    }
+
+def resolve_document(connect_mysql, key: str, object_metadata: Dict, doc_id: Optional[str]) -> Optional[Dict]:
+    # the earlier stages tag their outputs with doc-id / user-id; MySQL is only asked about objects written before that
+    doc_id = object_metadata.get(uploads.METADATA_DOC_ID) or doc_id
+    user_id = object_metadata.get(uploads.METADATA_USER_ID)
+    if doc_id and user_id:
+        return {
+            'userid': user_id,
+            'processed_bucket_key': get_processed_path(key),
+            'doc_id': doc_id
+        }
+    if doc_id:
+        return get_document_by_id(connect_mysql(), doc_id)
+    return get_document_metadata(connect_mysql(), get_original_path(key))
+
+def embedding_exists(conn, doc_id: str) -> bool:
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='embedding_exists'):
+        cur.execute("SELECT 1 FROM document_embeddings WHERE doc_id = %s", (doc_id,))
+        return cur.fetchone() is not None
+
+def prepare_document(s3_client, connect_mysql, pg_conn, bucket: str, key: str, doc_id: Optional[str] = None) -> Optional[Dict]:
+    # everything up to the embedding call: the text and who it belongs to, or None when there is nothing to do
+    doc_id = doc_id or extract_doc_id(key)
+    
+    # redelivered events for an already embedded document skip the S3 read and OpenAI call
+    if doc_id and embedding_exists(pg_conn, doc_id):
+        print(f"Embedding already stored for doc_id: {doc_id}, skipping")
+        return None
+    
+    with tracing.span('s3.get_object'):
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        extracted_text = textcodec.read_text(response)
+    print(f"Retrieved text from S3: {key} (length: {len(extracted_text)})")
+    
+    metadata = resolve_document(connect_mysql, key, response.get('Metadata', {}), doc_id)
+    if not metadata:
+        print(f"No matching document record found for {key}")
+        return None
+    print(f"Retrieved metadata for user_id: {metadata['userid']}, doc_id: {metadata['doc_id']}")
+    
+    if metadata['doc_id'] != doc_id and embedding_exists(pg_conn, metadata['doc_id']):
+        print(f"Embedding already stored for doc_id: {metadata['doc_id']}, skipping")
+        return None
+    
+    return dict(metadata, key=key, text=extracted_text)
+
+def finish_document(pg_conn, document: Dict, embedding: List[float], neighbor_count: int):
+    # the embedding is already stored; a failed neighbor update is repaired by the recompute handler
+    tracing.set_context(doc_id=document['doc_id'])
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (doc_id, user_id, processed_bucket_key, extracted_path, embedding))
-            print(f"Executed INSERT for doc_id: {doc_id}, user_id: {user_id}, file: {extracted_path}")
-        conn.commit()
-        print(f"Successfully committed transaction for {extracted_path}")
+        updated = neighbors.update_for_document(pg_conn, document['doc_id'], neighbor_count)
+        print(f"Updated related-document lists for doc_id: {document['doc_id']} ({updated} other lists changed)")
     except Exception as e:
-        conn.rollback()
-        print(f"Error in store_embedding: {str(e)}")
-        raise
-
-def process_document(s3_client, mysql_conn, pg_conn, bucket: str, key: str):
+        print(f"Error updating related documents for {document['doc_id']}: {str(e)}")
+    
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        extracted_text = response['Body'].read().decode('utf-8')
-        print(f"Retrieved text from S3: {key} (length: {len(extracted_text)})")
-        
-        embedding = create_embedding(extracted_text)
-        print(f"Generated embedding (length: {len(embedding)})")
-        
-        original_path = get_original_path(key)
-        metadata = get_document_metadata(mysql_conn, original_path)
-        if not metadata:
-            print(f"No matching document record found for {original_path}")
-            return
-        print(f"Retrieved metadata for user_id: {metadata['userid']}, doc_id: {metadata['doc_id']}")
-            
-        store_embedding(pg_conn, metadata['userid'], metadata['doc_id'], metadata['processed_bucket_key'], key, embedding)
-        print(f"Successfully processed {key}")
-        
+        assignment = clustering.assign_document(pg_conn, document['userid'], document['doc_id'], embedding)
+        print(f"Cluster assignment for doc_id {document['doc_id']}: {assignment}")
     except Exception as e:
-        print(f"Error processing {key}: {str(e)}")
-        raise   
+        print(f"Error assigning {document['doc_id']} to a suggested group: {str(e)}")
+    print(f"Successfully processed {document['key']}")
+
+def process_documents(s3_client, connect_mysql, pg_conn, client, writer, records: List[Dict], neighbor_count: int = neighbors.DEFAULT_TOP_N, versions: Optional[Dict] = None):
+    # every record's text goes to the embedding client at once, so a batch of small documents is a few requests
+    versions = versions or {'active': modelversions.DEFAULT_MODEL, 'backfilling': []}
+    documents = []
+    for record in records:
+        tracing.clear_context('doc_id')
+        print(f"Processing file from bucket: {record['bucket']}, key: {record['key']}")
+        try:
+            document = prepare_document(s3_client, connect_mysql, pg_conn, record['bucket'], record['key'], record.get('doc_id'))
+        except Exception as e:
+            print(f"Error processing {record['key']}: {str(e)}")
+            raise
+        if document:
+            documents.append(document)
+    
+    if not documents:
+        return 0
+    
+    texts = [document['text'] for document in documents]
+    embeddings = client.embed(texts, versions['active'])
+    print(f"Generated {len(embeddings)} embeddings (model: {versions['active']})")
+    
+    # every vector is written before any neighbor list is rebuilt, so documents in the same batch find each other
+    for document, embedding in zip(documents, embeddings):
+        writer.add(document['doc_id'], document['userid'], document['processed_bucket_key'], document['key'], embedding, versions['active'])
+    writer.flush()
+    
+    for document, embedding in zip(documents, embeddings):
+        finish_document(pg_conn, document, embedding, neighbor_count)
+    tracing.clear_context('doc_id')
+    
+    # a document arriving mid-backfill may land behind the backfill cursor, so it gets the new version here
+    for version in versions['backfilling']:
+        try:
+            for document, embedding in zip(documents, client.embed(texts, version)):
+                modelversions.store_version(pg_conn, document['doc_id'], document['userid'], version, embedding)
+            print(f"Stored {version} embeddings for {len(documents)} documents")
+        except Exception as e:
+            print(f"Error embedding documents with {version}: {str(e)}")
+    return len(documents)
 
 def setup_connections(config: ConfigParser):
     s3_client = boto3.client(
@@ -99,13 +185,16 @@ def setup_connections(config: ConfigParser):
         aws_secret_access_key=config.get('s3readwrite', 'aws_secret_access_key')
     )
     
-    mysql_conn = datatier.get_dbConn(
-        config.get('mysql', 'endpoint'),
-        int(config.get('mysql', 'port_number')),
-        config.get('mysql', 'user_name'),
-        config.get('mysql', 'user_pwd'),
-        config.get('mysql', 'db_name')
-    )
+    # only objects without stage metadata need MySQL; datatier reuses the container's connection
+    def connect_mysql():
+        with tracing.span('datatier.get_dbConn'):
+            return datatier.get_dbConn(
+                config.get('mysql', 'endpoint'),
+                int(config.get('mysql', 'port_number')),
+                config.get('mysql', 'user_name'),
+                config.get('mysql', 'user_pwd'),
+                config.get('mysql', 'db_name')
+            )
     
     pg_conn = psycopg.connect(
         f"host={config.get('postgres', 'endpoint')} "
@@ -113,29 +202,30 @@ def setup_connections(config: ConfigParser):
         f"dbname={config.get('postgres', 'db_name')} "
         f"user={config.get('postgres', 'user_name')} "
         f"password={config.get('postgres', 'user_pwd')}",
-        row_factory=dict_row,
+        row_factory=psycopg.rows.dict_row,
         autocommit=True   
     )
     
-    return s3_client, mysql_conn, pg_conn
+    return s3_client, connect_mysql, pg_conn
 
 def lambda_handler(event, context):
     print("Starting embedding generation")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-embeddings-handler', stage='embed')
     
     try:
-        config = ConfigParser()
-        config.read('organa-config.ini')
+        config = coldstart.load_config()
         
         openai.api_key = config.get('openai', 'api_key')
         
-        s3_client, mysql_conn, pg_conn = setup_connections(config)
+        with tracing.span('setup_connections'):
+            s3_client, connect_mysql, pg_conn = setup_connections(config)
         
         try:
-            for record in event['Records']:
-                bucket = record['s3']['bucket']['name']
-                key = record['s3']['object']['key']
-                print(f"Processing file from bucket: {bucket}, key: {key}")
-                process_document(s3_client, mysql_conn, pg_conn, bucket, key)
+            versions = modelversions.get_versions(pg_conn, config)
+            records = list(workqueue.iter_records(event))
+            writer = embeddingwriter.get_writer(pg_conn, config, quantization.dual_write_columns(config))
+            process_documents(s3_client, connect_mysql, pg_conn, embedclient.get_client(config), writer, records, neighbors.top_n(config), versions)
                 
             return {
                 'statusCode': 200,
@@ -143,7 +233,6 @@ def lambda_handler(event, context):
             }
             
         finally:
-            mysql_conn.close()
             pg_conn.close()
             print("Connections closed")
             
@@ -151,5 +240,6 @@ def lambda_handler(event, context):
         print(f"Fatal error: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
+            'body': json.dumps({'error': str(e)}),
+            'batchItemFailures': workqueue.all_items_failed(event)
         }
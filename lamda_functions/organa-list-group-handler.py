@@ -1,23 +1,47 @@
 import json
-import psycopg
-from psycopg.rows import dict_row
-from configparser import ConfigParser
+import coldstart
+import fastjson
+import httpcache
+import suggestions
+import tracing
 import os
 import traceback
-import uuid
-from datetime import datetime
 
-def convert_special_types(obj):
-    if isinstance(obj, (uuid.UUID, datetime)):
-        return str(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_special_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_special_types(item) for item in obj]
-    return obj
+psycopg = coldstart.lazy_import('psycopg')
+
+MAX_MEMBERS = 50
+
+def is_enabled(params, name):
+    return str(params.get(name, '')).lower() in ('1', 'true', 'yes')
+
+def groups_sql(include_counts, members):
+    # one pass over the user's assignments: counts and the first members of every group come back
+    # with the group rows instead of one request per group
+    columns = ''
+    if include_counts:
+        columns += ',\n                COUNT(a.doc_id) AS document_count'
+    if members:
+        columns += ",\n                COALESCE((ARRAY_AGG(a.doc_id ORDER BY a.assigned_at, a.doc_id) FILTER (WHERE a.doc_id IS NOT NULL))[1:%s], '{}') AS doc_ids"
+    if not columns:
+        return """
+            SELECT group_id, group_name, description, created_at
+            FROM document_groups
+            WHERE user_id = %s
+            ORDER BY created_at DESC;
+        """
+    return f"""
+            SELECT g.group_id, g.group_name, g.description, g.created_at{columns}
+            FROM document_groups g
+            LEFT JOIN document_group_assignments a ON a.group_id = g.group_id
+            WHERE g.user_id = %s
+            GROUP BY g.group_id
+            ORDER BY g.created_at DESC;
+        """
 
 def lambda_handler(event, context):
     print("**STARTING LIST GROUPS FUNCTION**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-list-group-handler', stage='api')
     print("Full Event:", json.dumps(event))
     
     try:
@@ -29,7 +53,6 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Missing userId in path parameters'})
             }
         
-        config = ConfigParser()
         config_path = 'organa-config.ini'
         
         if not os.path.exists(config_path):
@@ -39,7 +62,7 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': f'Configuration file {config_path} not found'})
             }
         
-        config.read(config_path)
+        config = coldstart.load_config(config_path)
         
         if not config.has_section('postgres'):
             print("ERROR: 'postgres' section missing in config")
@@ -72,7 +95,7 @@ def lambda_handler(event, context):
                 f"dbname={conn_params['dbname']} "
                 f"user={conn_params['user']} "
                 f"password={conn_params['password']}",
-                row_factory=dict_row,
+                row_factory=psycopg.rows.dict_row,
                 autocommit=True
             )
         except Exception as conn_err:
@@ -83,20 +106,71 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Failed to connect to database', 'details': str(conn_err)})
             }
         
+        params = event.get('queryStringParameters') or {}
+        include_suggestions = is_enabled(params, 'suggestions')
+        include_counts = is_enabled(params, 'counts')
         try:
-            select_sql = """
-                SELECT group_id, group_name, description, created_at
+            members = min(max(int(params.get('members', 0)), 0), MAX_MEMBERS)
+        except ValueError:
+            pg_conn.close()
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'members must be an integer'})
+            }
+        include_assignments = include_suggestions or include_counts or members > 0
+        
+        try:
+            # groups carry updated_at and the counts catch deletions; counts, members and suggestions
+            # also move with the assignments, and suggestions with the clusters
+            version_sql = """
+                SELECT COUNT(*) AS groups, MAX(updated_at) AS groups_updated
                 FROM document_groups
-                WHERE user_id = %s
-                ORDER BY created_at DESC;
+                WHERE user_id = %s;
+            """
+            assignments_version_sql = """
+                SELECT
+                    COUNT(*) AS assignments,
+                    MAX(a.assigned_at) AS assignments_updated
+                FROM document_group_assignments a
+                JOIN document_groups g ON g.group_id = a.group_id
+                WHERE g.user_id = %s;
             """
+            clusters_version_sql = """
+                SELECT MAX(updated_at) AS clusters_updated
+                FROM document_clusters
+                WHERE user_id = %s;
+            """
+            with pg_conn.cursor() as cur:
+                with tracing.span('psycopg.execute', query='groups_version'):
+                    cur.execute(version_sql, (user_id,))
+                    version = cur.fetchone()
+                version_parts = [version['groups'], str(version['groups_updated'])]
+                if include_assignments:
+                    with tracing.span('psycopg.execute', query='assignments_version'):
+                        cur.execute(assignments_version_sql, (user_id,))
+                        version = cur.fetchone()
+                    version_parts += [version['assignments'], str(version['assignments_updated'])]
+                if include_suggestions:
+                    with tracing.span('psycopg.execute', query='clusters_version'):
+                        cur.execute(clusters_version_sql, (user_id,))
+                        version = cur.fetchone()
+                    version_parts.append(str(version['clusters_updated']))
+            etag = httpcache.make_etag('groups', user_id, include_suggestions, include_counts, members, *version_parts)
+            if httpcache.is_not_modified(event, etag):
+                tracing.metric('NotModified', 1)
+                return httpcache.not_modified_response(etag)
+            
             with pg_conn.cursor() as cur:
-                cur.execute(select_sql, (user_id,))
+                with tracing.span('psycopg.execute', query='list_groups', counts=include_counts, members=members):
+                    cur.execute(groups_sql(include_counts, members), (members, user_id) if members else (user_id,))
                 groups = cur.fetchall()
                 
-                groups = convert_special_types(groups)
-                
                 print(f"Retrieved {len(groups)} groups for user {user_id}")
+            
+            group_suggestions = None
+            if include_suggestions:
+                group_suggestions = suggestions.get_suggestions(pg_conn, user_id)
+                print(f"Retrieved {len(group_suggestions)} group suggestions for user {user_id}")
                 
         except Exception as query_err:
             print(f"QUERY ERROR: {str(query_err)}")
@@ -108,12 +182,17 @@ def lambda_handler(event, context):
         finally:
             pg_conn.close()
         
+        body = {
+            'user_id': user_id,
+            'groups': groups
+        }
+        if group_suggestions is not None:
+            body['suggestions'] = group_suggestions
+        
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'user_id': user_id,
-                'groups': groups
-            })
+            'headers': {'ETag': etag},
+            'body': fastjson.dumps(body)
         }
         
     except Exception as e:
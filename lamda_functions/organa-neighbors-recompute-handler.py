@@ -0,0 +1,71 @@
+import json
+import coldstart
+import neighbors
+import tracing
+
+psycopg = coldstart.lazy_import('psycopg')
+
+# stop picking up new users when less than this much of the invocation is left
+TIME_RESERVE_MS = 30 * 1000
+
+def lambda_handler(event, context):
+    print("**STARTING RELATED DOCUMENTS RECOMPUTE**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-neighbors-recompute-handler', stage='neighbors')
+    print("Event:", json.dumps(event))
+    
+    try:
+        config = coldstart.load_config()
+        n = neighbors.top_n(config)
+        
+        with tracing.span('psycopg.connect'):
+            pg_conn = psycopg.connect(
+                f"host={config.get('postgres', 'endpoint')} "
+                f"port={config.get('postgres', 'port_number')} "
+                f"dbname={config.get('postgres', 'db_name')} "
+                f"user={config.get('postgres', 'user_name')} "
+                f"password={config.get('postgres', 'user_pwd')}",
+                row_factory=psycopg.rows.dict_row,
+                autocommit=True
+            )
+        
+        try:
+            # either one user, or every user after the `start_after` cursor returned by a previous run
+            if event.get('user_id'):
+                user_ids = [str(event['user_id'])]
+            else:
+                with pg_conn.cursor() as cur, tracing.span('psycopg.execute', query='neighbor_users'):
+                    cur.execute(
+                        "SELECT DISTINCT user_id FROM document_embeddings WHERE user_id > %s ORDER BY user_id",
+                        (str(event.get('start_after', '')),)
+                    )
+                    user_ids = [row['user_id'] for row in cur.fetchall()]
+            
+            recomputed = []
+            next_user = None
+            for user_id in user_ids:
+                if context is not None and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+                    next_user = recomputed[-1] if recomputed else event.get('start_after', '')
+                    break
+                rows = neighbors.recompute_user(pg_conn, user_id, n)
+                print(f"Recomputed {rows} neighbor entries for user {user_id}")
+                recomputed.append(user_id)
+        finally:
+            pg_conn.close()
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'recomputed_users': len(recomputed),
+                'top_n': n,
+                'complete': next_user is None,
+                'start_after': next_user
+            })
+        }
+        
+    except Exception as e:
+        print(f"Error recomputing related documents: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -1,15 +1,23 @@
 import json
-import boto3
 import os
 import uuid
 import datatier   
-from configparser import ConfigParser
-from PIL import Image, ImageEnhance, ImageOps
+import uploads
+import previews
+import workqueue
+import stagestate
+import coldstart
+import tracing
 from io import BytesIO
-import fitz  
 import pathlib
 import re
 
+boto3 = coldstart.lazy_import('boto3')
+Image = coldstart.lazy_import('PIL.Image')
+ImageEnhance = coldstart.lazy_import('PIL.ImageEnhance')
+ImageOps = coldstart.lazy_import('PIL.ImageOps')
+fitz = coldstart.lazy_import('fitz')
+
 UUID_REGEX = re.compile(
     r'[0-9a-fA-F]{8}-'
     r'[0-9a-fA-F]{4}-'
@@ -31,8 +39,8 @@ def pdf_page_to_pil(page):
     img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
     return img
 
-def process_pdf(pdf_bytes):
-  
+def process_pdf(pdf_bytes, on_page=None):
+    # on_page(index, img) sees each page image once it is in the output PDF, e.g. to render previews without rasterizing again
     try:
         input_pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
         if input_pdf.page_count == 0:
@@ -42,30 +50,35 @@ def process_pdf(pdf_bytes):
         
         for index, page in enumerate(input_pdf):
             try:
-                img = pdf_page_to_pil(page)
-                
-                img = ImageOps.exif_transpose(img)
-                
-                img = ImageOps.grayscale(img)
-                
-                img = ImageOps.autocontrast(img, cutoff=0.5)
-                
-                img = ImageEnhance.Sharpness(img).enhance(1.5)
-                img = ImageEnhance.Contrast(img).enhance(1.2)
-                
-                img = ImageEnhance.Brightness(img).enhance(1.1)
-                
-                new_width, new_height = img.width // 2, img.height // 2
-                img = img.resize((new_width, new_height))
-                
-                temp_img_path = f"/tmp/{uuid.uuid4()}.png"
-                img.save(temp_img_path, "PNG")
-                
-                rect = fitz.Rect(0, 0, img.width, img.height)
-                opage = output_pdf.new_page(width=img.width, height=img.height)
-                opage.insert_image(rect, filename=temp_img_path)
-                
-                os.remove(temp_img_path)
+                with tracing.span('pdf.enhance_page', page=index):
+                    img = pdf_page_to_pil(page)
+                    
+                    img = ImageOps.exif_transpose(img)
+                    
+                    img = ImageOps.grayscale(img)
+                    
+                    img = ImageOps.autocontrast(img, cutoff=0.5)
+                    
+                    img = ImageEnhance.Sharpness(img).enhance(1.5)
+                    img = ImageEnhance.Contrast(img).enhance(1.2)
+                    
+                    img = ImageEnhance.Brightness(img).enhance(1.1)
+                    
+                    new_width, new_height = img.width // 2, img.height // 2
+                    img = img.resize((new_width, new_height))
+                    
+                    temp_img_path = f"/tmp/{uuid.uuid4()}.png"
+                    img.save(temp_img_path, "PNG")
+                    
+                    rect = fitz.Rect(0, 0, img.width, img.height)
+                    opage = output_pdf.new_page(width=img.width, height=img.height)
+                    opage.insert_image(rect, filename=temp_img_path)
+                    
+                    os.remove(temp_img_path)
+                    
+                    # numbered by output page, so a page dropped above never shifts the previews
+                    if on_page:
+                        on_page(output_pdf.page_count - 1, img)
             
             except Exception as img_proc_err:
                 print(f"Error processing page {index}: {str(img_proc_err)}")
@@ -80,13 +93,14 @@ def process_pdf(pdf_bytes):
 def lambda_handler(event, context):
     try:
         print("**STARTING ORGANA PDF PROCESSOR**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-pdf-processing-handler', stage='process')
         print("Event:", json.dumps(event))
         
         config_file = 'organa-config.ini'
         os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
         
-        configur = ConfigParser()
-        configur.read(config_file)
+        configur = coldstart.load_config(config_file)
         
         s3_profile = 's3readwrite'
         boto3.setup_default_session(profile_name=s3_profile)
@@ -101,11 +115,17 @@ def lambda_handler(event, context):
         
         s3_client = boto3.client('s3')
         
-        dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
         
-        for record in event['Records']:
-            bucket = record['s3']['bucket']['name']
-            key = record['s3']['object']['key']
+        orchestrator = workqueue.from_config(configur)
+        
+        # records that failed for a reason a retry can fix; permanent failures and skips are acknowledged
+        failed = []
+        for record in workqueue.iter_records(event):
+            tracing.clear_context('doc_id')
+            bucket = record['bucket']
+            key = record['key']
             
             if not key.startswith('organa-original/'):
                 print(f"Skipping file not in organa-original/: {key}")
@@ -117,153 +137,105 @@ def lambda_handler(event, context):
                 
             print(f"Processing PDF file: {key}")
             
-            try:
-                doc_id = extract_doc_id(key)
-                if not doc_id:
-                    raise ValueError("UUID not found in the key.")
-                print(f"Extracted doc_id: {doc_id}")
-            except ValueError as ve:
-                print(f"Invalid key format, cannot extract doc_id: {key}. Error: {str(ve)}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE original_bucket_key = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', key])
-                    print(f"Updated status to 'failed' for key: {key}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for key {key}: {str(update_err)}")
+            doc_id = record['doc_id'] or extract_doc_id(key)
+            if not doc_id:
+                print(f"Invalid key format, cannot extract doc_id: {key}")
+                stagestate.fail_by_key(dbConn, 'process', 'original_bucket_key', key, "UUID not found in the key.")
                 continue
+            print(f"Extracted doc_id: {doc_id}")
+            tracing.set_context(doc_id=doc_id)
             
-            sql_check = "SELECT COUNT(*) FROM documents WHERE doc_id = %s;"
-            count = datatier.retrieve_one_row(dbConn, sql_check, [doc_id])
-            print(f"Number of records with doc_id {doc_id}: {count[0]}")
-            if count[0] == 0:
-                print(f"No records found with doc_id: {doc_id}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE original_bucket_key = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', key])
-                    print(f"Updated status to 'failed' for key: {key}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for key {key}: {str(update_err)}")
-                continue
+            processed_key = key.replace('organa-original/', 'organa-processed/')
+            print(f"Processed S3 Bucket Key: {processed_key}")
             
-            sql_update_status = """
-            UPDATE documents 
-            SET status = %s, processed_date = NOW() 
-            WHERE doc_id = %s;
-            """
             try:
-                affected_rows = datatier.perform_action(dbConn, sql_update_status, ['processing', doc_id])
-                print(f"Rows affected by status update to 'processing': {affected_rows}")
-                if affected_rows == 0:
-                    print(f"No rows updated for doc_id: {doc_id}")
+                action = stagestate.begin_stage(dbConn, s3_client, 'process', doc_id, bucket, processed_key)
             except Exception as e:
                 print(f"Exception during status update to 'processing' for doc_id {doc_id}: {str(e)}")
-                continue  
+                failed.append(record)
+                continue
+            
+            if action == stagestate.MISSING:
+                # the row can commit after the object lands (an upload still in flight), so give it a few deliveries
+                if workqueue.can_redeliver(record, stagestate.MAX_ATTEMPTS):
+                    print(f"No record yet for doc_id {doc_id}, retrying (receive {record['receive_count']})")
+                    failed.append(record)
+                    continue
+                print(f"No records found with doc_id: {doc_id}")
+                stagestate.fail_by_key(dbConn, 'process', 'original_bucket_key', key, "No document record for doc_id.")
+                continue
+            if action == stagestate.BUSY:
+                continue
             
-            download_path = f"/tmp/{uuid.uuid4()}.pdf"
+            if action == stagestate.SKIP:
+                if orchestrator:
+                    orchestrator.advance('process', record, processed_key, doc_id)
+                continue
+            
+            # one GET returns both the bytes and the metadata the upload attached
             try:
-                s3_client.download_file(bucket, key, download_path)
-                print(f"Downloaded file to {download_path}")
+                with tracing.span('s3.get_object'):
+                    response = s3_client.get_object(Bucket=bucket, Key=key)
+                    original_bytes = response['Body'].read()
+                metadata = response.get('Metadata', {})
+                print(f"Downloaded {key} ({len(original_bytes)} bytes)")
             except Exception as download_err:
                 print(f"Error downloading file {key}: {str(download_err)}")
-                # Update status to 'failed'
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE doc_id = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                stagestate.fail_stage(dbConn, 'process', doc_id, download_err)
+                failed.append(record)
                 continue
             
             try:
-                with open(download_path, 'rb') as file:
-                    processed_bytes = process_pdf(file.read())
+                collector = previews.PreviewCollector(configur.getint('previews', 'max_pages', fallback=previews.DEFAULT_MAX_PAGES))
+                with tracing.span('pdf.process_pdf') as pdf_span:
+                    processed_bytes = process_pdf(original_bytes, collector)
+                    pdf_span['output_bytes'] = len(processed_bytes)
                 print(f"Processed PDF and generated output bytes")
             except Exception as process_err:
-                print(f"Error processing PDF {download_path}: {str(process_err)}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE doc_id = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                print(f"Error processing PDF {key}: {str(process_err)}")
+                stagestate.fail_stage(dbConn, 'process', doc_id, process_err)
+                failed.append(record)
                 continue
             
-            processed_key = key.replace('organa-original/', 'organa-processed/')
-            print(f"Processed S3 Bucket Key: {processed_key}")
-            
             try:
-                s3_client.put_object(
-                    Bucket=bucket,
-                    Key=processed_key,
-                    Body=processed_bytes,
-                    ContentType='application/pdf'
-                )
+                with tracing.span('s3.put_object'):
+                    s3_client.put_object(
+                        Bucket=bucket,
+                        Key=processed_key,
+                        Body=processed_bytes,
+                        ContentType='application/pdf',
+                        Metadata=uploads.object_metadata(doc_id, metadata.get(uploads.METADATA_USER_ID))
+                    )
                 print(f"Uploaded processed PDF to {processed_key}")
             except Exception as upload_err:
                 print(f"Error uploading processed file {processed_key}: {str(upload_err)}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE doc_id = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                stagestate.fail_stage(dbConn, 'process', doc_id, upload_err)
+                failed.append(record)
                 continue
             
-            sql_update_processed = """
-            UPDATE documents 
-            SET processed_bucket_key = %s, status = %s 
-            WHERE doc_id = %s;
-            """
+            preview_pages = previews.store_previews(s3_client, bucket, key, collector, doc_id, metadata.get(uploads.METADATA_USER_ID))
+            print(f"Stored thumbnail and {preview_pages} page previews under {previews.preview_prefix(key)}")
+            
             try:
-                affected_rows = datatier.perform_action(dbConn, sql_update_processed, [processed_key, 'processed', doc_id])
+                affected_rows = stagestate.complete_stage(dbConn, 'process', doc_id, processed_key, {'preview_pages': preview_pages})
                 print(f"Rows affected by processing update: {affected_rows}")
                 if affected_rows == 0:
                     print(f"No rows updated for doc_id: {doc_id}")
             except Exception as e:
                 print(f"Exception during processing update for doc_id {doc_id}: {str(e)}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE doc_id = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                stagestate.fail_stage(dbConn, 'process', doc_id, e)
+                failed.append(record)
                 continue
             
-            try:
-                os.remove(download_path)
-                print(f"Removed temporary file {download_path}")
-            except Exception as remove_err:
-                print(f"Error removing temporary file {download_path}: {str(remove_err)}")
+            if orchestrator:
+                orchestrator.advance('process', record, processed_key, doc_id)
             
             print(f"Successfully processed and uploaded: {processed_key}")
         
         return {
             'statusCode': 200,
-            'body': json.dumps({'message': 'PDF processing complete'})
+            'body': json.dumps({'message': 'PDF processing complete', 'failed': len(failed)}),
+            'batchItemFailures': workqueue.batch_item_failures(failed)
         }
         
     except Exception as err:
@@ -271,5 +243,6 @@ def lambda_handler(event, context):
         print(str(err))
         return {
             'statusCode': 500,
-            'body': json.dumps({"error": str(err)})
+            'body': json.dumps({"error": str(err)}),
+            'batchItemFailures': workqueue.all_items_failed(event)
         }
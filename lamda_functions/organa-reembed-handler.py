@@ -0,0 +1,166 @@
+import json
+import coldstart
+import embedclient
+import modelversions
+import quantization
+import textcodec
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
+openai = coldstart.lazy_import('openai')
+psycopg = coldstart.lazy_import('psycopg')
+
+# stop starting new batches when less than this much of the invocation is left
+TIME_RESERVE_MS = 60 * 1000
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TOKENS_PER_MINUTE = 150000
+
+def embed_batch(rows, texts, version, client):
+    # one call per batch; a rejected batch falls back to one call per document so a single bad text only fails itself
+    try:
+        embeddings = client.embed(texts, version)
+    except Exception as e:
+        print(f"Batch of {len(texts)} failed ({str(e)}), retrying documents one by one")
+        embeddings = []
+        for row, text in zip(rows, texts):
+            try:
+                embeddings.append(client.embed_one(text, version))
+            except Exception as e:
+                print(f"Error re-embedding {row['doc_id']} with {version}: {str(e)}")
+                embeddings.append(None)
+
+    embedded = []
+    for row, embedding in zip(rows, embeddings):
+        if embedding is None:
+            continue
+        if len(embedding) != quantization.DIMENSIONS:
+            raise ValueError(f"{version} returned {len(embedding)} dimensions, document_embeddings stores {quantization.DIMENSIONS}")
+        embedded.append({**row, 'embedding': embedding})
+    return embedded
+
+def backfill(pg_conn, s3_client, bucketname, version, config, context):
+    checkpoint = modelversions.get_checkpoint(pg_conn, version)
+    if checkpoint is None:
+        raise ValueError(f"No backfill started for {version}")
+
+    batch_size = config.getint('reembed', 'batch_size', fallback=DEFAULT_BATCH_SIZE)
+    # the backfill's budget is separate from (and by default much smaller than) the request path's
+    client = embedclient.get_client(config, 'reembed', DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+
+    last_doc_id = str(checkpoint['last_doc_id'])
+    embedded = failed = 0
+    while True:
+        if context is not None and context.get_remaining_time_in_millis() < TIME_RESERVE_MS:
+            return {'embedded': embedded, 'failed': failed, 'complete': False, 'last_doc_id': last_doc_id}
+
+        rows = modelversions.next_batch(pg_conn, version, last_doc_id, batch_size)
+        if not rows:
+            modelversions.finish_backfill(pg_conn, version)
+            return {'embedded': embedded, 'failed': failed, 'complete': True, 'last_doc_id': last_doc_id}
+
+        texts = []
+        for row in rows:
+            with tracing.span('s3.get_object'):
+                response = s3_client.get_object(Bucket=bucketname, Key=row['extractedtextpath'])
+                texts.append(textcodec.read_text(response))
+
+        batch = embed_batch(rows, texts, version, client)
+        last_doc_id = str(rows[-1]['doc_id'])
+        modelversions.save_batch(pg_conn, version, batch, last_doc_id, len(rows) - len(batch))
+        embedded += len(batch)
+        failed += len(rows) - len(batch)
+        print(f"Re-embedded {len(batch)}/{len(rows)} documents with {version} (through {last_doc_id})")
+
+def lambda_handler(event, context):
+    print("**STARTING RE-EMBEDDING**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-reembed-handler', stage='embed')
+    print("Event:", json.dumps(event))
+
+    try:
+        config = coldstart.load_config()
+        action = event.get('action', 'backfill')
+
+        with tracing.span('psycopg.connect'):
+            pg_conn = psycopg.connect(
+                f"host={config.get('postgres', 'endpoint')} "
+                f"port={config.get('postgres', 'port_number')} "
+                f"dbname={config.get('postgres', 'db_name')} "
+                f"user={config.get('postgres', 'user_name')} "
+                f"password={config.get('postgres', 'user_pwd')}",
+                row_factory=psycopg.rows.dict_row,
+                autocommit=True
+            )
+
+        try:
+            versions = modelversions.get_versions(pg_conn, config)
+            version = event.get('model_version') or (versions['backfilling'][0] if versions['backfilling'] else None)
+            try:
+                if action != 'status':
+                    modelversions.validate(version)
+                if action == 'start' and version == versions['active']:
+                    raise ValueError(f"{version} is already the active version")
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': str(e)})
+                }
+
+            if action == 'start':
+                modelversions.start_backfill(pg_conn, version)
+                result = {'model_version': version, 'status': 'backfilling'}
+
+            elif action == 'backfill':
+                openai.api_key = config.get('openai', 'api_key')
+                s3_client = boto3.client(
+                    's3',
+                    region_name=config.get('s3readwrite', 'region_name'),
+                    aws_access_key_id=config.get('s3readwrite', 'aws_access_key_id'),
+                    aws_secret_access_key=config.get('s3readwrite', 'aws_secret_access_key')
+                )
+                result = backfill(pg_conn, s3_client, config.get('s3', 'bucket_name'), version, config, context)
+                result['model_version'] = version
+
+            elif action == 'cutover':
+                missing = modelversions.count_missing(pg_conn, version)
+                if missing and not event.get('force'):
+                    return {
+                        'statusCode': 409,
+                        'body': json.dumps({'error': f"{missing} documents have no {version} embedding yet", 'missing': missing})
+                    }
+                swapped = modelversions.cutover(pg_conn, version, quantization.dual_write_columns(config))
+                # neighbor lists still hold old-space similarities until organa-neighbors-recompute-handler runs
+                result = {'model_version': version, 'status': 'active', 'swapped': swapped, 'missing': missing}
+
+            elif action == 'status':
+                result = {'active': versions['active'], 'backfilling': {}}
+                for name in versions['backfilling']:
+                    checkpoint = modelversions.get_checkpoint(pg_conn, name) or {}
+                    result['backfilling'][name] = {
+                        'embedded': checkpoint.get('embedded', 0),
+                        'failed': checkpoint.get('failed', 0),
+                        'complete': checkpoint.get('completed_at') is not None,
+                        'missing': modelversions.count_missing(pg_conn, name)
+                    }
+
+            else:
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': f"Unknown action: {action}"})
+                }
+        finally:
+            pg_conn.close()
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps(result)
+        }
+
+    except Exception as e:
+        print(f"Error re-embedding documents: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -0,0 +1,81 @@
+import json
+import coldstart
+import neighbors
+import tracing
+
+psycopg = coldstart.lazy_import('psycopg')
+
+MAX_LIMIT = 50
+
+def parse_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def lambda_handler(event, context):
+    print("**STARTING RELATED DOCUMENTS FUNCTION**")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-related-documents-handler', stage='api')
+    print("Event:", json.dumps(event))
+    
+    try:
+        doc_id = (event.get('pathParameters') or {}).get('docid')
+        if not doc_id:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Missing docId in path parameters'})
+            }
+        
+        params = event.get('queryStringParameters') or {}
+        try:
+            limit = parse_limit(params.get('limit', neighbors.DEFAULT_TOP_N))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+        tracing.set_context(doc_id=doc_id)
+        
+        config = coldstart.load_config()
+        
+        with tracing.span('psycopg.connect'):
+            pg_conn = psycopg.connect(
+                f"host={config.get('postgres', 'endpoint')} "
+                f"port={config.get('postgres', 'port_number')} "
+                f"dbname={config.get('postgres', 'db_name')} "
+                f"user={config.get('postgres', 'user_name')} "
+                f"password={config.get('postgres', 'user_pwd')}",
+                row_factory=psycopg.rows.dict_row,
+                autocommit=True
+            )
+        
+        try:
+            related = neighbors.get_neighbors(pg_conn, doc_id, limit)
+        finally:
+            pg_conn.close()
+        
+        print(f"Found {len(related)} related documents for {doc_id}")
+        
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'doc_id': doc_id,
+                'related': related,
+                'total_results': len(related)
+            })
+        }
+        
+    except Exception as e:
+        print(f"Error retrieving related documents: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -0,0 +1,97 @@
+import json
+import os
+import datetime
+import datatier
+import stagestate
+import workqueue
+import coldstart
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
+
+def retrigger(s3_client, bucketname, key):
+    # copying the object onto itself fires a fresh ObjectCreated event for the S3-prefix triggers
+    head = s3_client.head_object(Bucket=bucketname, Key=key)
+    metadata = dict(head.get('Metadata', {}))
+    metadata['resumed-at'] = datetime.datetime.utcnow().isoformat()
+    # REPLACE drops every system header not passed again; compressed extracted text keeps its ContentEncoding
+    extra = {'ContentEncoding': head['ContentEncoding']} if head.get('ContentEncoding') else {}
+    with tracing.span('s3.copy_object'):
+        s3_client.copy_object(
+            Bucket=bucketname,
+            Key=key,
+            CopySource={'Bucket': bucketname, 'Key': key},
+            ContentType=head.get('ContentType', 'application/octet-stream'),
+            Metadata=metadata,
+            MetadataDirective='REPLACE',
+            **extra
+        )
+
+def lambda_handler(event, context):
+    try:
+        print("**STARTING ORGANA RESUME HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-resume-handler', stage='resume')
+        print("Event:", json.dumps(event))
+        
+        config_file = 'organa-config.ini'
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+        
+        configur = coldstart.load_config(config_file)
+        
+        s3_profile = 's3readwrite'
+        boto3.setup_default_session(profile_name=s3_profile)
+        
+        bucketname = configur.get('s3', 'bucket_name')
+        s3_client = boto3.client('s3')
+        
+        rds_endpoint = configur.get('rds', 'endpoint')
+        rds_portnum = int(configur.get('rds', 'port_number'))
+        rds_username = configur.get('rds', 'user_name')
+        rds_pwd = configur.get('rds', 'user_pwd')
+        rds_dbname = configur.get('rds', 'db_name')
+        
+        doc_id = event.get("pathParameters", {}).get("docid")
+        if not doc_id:
+            raise ValueError("Missing required parameter: docid")
+        
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        
+        result = stagestate.resume(dbConn, s3_client, bucketname, doc_id)
+        if result is None:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({"error": "Document not found"})
+            }
+        
+        if result['next_stage'] is None:
+            return {
+                'statusCode': 409,
+                'body': json.dumps({"error": "No stored artifact to resume from", "doc_id": doc_id})
+            }
+        
+        orchestrator = workqueue.from_config(configur)
+        if orchestrator and result['next_stage'] in orchestrator.queues:
+            orchestrator.enqueue(result['next_stage'], bucketname, result['key'], doc_id, workqueue.PRIORITY_INTERACTIVE)
+        else:
+            retrigger(s3_client, bucketname, result['key'])
+        
+        print(f"Document {doc_id} resumed at stage '{result['next_stage']}'")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                "message": "Document resumed",
+                "doc_id": doc_id,
+                "status": result['status'],
+                "resumed_stage": result['next_stage']
+            })
+        }
+    
+    except Exception as err:
+        print("**ERROR**")
+        print(str(err))
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": str(err)})
+        }
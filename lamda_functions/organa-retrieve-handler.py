@@ -1,15 +1,27 @@
 
 import json
+import os
 import datatier
-from configparser import ConfigParser
+import previews
+import httpcache
+import coldstart
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
 
 def lambda_handler(event, context):
     try:
         print("**STARTING ORGANA DOCUMENT LIST HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-retrieve-handler', stage='api')
         
         config_file = 'organa-config.ini'
-        configur = ConfigParser()
-        configur.read(config_file)
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+        configur = coldstart.load_config(config_file)
+        
+        boto3.setup_default_session(profile_name='s3readwrite')
+        s3_client = boto3.client('s3')
+        bucketname = configur.get('s3', 'bucket_name')
         
         rds_endpoint = configur.get('rds', 'endpoint')
         rds_portnum = int(configur.get('rds', 'port_number'))
@@ -17,33 +29,53 @@ def lambda_handler(event, context):
         rds_pwd = configur.get('rds', 'user_pwd')
         rds_dbname = configur.get('rds', 'db_name')
         
-        dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
         
         userid = event.get("pathParameters", {}).get("userid")
         
         if not userid:
             raise ValueError("Missing required parameter: userid")
         
+        # one index-only read on (userid, updated_at): every status change moves updated_at and
+        # the count catches deletions, so an unchanged library is answered without listing it
+        with tracing.span('datatier.retrieve_one_row', query='documents_version'):
+            version = datatier.retrieve_one_row(dbConn, """
+                SELECT COUNT(*), MAX(updated_at)
+                FROM documents
+                WHERE userid = %s;
+            """, [userid])
+        # thumbnailUrls are presigned, so a cached list is also stale once they expire
+        etag = httpcache.make_etag('documents', userid, version[0], str(version[1]),
+                                   httpcache.expiry_window(previews.PRESIGNED_URL_EXPIRY))
+        if httpcache.is_not_modified(event, etag):
+            tracing.metric('NotModified', 1)
+            return httpcache.not_modified_response(etag)
+        
         sql = """
-            SELECT doc_id, original_bucket_key, upload_date, status
+            SELECT doc_id, original_bucket_key, upload_date, status, preview_pages
             FROM documents
             WHERE userid = %s
             ORDER BY upload_date DESC;
         """
-        rows = datatier.retrieve_all_rows(dbConn, sql, [userid])
-        
-        documents = [
-            {
-                "documentid": row[0],
-                "originaldatafile": row[1],
-                "upload_date": row[2].strftime("%Y-%m-%d %H:%M:%S"),
-                "status": row[3]
-            }
-            for row in rows
-        ]
+        # rows are streamed off the connection rather than buffered, so large libraries stay flat in memory
+        with tracing.span('datatier.stream_rows') as stream_span:
+            documents = [
+                {
+                    "documentid": row[0],
+                    "originaldatafile": row[1],
+                    "upload_date": row[2].strftime("%Y-%m-%d %H:%M:%S"),
+                    "status": row[3],
+                    # a presigned thumbnail URL (signed locally) instead of anything fetched from S3
+                    "thumbnailUrl": previews.preview_url(s3_client, bucketname, previews.thumbnail_key(row[1])) if row[4] else None
+                }
+                for row in datatier.stream_rows(dbConn, sql, [userid])
+            ]
+            stream_span['rows'] = len(documents)
         
         return {
             "statusCode": 200,
+            "headers": {"ETag": etag},
             "body": json.dumps({"documents": documents})
         }
     except Exception as e:
@@ -1,25 +1,26 @@
 import json
 import os
 from typing import List, Dict
-import numpy as np
-import openai
-import psycopg
-from psycopg.rows import dict_row
-from configparser import ConfigParser
+import coldstart
+import datatier
+import embedclient
+import enrichment
+import modelversions
+import quantization
+import searchcache
+import tracing
 
-def create_embedding(text: str) -> List[float]:
-    response = openai.Embedding.create(
-        input=text,
-        model="text-embedding-ada-002"
-    )
-    return response.data[0].embedding
+boto3 = coldstart.lazy_import('boto3')
+np = coldstart.lazy_import('numpy')
+openai = coldstart.lazy_import('openai')
+psycopg = coldstart.lazy_import('psycopg')
 
 def cosine_similarity(a: List[float], b: List[float]) -> float:
     a = np.array(a)
     b = np.array(b)
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def search_documents(conn, user_id: str, query_embedding: List[float], limit: int = 5, similarity_threshold: float = 0.2) -> List[Dict]:
+def search_documents(conn, user_id: str, query_embedding: List[float], limit: int = 5, similarity_threshold: float = 0.2, include_groups: bool = False, mode: str = 'float', model_version: str = modelversions.DEFAULT_MODEL) -> List[Dict]:
     check_user_sql = """
     SELECT COUNT(*) as embedding_count 
     FROM document_embeddings 
@@ -27,7 +28,7 @@ def search_documents(conn, user_id: str, query_embedding: List[float], limit: in
     """
     
     try:
-        with conn.cursor() as cur:
+        with conn.cursor() as cur, tracing.span('psycopg.execute', query='user_embedding_count'):
             cur.execute(check_user_sql, (user_id,))
             user_embedding_count = cur.fetchone()['embedding_count']
             print(f"Total embeddings for user {user_id}: {user_embedding_count}")
@@ -36,15 +37,24 @@ def search_documents(conn, user_id: str, query_embedding: List[float], limit: in
                 print(f"No embeddings found for user {user_id}")
                 return []
 
-        sql = """
+        # only vectors from the query's model are comparable with it
+        if mode == 'float':
+            source = "document_embeddings\n            WHERE user_id = %s AND model_version = %s"
+            source_parameters = (user_id, model_version)
+        else:
+            # compact column picks the candidates, the float vectors re-rank them
+            source = f"({quantization.candidates_sql(mode)}) candidates"
+            candidate_limit = limit * quantization.RERANK_FACTOR[mode]
+            source_parameters = (user_id, model_version, query_embedding, candidate_limit)
+        
+        sql = f"""
         WITH similarity_scores AS (
             SELECT 
                 doc_id,
                 processeddatafile,
                 extractedtextpath,
                 1 - (embedding <-> %s::vector) AS similarity
-            FROM document_embeddings
-            WHERE user_id = %s
+            FROM {source}
         )
         SELECT 
             doc_id,
@@ -56,26 +66,87 @@ def search_documents(conn, user_id: str, query_embedding: List[float], limit: in
         ORDER BY similarity DESC
         LIMIT %s
         """
+        parameters = (query_embedding,) + source_parameters + (similarity_threshold, limit)
+        
+        if include_groups:
+            sql = f"""
+            WITH top_hits AS ({sql})
+            SELECT 
+                t.doc_id,
+                t.processeddatafile,
+                t.extractedtextpath,
+                t.similarity,
+                COALESCE(g.groups, '[]'::json) AS groups
+            FROM top_hits t
+            {enrichment.groups_lateral('t')}
+            ORDER BY t.similarity DESC
+            """
+            parameters += (user_id,)
         
-        with conn.cursor() as cur:
-            cur.execute(sql, (query_embedding, user_id, similarity_threshold, limit))
-            results = cur.fetchall()
+        short = False
+        with conn.cursor() as cur, tracing.span('psycopg.execute', query='similarity_search') as search_span:
+            if mode == 'float':
+                cur.execute(sql, parameters)
+                results = cur.fetchall()
+            else:
+                with conn.transaction():
+                    quantization.configure_scan(cur, candidate_limit)
+                    cur.execute(sql, parameters)
+                    results = cur.fetchall()
+                    # a short result is either the threshold at work or a filtered scan that ran dry
+                    if len(results) < limit:
+                        cur.execute(quantization.candidate_count_sql(mode), source_parameters)
+                        candidates = cur.fetchone()['candidates']
+                        short = candidates < min(candidate_limit, user_embedding_count)
             
+            search_span['rows'] = len(results)
             print(f"Returned {len(results)} results with threshold {similarity_threshold}")
-            for result in results:
-                print(f"Result - File: {result['processeddatafile']}, Similarity: {result['similarity']}")
+        
+        if short:
+            print(f"Compact index returned {candidates} of {candidate_limit} candidates, falling back to exact search")
+            tracing.metric('ExactSearchFallback', 1, mode=mode)
+            return search_documents(conn, user_id, query_embedding, limit, similarity_threshold, include_groups, 'float', model_version)
             
-        return [{
-            'doc_id': str(row['doc_id']),
-            'file_path': row['processeddatafile'],
-            'extracted_text_path': row['extractedtextpath'],
-            'similarity_score': float(row['similarity'])
-        } for row in results]
+        hits = []
+        for row in results:
+            hit = {
+                'doc_id': str(row['doc_id']),
+                'file_path': row['processeddatafile'],
+                'extracted_text_path': row['extractedtextpath'],
+                'similarity_score': float(row['similarity'])
+            }
+            if include_groups:
+                hit['groups'] = row['groups']
+            hits.append(hit)
+        return hits
     except Exception as e:
         print(f"Error in search_documents: {str(e)}")
         raise
+
+def enrich_results(config, user_id: str, query: str, results: List[Dict], fields: set):
+    if 'document' in fields and results:
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(
+                config.get('rds', 'endpoint'),
+                int(config.get('rds', 'port_number')),
+                config.get('rds', 'user_name'),
+                config.get('rds', 'user_pwd'),
+                config.get('rds', 'db_name')
+            )
+        details = enrichment.get_document_details(dbConn, user_id, [result['doc_id'] for result in results])
+        for result in results:
+            result['document'] = details.get(result['doc_id'])
+    
+    if 'snippet' in fields and results:
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = 'organa-config.ini'
+        boto3.setup_default_session(profile_name='s3readwrite')
+        s3_client = boto3.client('s3')
+        enrichment.add_snippets(s3_client, config.get('s3', 'bucket_name'), results, query)
+
 def lambda_handler(event, context):
     print("Starting document search")
+    tracing.clear_context()
+    tracing.set_context(handler='organa-search-handler', stage='search')
     
     try:
         if 'pathParameters' not in event or 'userid' not in event['pathParameters']:
@@ -98,33 +169,55 @@ def lambda_handler(event, context):
         limit = int(params.get('limit', 5))
         similarity_threshold = float(params.get('threshold', 0.1))  
         
-        config = ConfigParser()
-        config.read('organa-config.ini')
+        try:
+            fields = enrichment.parse_fields(params.get('fields'))
+            mode = quantization.search_mode(coldstart.load_config(), params.get('mode'))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+        
+        config = coldstart.load_config()
         
         openai.api_key = config.get('openai', 'api_key')
         
-        pg_conn = psycopg.connect(
-            f"host={config.get('postgres', 'endpoint')} "
-            f"port={config.get('postgres', 'port_number')} "
-            f"dbname={config.get('postgres', 'db_name')} "
-            f"user={config.get('postgres', 'user_name')} "
-            f"password={config.get('postgres', 'user_pwd')}",
-            row_factory=dict_row,
-            autocommit=True
-        )
+        with tracing.span('psycopg.connect'):
+            pg_conn = psycopg.connect(
+                f"host={config.get('postgres', 'endpoint')} "
+                f"port={config.get('postgres', 'port_number')} "
+                f"dbname={config.get('postgres', 'db_name')} "
+                f"user={config.get('postgres', 'user_name')} "
+                f"password={config.get('postgres', 'user_pwd')}",
+                row_factory=psycopg.rows.dict_row,
+                autocommit=True
+            )
         
         try:
-            query_embedding = create_embedding(query)
-            print(f"Generated query embedding for: {query}")
-            print(f"Embedding length: {len(query_embedding)}")
-            print(f"First few embedding values: {query_embedding[:10]}")
+            model_version = modelversions.get_versions(pg_conn, config)['active']
             
-            with pg_conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) as total_embeddings FROM document_embeddings")
-                total_embeddings = cur.fetchone()['total_embeddings']
-                print(f"Total embeddings in database: {total_embeddings}")
+            # the corpus version is read fresh every time, so a cached entry is never served after a write
+            cache = searchcache.get_cache(config)
+            corpus_version = searchcache.get_corpus_version(pg_conn, user_id)
+            cache_key = (user_id, searchcache.normalize_query(query), limit, similarity_threshold, tuple(sorted(fields)), mode, model_version, corpus_version)
+            cached = cache.get(cache_key)
+            tracing.metric('SearchCacheHit', int(cached is not None))
             
-            results = search_documents(pg_conn, user_id, query_embedding, limit, similarity_threshold)
+            if cached is not None:
+                results, total_embeddings = cached
+                print(f"Cache hit for corpus version {corpus_version}")
+            else:
+                query_embedding = embedclient.get_client(config).embed_one(query, model_version)
+                print(f"Generated query embedding (length: {len(query_embedding)})")
+                
+                with pg_conn.cursor() as cur, tracing.span('psycopg.execute', query='total_embeddings'):
+                    cur.execute("SELECT COUNT(*) as total_embeddings FROM document_embeddings")
+                    total_embeddings = cur.fetchone()['total_embeddings']
+                    print(f"Total embeddings in database: {total_embeddings}")
+                
+                results = search_documents(pg_conn, user_id, query_embedding, limit, similarity_threshold, 'groups' in fields, mode, model_version)
+                enrich_results(config, user_id, query, results, fields)
+                cache.put(cache_key, (results, total_embeddings))
             
             print(f"Query: {query}")
             print(f"User ID: {user_id}")
@@ -140,8 +233,13 @@ def lambda_handler(event, context):
                 'body': json.dumps({
                     'query': query,
                     'results': results,
+                    'fields': sorted(fields),
+                    'mode': mode,
+                    'model_version': model_version,
                     'total_results': len(results),
-                    'total_embeddings': total_embeddings  
+                    'total_embeddings': total_embeddings,
+                    'cache_hit': cached is not None,
+                    'corpus_version': corpus_version
                 })
             }
             
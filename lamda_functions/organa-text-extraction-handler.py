@@ -1,12 +1,31 @@
 import json
 import os
+import random
 import time
 import uuid
-import boto3
-from configparser import ConfigParser
-import datatier 
+import datatier
+import uploads
+import workqueue
+import stagestate
+import textcodec
+import coldstart
+import tracing
 import pathlib
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+boto3 = coldstart.lazy_import('boto3')
+fitz = coldstart.lazy_import('fitz')
+
+POLL_INTERVAL = 2
+
+# [textract] shard_pages = 0 sends every document as one job; otherwise longer documents are split
+# into shards of that many pages, analyzed as concurrent jobs and merged back in page order
+DEFAULT_SHARD_PAGES = 0
+DEFAULT_MAX_CONCURRENT_JOBS = 4
+DEFAULT_SHARD_ATTEMPTS = 3
+SHARD_RETRY_DELAY = 2.0
+SHARD_PREFIX = 'organa-textract-shards/'
 
 UUID_REGEX = re.compile(
     r'[0-9a-fA-F]{8}-'
@@ -24,16 +43,122 @@ def extract_doc_id(key):
     else:
         return None
 
+def analyze_document(textract_client, bucket, key):
+    # one Textract job: start, poll until it finishes, then page through the results; returns the LINE texts
+    with tracing.span('textract.start_document_analysis'):
+        response = textract_client.start_document_analysis(
+            DocumentLocation={
+                'S3Object': {
+                    'Bucket': bucket,
+                    'Name': key
+                }
+            },
+            FeatureTypes=["TABLES", "FORMS"]
+        )
+    job_id = response['JobId']
+    print(f"Textract JobId: {job_id}")
+    
+    with tracing.span('textract.poll', job_id=job_id) as poll_span:
+        polls = 0
+        while True:
+            job_status = textract_client.get_document_analysis(JobId=job_id)
+            status = job_status['JobStatus']
+            polls += 1
+            
+            if status in ['SUCCEEDED', 'FAILED']:
+                break
+            print(f"Textract job {job_id} status: {status}. Waiting...")
+            time.sleep(POLL_INTERVAL)
+        poll_span['polls'] = polls
+    
+    if status == 'FAILED':
+        raise Exception(f"Textract job {job_id} failed")
+    
+    print(f"Textract job {job_id} succeeded, extracting text lines...")
+    
+    lines = []
+    with tracing.span('textract.paginate', job_id=job_id) as page_span:
+        result_pages = 0
+        while True:
+            result_pages += 1
+            for block in job_status['Blocks']:
+                if block['BlockType'] == 'LINE' and 'Text' in block:
+                    lines.append(block['Text'])
+            if 'NextToken' in job_status:
+                job_status = textract_client.get_document_analysis(JobId=job_id, NextToken=job_status['NextToken'])
+            else:
+                break
+        page_span['result_pages'] = result_pages
+    return lines
+
+def shard_ranges(page_count, shard_pages):
+    # zero-based, inclusive page ranges
+    return [(start, min(start + shard_pages, page_count) - 1) for start in range(0, page_count, shard_pages)]
+
+def shard_key(key, first_page, last_page):
+    # organa-processed/{username}/{name}.pdf -> organa-textract-shards/{username}/{name}/pages-00001-00050.pdf
+    path = pathlib.PurePosixPath(key)
+    return f"{SHARD_PREFIX}{path.parent.name}/{path.stem}/pages-{first_page + 1:05d}-{last_page + 1:05d}.pdf"
+
+def analyze_shard(s3_client, textract_client, bucket, key, shard_bytes, metadata, attempts):
+    # a failed job, or a throttled / failed start, is retried on its own; the other shards keep their results
+    with tracing.span('s3.put_object'):
+        s3_client.put_object(Bucket=bucket, Key=key, Body=shard_bytes, ContentType='application/pdf', Metadata=metadata)
+    try:
+        for attempt in range(1, attempts + 1):
+            try:
+                with tracing.span('textract.shard', shard=key, attempt=attempt):
+                    return analyze_document(textract_client, bucket, key)
+            except Exception as e:
+                if attempt == attempts:
+                    raise
+                delay = random.uniform(0, SHARD_RETRY_DELAY * 2 ** attempt)
+                print(f"Shard {key} failed ({str(e)}), retrying in {delay:.1f}s (attempt {attempt})")
+                time.sleep(delay)
+    finally:
+        try:
+            s3_client.delete_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            print(f"Could not delete shard {key}: {str(e)}")
+
+def analyze_sharded(s3_client, textract_client, bucket, key, metadata, shard_pages, max_jobs, attempts):
+    # small documents still go out as a single job; only the page count decides
+    with tracing.span('s3.get_object'):
+        pdf_bytes = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    source = fitz.open(stream=pdf_bytes, filetype="pdf")
+    if source.page_count <= shard_pages:
+        return analyze_document(textract_client, bucket, key)
+    
+    ranges = shard_ranges(source.page_count, shard_pages)
+    print(f"Splitting {source.page_count} pages of {key} into {len(ranges)} shards")
+    with tracing.span('textract.sharded', pages=source.page_count, shards=len(ranges)):
+        with ThreadPoolExecutor(max_workers=min(max_jobs, len(ranges))) as executor:
+            futures = []
+            for first_page, last_page in ranges:
+                shard = fitz.open()
+                shard.insert_pdf(source, from_page=first_page, to_page=last_page)
+                futures.append(executor.submit(
+                    tracing.bind(analyze_shard), s3_client, textract_client, bucket,
+                    shard_key(key, first_page, last_page), shard.tobytes(), metadata, attempts
+                ))
+                shard.close()
+            # shards finish in any order; results are merged in page order
+            lines = []
+            for future in futures:
+                lines.extend(future.result())
+    return lines
+
 def lambda_handler(event, context):
     try:
         print("**STARTING ORGANA CONTENT EXTRACTION**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-text-extraction-handler', stage='extract')
         print("Event:", json.dumps(event))
         
         config_file = 'organa-config.ini'
         os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
         
-        configur = ConfigParser()
-        configur.read(config_file)
+        configur = coldstart.load_config(config_file)
         
         s3_profile = 's3readwrite'
         boto3.setup_default_session(profile_name=s3_profile)
@@ -49,11 +174,22 @@ def lambda_handler(event, context):
         s3_client = boto3.client('s3')
         textract_client = boto3.client('textract')
         
-        dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        
+        orchestrator = workqueue.from_config(configur)
+        
+        shard_pages = configur.getint('textract', 'shard_pages', fallback=DEFAULT_SHARD_PAGES)
+        max_jobs = configur.getint('textract', 'max_concurrent_jobs', fallback=DEFAULT_MAX_CONCURRENT_JOBS)
+        shard_attempts = configur.getint('textract', 'shard_attempts', fallback=DEFAULT_SHARD_ATTEMPTS)
+        text_encoding = textcodec.configured_encoding(configur)
         
-        for record in event['Records']:
-            bucket = record['s3']['bucket']['name']
-            key = record['s3']['object']['key']
+        # records that failed for a reason a retry can fix; permanent failures and skips are acknowledged
+        failed = []
+        for record in workqueue.iter_records(event):
+            tracing.clear_context('doc_id')
+            bucket = record['bucket']
+            key = record['key']
             
             if not key.startswith('organa-processed/'):
                 print(f"Skipping file not in organa-processed/: {key}")
@@ -65,165 +201,90 @@ def lambda_handler(event, context):
             
             print(f"Starting Textract analysis for: {key}")
             
-            try:
-                doc_id = extract_doc_id(key)
-                if not doc_id:
-                    raise ValueError("UUID not found in the key.")
-                print(f"Extracted doc_id: {doc_id}")
-            except ValueError as ve:
-                print(f"Invalid key format, cannot extract doc_id: {key}. Error: {str(ve)}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE processed_bucket_key = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', key])
-                    print(f"Updated status to 'failed' for key: {key}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for key {key}: {str(update_err)}")
+            doc_id = record['doc_id'] or extract_doc_id(key)
+            if not doc_id:
+                print(f"Invalid key format, cannot extract doc_id: {key}")
+                stagestate.fail_by_key(dbConn, 'extract', 'processed_bucket_key', key, "UUID not found in the key.")
                 continue
+            print(f"Extracted doc_id: {doc_id}")
+            tracing.set_context(doc_id=doc_id)
             
-            sql_check = "SELECT COUNT(*) FROM documents WHERE doc_id = %s;"
-            count = datatier.retrieve_one_row(dbConn, sql_check, [doc_id])
-            print(f"Number of records with doc_id {doc_id}: {count[0]}")
-            if count[0] == 0:
-                print(f"No records found with doc_id: {doc_id}")
-                sql_update_status_fail = """
-                UPDATE documents 
-                SET status = %s 
-                WHERE processed_bucket_key = %s;
-                """
-                try:
-                    datatier.perform_action(dbConn, sql_update_status_fail, ['failed', key])
-                    print(f"Updated status to 'failed' for key: {key}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for key {key}: {str(update_err)}")
-                continue
+            extracted_text_key = key.replace('organa-processed/', 'organa-extracted-text/').replace('.pdf', '.txt')
+            print(f"Extracted Text S3 Key: {extracted_text_key}")
             
-            sql_update_status = """
-            UPDATE documents 
-            SET status = %s, extraction_date = NOW() 
-            WHERE doc_id = %s;
-            """
             try:
-                affected_rows = datatier.perform_action(dbConn, sql_update_status, ['extracting', doc_id])
-                print(f"Rows affected by status update to 'extracting': {affected_rows}")
-                if affected_rows == 0:
-                    print(f"No rows updated for doc_id: {doc_id}")
+                action = stagestate.begin_stage(dbConn, s3_client, 'extract', doc_id, bucket, extracted_text_key)
             except Exception as e:
                 print(f"Exception during status update to 'extracting' for doc_id {doc_id}: {str(e)}")
-                continue 
-            try:
-                response = textract_client.start_document_analysis(
-                    DocumentLocation={
-                        'S3Object': {
-                            'Bucket': bucket,
-                            'Name': key
-                        }
-                    },
-                    FeatureTypes=["TABLES", "FORMS"]
-                )
-                job_id = response['JobId']
-                print(f"Textract JobId: {job_id}")
-            except Exception as textract_err:
-                print(f"Error starting Textract job for {key}: {str(textract_err)}")
-                try:
-                    datatier.perform_action(dbConn, sql_update_status, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                failed.append(record)
                 continue
             
-            try:
-                while True:
-                    job_status = textract_client.get_document_analysis(JobId=job_id)
-                    status = job_status['JobStatus']
-                    
-                    if status in ['SUCCEEDED', 'FAILED']:
-                        break
-                    print(f"Textract job {job_id} status: {status}. Waiting...")
-                    time.sleep(2)  
-            except Exception as poll_err:
-                print(f"Error polling Textract job {job_id}: {str(poll_err)}")
-                try:
-                    datatier.perform_action(dbConn, sql_update_status, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+            if action == stagestate.MISSING:
+                # the row can commit after the object lands (an upload still in flight), so give it a few deliveries
+                if workqueue.can_redeliver(record, stagestate.MAX_ATTEMPTS):
+                    print(f"No record yet for doc_id {doc_id}, retrying (receive {record['receive_count']})")
+                    failed.append(record)
+                    continue
+                print(f"No records found with doc_id: {doc_id}")
+                stagestate.fail_by_key(dbConn, 'extract', 'processed_bucket_key', key, "No document record for doc_id.")
                 continue
-            
-            if status == 'FAILED':
-                print(f"Textract job {job_id} failed for file {key}.")
-                try:
-                    datatier.perform_action(dbConn, sql_update_status, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+            if action == stagestate.BUSY:
+                continue
+            if action == stagestate.SKIP:
+                if orchestrator:
+                    orchestrator.advance('extract', record, extracted_text_key, doc_id)
                 continue
             
-            print(f"Textract job {job_id} succeeded, extracting text lines...")
+            # carried forward so the embeddings stage needs no MySQL lookup (and onto shards, which Textract reads)
+            try:
+                user_id = uploads.read_metadata(s3_client, bucket, key).get(uploads.METADATA_USER_ID)
+            except Exception as head_err:
+                print(f"Could not read metadata of {key}: {str(head_err)}")
+                user_id = None
             
-            pages = []
-            while True:
-                pages.append(job_status)
-                if 'NextToken' in job_status:
-                    job_status = textract_client.get_document_analysis(JobId=job_id, NextToken=job_status['NextToken'])
+            try:
+                if shard_pages:
+                    all_text = analyze_sharded(s3_client, textract_client, bucket, key, uploads.object_metadata(doc_id, user_id), shard_pages, max_jobs, shard_attempts)
                 else:
-                    break
-            
-            all_text = []
-            for page_data in pages:
-                for block in page_data['Blocks']:
-                    if block['BlockType'] == 'LINE' and 'Text' in block:
-                        all_text.append(block['Text'])
+                    all_text = analyze_document(textract_client, bucket, key)
+            except Exception as textract_err:
+                print(f"Error running Textract for {key}: {str(textract_err)}")
+                stagestate.fail_stage(dbConn, 'extract', doc_id, textract_err)
+                failed.append(record)
+                continue
             
             extracted_text = "\n".join(all_text)
             print(f"Extracted text length: {len(extracted_text)}")
-            extracted_text_key = key.replace('organa-processed/', 'organa-extracted-text/').replace('.pdf', '.txt')
-            print(f"Extracted Text S3 Key: {extracted_text_key}")
             
             try:
-                s3_client.put_object(
-                    Bucket=bucket,
-                    Key=extracted_text_key,
-                    Body=extracted_text.encode('utf-8'),
-                    ContentType='text/plain'
-                )
-                print(f"Uploaded extracted text to {extracted_text_key}")
+                stored_bytes = textcodec.put_text(s3_client, bucket, extracted_text_key, extracted_text, text_encoding, uploads.object_metadata(doc_id, user_id))
+                print(f"Uploaded extracted text to {extracted_text_key} ({stored_bytes} bytes, {text_encoding})")
             except Exception as upload_err:
                 print(f"Error uploading extracted text {extracted_text_key}: {str(upload_err)}")
-                try:
-                    datatier.perform_action(dbConn, sql_update_status, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                stagestate.fail_stage(dbConn, 'extract', doc_id, upload_err)
+                failed.append(record)
                 continue
             
-            sql_update_extracted = """
-            UPDATE documents 
-            SET extracted_text_bucket_key = %s, status = %s 
-            WHERE doc_id = %s;
-            """
             try:
-                affected_rows = datatier.perform_action(dbConn, sql_update_extracted, [extracted_text_key, 'extracted', doc_id])
+                affected_rows = stagestate.complete_stage(dbConn, 'extract', doc_id, extracted_text_key)
                 print(f"Rows affected by extracted text update: {affected_rows}")
                 if affected_rows == 0:
                     print(f"No rows updated for doc_id: {doc_id}")
             except Exception as e:
                 print(f"Exception during extracted text update for doc_id {doc_id}: {str(e)}")
-                try:
-                    datatier.perform_action(dbConn, sql_update_status, ['failed', doc_id])
-                    print(f"Updated status to 'failed' for doc_id: {doc_id}")
-                except Exception as update_err:
-                    print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+                stagestate.fail_stage(dbConn, 'extract', doc_id, e)
+                failed.append(record)
                 continue
             
+            if orchestrator:
+                orchestrator.advance('extract', record, extracted_text_key, doc_id)
+            
             print(f"Text extraction complete and stored at {extracted_text_key}")
         
         return {
             'statusCode': 200,
-            'body': json.dumps({'message': 'PDF processing complete'})
+            'body': json.dumps({'message': 'PDF processing complete', 'failed': len(failed)}),
+            'batchItemFailures': workqueue.batch_item_failures(failed)
         }
         
     except Exception as err:
@@ -231,5 +292,6 @@ def lambda_handler(event, context):
         print(str(err))
         return {
             'statusCode': 500,
-            'body': json.dumps({"error": str(err)})
+            'body': json.dumps({"error": str(err)}),
+            'batchItemFailures': workqueue.all_items_failed(event)
         }
@@ -0,0 +1,129 @@
+import json
+import os
+import datatier
+import uploads
+import workqueue
+import coldstart
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
+
+def lambda_handler(event, context):
+    try:
+        print("**STARTING ORGANA UPLOAD COMPLETE HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-upload-complete-handler', stage='upload')
+        
+        config_file = 'organa-config.ini'
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+        
+        configur = coldstart.load_config(config_file)
+        
+        s3_profile = 's3readwrite'
+        boto3.setup_default_session(profile_name=s3_profile)
+        
+        bucketname = configur.get('s3', 'bucket_name')
+        s3_client = boto3.client('s3')
+        
+        rds_endpoint = configur.get('rds', 'endpoint')
+        rds_portnum = int(configur.get('rds', 'port_number'))
+        rds_username = configur.get('rds', 'user_name')
+        rds_pwd = configur.get('rds', 'user_pwd')
+        rds_dbname = configur.get('rds', 'db_name')
+        
+        doc_id = event.get("pathParameters", {}).get("docid")
+        if not doc_id:
+            raise ValueError("Missing required parameter: docid")
+        
+        body = json.loads(event["body"]) if event.get("body") else {}
+        
+        # only the owner may move a document forward; it is matched on every read and write below
+        userid = event.get("userid") or (event.get("pathParameters") or {}).get("userid") or body.get("userid")
+        if not userid:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({"error": "Missing required parameter: userid"})
+            }
+        
+        upload_id = body.get("upload_id")
+        parts = body.get("parts")
+        
+        print(f"Completing upload for document ID: {doc_id}")
+        
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        
+        sql = "SELECT original_bucket_key, status FROM documents WHERE doc_id = %s AND userid = %s;"
+        with tracing.span('datatier.retrieve_one_row'):
+            row = datatier.retrieve_one_row(dbConn, sql, [doc_id, userid])
+        if not row:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({"error": "Document not found"})
+            }
+        
+        bucket_key, status = row[0], row[1]
+        
+        if status != 'pending':
+            print(f"Document {doc_id} already past upload, status: {status}")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    "message": "Upload already complete",
+                    "doc_id": doc_id,
+                    "status": status
+                })
+            }
+        
+        if upload_id:
+            if not parts:
+                raise Exception("Parts not found in request body for multipart upload")
+            print(f"**Completing multipart upload {upload_id}**")
+            with tracing.span('s3.complete_multipart_upload'):
+                uploads.complete_multipart_upload(s3_client, bucketname, bucket_key, upload_id, parts)
+        
+        print("**Verifying uploaded object**")
+        if not uploads.object_exists(s3_client, bucketname, bucket_key):
+            return {
+                'statusCode': 409,
+                'body': json.dumps({"error": "File has not been uploaded yet", "doc_id": doc_id})
+            }
+        
+        # only move forward from 'pending' so a processor that already picked the file up is not rolled back
+        sql_update = """
+        UPDATE documents 
+        SET status = %s 
+        WHERE doc_id = %s AND userid = %s AND status = %s;
+        """
+        with tracing.span('datatier.perform_action'):
+            affected_rows = datatier.perform_action(dbConn, sql_update, ['uploaded', doc_id, userid, 'pending'])
+        print(f"Rows affected by status update to 'uploaded': {affected_rows}")
+        
+        status = 'uploaded'
+        if affected_rows == 0:
+            with tracing.span('datatier.retrieve_one_row'):
+                row = datatier.retrieve_one_row(dbConn, sql, [doc_id, userid])
+            status = row[1]
+        else:
+            orchestrator = workqueue.from_config(configur)
+            if orchestrator:
+                orchestrator.enqueue('process', bucketname, bucket_key, doc_id, workqueue.PRIORITY_INTERACTIVE)
+        
+        print("**Upload complete**")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                "message": "Upload successful", 
+                "file_path": bucket_key,
+                "doc_id": doc_id,
+                "status": status
+            })
+        }
+    
+    except Exception as err:
+        print("**ERROR**")
+        print(str(err))
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": str(err)})
+        }
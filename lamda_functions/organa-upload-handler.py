@@ -1,21 +1,25 @@
 import json
-import boto3
 import os
 import uuid
 import base64
-import pathlib
 import datatier 
-from configparser import ConfigParser
+import uploads
+import workqueue
+import coldstart
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
 
 def lambda_handler(event, context):
     try:
         print("**STARTING ORGANA UPLOAD HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-upload-handler', stage='upload')
         
         config_file = 'organa-config.ini'
         os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
         
-        configur = ConfigParser()
-        configur.read(config_file)
+        configur = coldstart.load_config(config_file)
         
         s3_profile = 's3readwrite'
         boto3.setup_default_session(profile_name=s3_profile)
@@ -64,9 +68,11 @@ def lambda_handler(event, context):
             file.write(file_bytes)
         
         print("**Verifying user ID**")
-        dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
         sql_verify = "SELECT * FROM users WHERE userid = %s;"
-        user_row = datatier.retrieve_one_row(dbConn, sql_verify, [userid])
+        with tracing.span('datatier.retrieve_one_row'):
+            user_row = datatier.retrieve_one_row(dbConn, sql_verify, [userid])
         
         if not user_row:
             raise Exception("No such user found in database")
@@ -75,23 +81,21 @@ def lambda_handler(event, context):
         print("User verified:", username)
         
         print("**Preparing S3 upload**")
-        basename = pathlib.Path(filename).stem
-        extension = pathlib.Path(filename).suffix
-        
-        if extension.lower() not in [".pdf", ".docx", ".png", ".jpg"]:
-            raise Exception("Unsupported file type")
-        
         doc_id = str(uuid.uuid4())
         
-        bucket_key = f"organa-original/{username}/{basename}-{doc_id}{extension}"
+        bucket_key = uploads.build_bucket_key(username, filename, doc_id)
         print("S3 Bucket Key:", bucket_key)
         
         print("**Uploading to S3**")
-        bucket.upload_file(
-            local_filename, 
-            bucket_key, 
-            ExtraArgs={'ContentType': 'application/octet-stream'}
-        )
+        with tracing.span('s3.upload_file'):
+            bucket.upload_file(
+                local_filename, 
+                bucket_key, 
+                ExtraArgs={
+                    'ContentType': 'application/octet-stream',
+                    'Metadata': uploads.object_metadata(doc_id, userid)
+                }
+            )
         
         print("**Inserting document record into database**")
         sql_insert = """
@@ -106,14 +110,19 @@ def lambda_handler(event, context):
         )
         VALUES (%s, %s, %s, %s, %s, %s, NOW());
         """
-        datatier.perform_action(dbConn, sql_insert, [
-            doc_id, 
-            userid, 
-            bucket_key, 
-            None, 
-            None, 
-            'uploaded'
-        ])
+        with tracing.span('datatier.perform_action'):
+            datatier.perform_action(dbConn, sql_insert, [
+                doc_id, 
+                userid, 
+                bucket_key, 
+                None, 
+                None, 
+                'uploaded'
+            ])
+        
+        orchestrator = workqueue.from_config(configur)
+        if orchestrator:
+            orchestrator.enqueue('process', bucketname, bucket_key, doc_id, workqueue.PRIORITY_INTERACTIVE)
         
         print("**Upload complete**")
         return {
@@ -0,0 +1,123 @@
+import json
+import os
+import uuid
+import datatier
+import uploads
+import coldstart
+import tracing
+
+boto3 = coldstart.lazy_import('boto3')
+
+def lambda_handler(event, context):
+    try:
+        print("**STARTING ORGANA UPLOAD INITIATE HANDLER**")
+        tracing.clear_context()
+        tracing.set_context(handler='organa-upload-initiate-handler', stage='upload')
+        
+        config_file = 'organa-config.ini'
+        os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+        
+        configur = coldstart.load_config(config_file)
+        
+        s3_profile = 's3readwrite'
+        boto3.setup_default_session(profile_name=s3_profile)
+        
+        bucketname = configur.get('s3', 'bucket_name')
+        s3_client = boto3.client('s3')
+        
+        rds_endpoint = configur.get('rds', 'endpoint')
+        rds_portnum = int(configur.get('rds', 'port_number'))
+        rds_username = configur.get('rds', 'user_name')
+        rds_pwd = configur.get('rds', 'user_pwd')
+        rds_dbname = configur.get('rds', 'db_name')
+        
+        print("**Accessing event/pathParameters**")
+        userid = None
+        if "userid" in event:
+            userid = event["userid"]
+        elif "pathParameters" in event and "userid" in event["pathParameters"]:
+            userid = event["pathParameters"]["userid"]
+        else:
+            raise Exception("User ID not provided in event or pathParameters")
+        
+        print("User ID:", userid)
+        
+        print("**Parsing request body**")
+        if "body" not in event:
+            raise Exception("No body found in event")
+        
+        body = json.loads(event["body"])
+        
+        filename = body.get("filename")
+        file_size = body.get("size")
+        
+        if not filename:
+            raise Exception("Filename not found in request body")
+        
+        if file_size is not None:
+            file_size = int(file_size)
+        
+        print("Filename:", filename, "Size:", file_size)
+        
+        print("**Verifying user ID**")
+        with tracing.span('datatier.get_dbConn'):
+            dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+        sql_verify = "SELECT * FROM users WHERE userid = %s;"
+        with tracing.span('datatier.retrieve_one_row'):
+            user_row = datatier.retrieve_one_row(dbConn, sql_verify, [userid])
+        
+        if not user_row:
+            raise Exception("No such user found in database")
+        
+        username = user_row[1]
+        print("User verified:", username)
+        
+        doc_id = str(uuid.uuid4())
+        bucket_key = uploads.build_bucket_key(username, filename, doc_id)
+        print("S3 Bucket Key:", bucket_key)
+        
+        print("**Generating presigned upload**")
+        with tracing.span('s3.presign_upload'):
+            upload = uploads.presign_upload(s3_client, bucketname, bucket_key, file_size, uploads.object_metadata(doc_id, userid))
+        
+        print("**Inserting pending document record into database**")
+        sql_insert = """
+        INSERT INTO documents (
+            doc_id, 
+            userid, 
+            original_bucket_key, 
+            processed_bucket_key, 
+            extracted_text_bucket_key, 
+            status, 
+            upload_date
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, NOW());
+        """
+        with tracing.span('datatier.perform_action'):
+            datatier.perform_action(dbConn, sql_insert, [
+                doc_id, 
+                userid, 
+                bucket_key, 
+                None, 
+                None, 
+                'pending'
+            ])
+        
+        print("**Upload initiated**")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                "message": "Upload initiated", 
+                "file_path": bucket_key,
+                "doc_id": doc_id,
+                "upload": upload
+            })
+        }
+    
+    except Exception as err:
+        print("**ERROR**")
+        print(str(err))
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": str(err)})
+        }
@@ -0,0 +1,81 @@
+import pathlib
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import uploads
+import tracing
+
+PREFIX = 'organa-previews/'
+
+# bounding boxes; page images are never scaled up, and the processor's pages are already ~300 px wide
+THUMBNAIL_SIZE = (200, 200)
+PREVIEW_SIZE = (800, 800)
+JPEG_QUALITY = 70
+DEFAULT_MAX_PAGES = 10
+PREVIEW_CONTENT_TYPE = 'image/jpeg'
+UPLOAD_WORKERS = 4
+PRESIGNED_URL_EXPIRY = 3600
+
+def preview_prefix(bucket_key):
+    # organa-original/{username}/{basename}-{doc_id}.pdf (or the processed / extracted key) -> organa-previews/{username}/{basename}-{doc_id}/
+    path = pathlib.PurePosixPath(bucket_key)
+    return f"{PREFIX}{path.parent.name}/{path.stem}/"
+
+def thumbnail_key(bucket_key):
+    return f"{preview_prefix(bucket_key)}thumbnail.jpg"
+
+def page_key(bucket_key, index):
+    return f"{preview_prefix(bucket_key)}page-{index + 1:04d}.jpg"
+
+def render_jpeg(img, size):
+    copy = img.copy()
+    copy.thumbnail(size)
+    buffer = BytesIO()
+    copy.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+class PreviewCollector:
+    # passed to process_pdf as on_page: renders renditions from the page images it already holds
+    def __init__(self, max_pages=DEFAULT_MAX_PAGES):
+        self.max_pages = max_pages
+        self.thumbnail = None
+        self.pages = []
+
+    def __call__(self, index, img):
+        if index >= self.max_pages:
+            return
+        with tracing.span('pdf.render_preview', page=index):
+            if index == 0:
+                self.thumbnail = render_jpeg(img, THUMBNAIL_SIZE)
+            self.pages.append(render_jpeg(img, PREVIEW_SIZE))
+
+def store_previews(s3_client, bucketname, bucket_key, collector, doc_id, user_id=None):
+    # returns the number of page previews stored; previews are optional, so a failure only loses them
+    if collector.thumbnail is None:
+        return 0
+    objects = [(thumbnail_key(bucket_key), collector.thumbnail)]
+    objects += [(page_key(bucket_key, index), data) for index, data in enumerate(collector.pages)]
+    metadata = uploads.object_metadata(doc_id, user_id)
+
+    def put(item):
+        key, data = item
+        s3_client.put_object(Bucket=bucketname, Key=key, Body=data, ContentType=PREVIEW_CONTENT_TYPE, Metadata=metadata)
+
+    try:
+        with tracing.span('s3.put_previews', objects=len(objects), bytes=sum(len(data) for _, data in objects)):
+            with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+                list(executor.map(put, objects))
+    except Exception as e:
+        print(f"Error storing previews for {bucket_key}: {str(e)}")
+        return 0
+    return len(collector.pages)
+
+def preview_url(s3_client, bucketname, key):
+    # signed locally, no request to S3
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucketname, 'Key': key},
+        ExpiresIn=PRESIGNED_URL_EXPIRY
+    )
+
+def page_urls(s3_client, bucketname, bucket_key, preview_pages):
+    return [preview_url(s3_client, bucketname, page_key(bucket_key, index)) for index in range(preview_pages or 0)]
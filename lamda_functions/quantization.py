@@ -0,0 +1,63 @@
+DIMENSIONS = 1536
+
+# compact copies of document_embeddings.embedding (sql/embedding_quantization_postgres.sql)
+COLUMNS = {
+    'half': ('embedding_half', f"src.v::halfvec({DIMENSIONS})"),
+    'binary': ('embedding_bits', f"binary_quantize(src.v)::bit({DIMENSIONS})")
+}
+
+SEARCH_MODES = ['float', 'half', 'binary']
+
+# candidates fetched with the compact column per requested hit, re-ranked on the float vectors
+RERANK_FACTOR = {
+    'half': 2,
+    'binary': 10
+}
+
+# pgvector's bounds for hnsw.ef_search
+MIN_EF_SEARCH = 40
+MAX_EF_SEARCH = 1000
+
+CANDIDATE_ORDER = {
+    'half': f"embedding_half <-> %s::vector::halfvec({DIMENSIONS})",
+    'binary': f"embedding_bits <~> binary_quantize(%s::vector)::bit({DIMENSIONS})"
+}
+
+def dual_write_columns(configur):
+    # [embeddings] dual_write = half, binary
+    value = configur.get('embeddings', 'dual_write', fallback='')
+    columns = [column.strip() for column in value.split(',') if column.strip()]
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown dual_write columns: {', '.join(unknown)}")
+    return columns
+
+def search_mode(configur, requested=None):
+    mode = requested or configur.get('embeddings', 'search_mode', fallback='float')
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    return mode
+
+def candidates_sql(mode):
+    # top candidates by the compact column; the caller computes the float similarity over them
+    return f"""
+        SELECT doc_id, processeddatafile, extractedtextpath, embedding
+        FROM document_embeddings
+        WHERE user_id = %s AND model_version = %s
+        ORDER BY {CANDIDATE_ORDER[mode]}
+        LIMIT %s
+    """
+
+def configure_scan(cur, candidates):
+    # the HNSW index covers every user and model, so rows are filtered after the scan: at the default
+    # ef_search it yields far fewer than `candidates` rows. A wider search list plus an iterative scan
+    # (pgvector 0.8+) keeps the index walking until enough rows pass the filter; the order only has to be
+    # approximate since the float vectors re-rank them. set_config(..., true) lasts until the transaction ends.
+    ef_search = min(max(candidates, MIN_EF_SEARCH), MAX_EF_SEARCH)
+    cur.execute(
+        "SELECT set_config('hnsw.ef_search', %s, true), set_config('hnsw.iterative_scan', 'relaxed_order', true)",
+        (str(ef_search),)
+    )
+
+def candidate_count_sql(mode):
+    return f"SELECT COUNT(*) AS candidates FROM ({candidates_sql(mode)}) candidates"
@@ -0,0 +1,82 @@
+import time
+import threading
+from collections import OrderedDict
+import tracing
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 256
+
+BUMP_SQL = """
+    INSERT INTO user_corpus_versions (user_id, version)
+    VALUES (%s, 1)
+    ON CONFLICT (user_id) DO UPDATE
+        SET version = user_corpus_versions.version + 1, updated_at = NOW()
+"""
+
+def get_corpus_version(conn, user_id):
+    # moves forward whenever anything a search for this user can return changes
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='corpus_version'):
+        cur.execute("SELECT version FROM user_corpus_versions WHERE user_id = %s", (user_id,))
+        row = cur.fetchone()
+    return row['version'] if row else 0
+
+def bump_corpus_version(conn, user_ids):
+    # call inside the transaction that made the change, so a search never sees new rows under the old version
+    user_ids = sorted({str(user_id) for user_id in user_ids})
+    if not user_ids:
+        return
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='bump_corpus_version', users=len(user_ids)):
+        cur.executemany(BUMP_SQL, [(user_id,) for user_id in user_ids])
+
+def bump_for_group(conn, group_id):
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='bump_corpus_version'):
+        cur.execute("""
+            INSERT INTO user_corpus_versions (user_id, version)
+            SELECT user_id, 1 FROM document_groups WHERE group_id = %s
+            ON CONFLICT (user_id) DO UPDATE
+                SET version = user_corpus_versions.version + 1, updated_at = NOW()
+        """, (group_id,))
+
+def normalize_query(query):
+    return ' '.join(query.casefold().split())
+
+class SearchCache:
+    # per-container LRU with a TTL; entries carry the corpus version, so a write makes them unreachable
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            # entries of an older corpus version are never read again and age out from the front
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+_caches = {}
+
+def get_cache(configur):
+    settings = (
+        configur.getint('search', 'cache_ttl_seconds', fallback=DEFAULT_TTL_SECONDS),
+        configur.getint('search', 'cache_max_entries', fallback=DEFAULT_MAX_ENTRIES)
+    )
+    if settings not in _caches:
+        _caches[settings] = SearchCache(*settings)
+    return _caches[settings]
@@ -0,0 +1,209 @@
+import datatier
+import uploads
+import tracing
+
+# documents.status values in pipeline order; 'failed' sits outside the order and records failed_stage
+STATUS_ORDER = ['pending', 'uploaded', 'processing', 'processed', 'extracting', 'extracted']
+
+STAGES = {
+    'process': {
+        # presigned uploads can trigger processing before the completion call lands
+        'ready': ['pending', 'uploaded'],
+        'running': 'processing',
+        'done': 'processed',
+        'started_column': 'processed_date',
+        'attempts_column': 'process_attempts',
+        'key_column': 'processed_bucket_key'
+    },
+    'extract': {
+        'ready': ['processed'],
+        'running': 'extracting',
+        'done': 'extracted',
+        'started_column': 'extraction_date',
+        'attempts_column': 'extract_attempts',
+        'key_column': 'extracted_text_bucket_key'
+    }
+}
+
+MAX_ATTEMPTS = 3
+# a stage still marked running after this long is assumed to have crashed and may be reclaimed
+LEASE_SECONDS = 900
+MAX_ERROR_LENGTH = 512
+
+RUN = 'run'
+SKIP = 'skip'
+BUSY = 'busy'
+MISSING = 'missing'
+
+
+def statuses_before(status):
+    return STATUS_ORDER[:STATUS_ORDER.index(status)]
+
+
+@tracing.traced('datatier.get_state')
+def get_state(dbConn, doc_id):
+    sql = """
+    SELECT status, failed_stage, process_attempts, extract_attempts
+    FROM documents
+    WHERE doc_id = %s;
+    """
+    row = datatier.retrieve_one_row(dbConn, sql, [doc_id])
+    if not row:
+        return None
+    return {
+        'status': row[0],
+        'failed_stage': row[1],
+        'process_attempts': row[2],
+        'extract_attempts': row[3]
+    }
+
+
+@tracing.traced('datatier.claim_stage')
+def claim_stage(dbConn, stage, doc_id):
+    config = STAGES[stage]
+    ready_placeholders = ", ".join(["%s"] * len(config['ready']))
+    sql = f"""
+    UPDATE documents
+    SET status = %s,
+        {config['started_column']} = NOW(),
+        {config['attempts_column']} = {config['attempts_column']} + 1,
+        failed_stage = NULL,
+        last_error = NULL
+    WHERE doc_id = %s
+      AND {config['attempts_column']} < %s
+      AND (
+        status IN ({ready_placeholders})
+        OR (status = 'failed' AND failed_stage = %s)
+        OR (status = %s AND {config['started_column']} < NOW() - INTERVAL %s SECOND)
+      );
+    """
+    affected_rows = datatier.perform_action(dbConn, sql, [
+        config['running'],
+        doc_id,
+        MAX_ATTEMPTS
+    ] + config['ready'] + [
+        stage,
+        config['running'],
+        LEASE_SECONDS
+    ])
+    return affected_rows == 1
+
+
+@tracing.traced('datatier.complete_stage')
+def complete_stage(dbConn, stage, doc_id, artifact_key, columns=None):
+    # columns: other values the stage produced (e.g. preview_pages), written by the same statement
+    config = STAGES[stage]
+    columns = columns or {}
+    earlier = statuses_before(config['done'])
+    placeholders = ", ".join(["%s"] * len(earlier))
+    extra = "".join(f", {column} = %s" for column in columns)
+    # never moves a document backwards, so a late duplicate cannot undo a later stage
+    sql = f"""
+    UPDATE documents
+    SET status = %s, {config['key_column']} = %s{extra}, failed_stage = NULL, last_error = NULL
+    WHERE doc_id = %s
+      AND (status IN ({placeholders}) OR (status = 'failed' AND failed_stage = %s));
+    """
+    return datatier.perform_action(dbConn, sql, [config['done'], artifact_key] + list(columns.values()) + [doc_id] + earlier + [stage])
+
+
+@tracing.traced('datatier.fail_stage')
+def fail_stage(dbConn, stage, doc_id, error):
+    sql = """
+    UPDATE documents
+    SET status = 'failed', failed_stage = %s, last_error = %s
+    WHERE doc_id = %s AND status = %s;
+    """
+    try:
+        affected_rows = datatier.perform_action(dbConn, sql, [stage, str(error)[:MAX_ERROR_LENGTH], doc_id, STAGES[stage]['running']])
+        print(f"Updated status to 'failed' at stage '{stage}' for doc_id: {doc_id}")
+        return affected_rows
+    except Exception as update_err:
+        print(f"Error updating status to 'failed' for doc_id {doc_id}: {str(update_err)}")
+        return 0
+
+
+@tracing.traced('datatier.fail_by_key')
+def fail_by_key(dbConn, stage, key_column, key, error):
+    sql = f"""
+    UPDATE documents
+    SET status = 'failed', failed_stage = %s, last_error = %s
+    WHERE {key_column} = %s;
+    """
+    try:
+        affected_rows = datatier.perform_action(dbConn, sql, [stage, str(error)[:MAX_ERROR_LENGTH], key])
+        print(f"Updated status to 'failed' for key: {key}")
+        return affected_rows
+    except Exception as update_err:
+        print(f"Error updating status to 'failed' for key {key}: {str(update_err)}")
+        return 0
+
+
+def begin_stage(dbConn, s3_client, stage, doc_id, bucket, artifact_key):
+    # the usual path is one statement (the claim or the catch-up); the row is only read to explain a refusal
+    with tracing.span('s3.head_object'):
+        exists = uploads.object_exists(s3_client, bucket, artifact_key)
+    # a redelivered event for work that already produced its artifact only needs the row caught up
+    if exists:
+        if not complete_stage(dbConn, stage, doc_id, artifact_key) and get_state(dbConn, doc_id) is None:
+            return MISSING
+        print(f"Artifact {artifact_key} already exists, skipping stage '{stage}' for doc_id: {doc_id}")
+        return SKIP
+
+    if claim_stage(dbConn, stage, doc_id):
+        return RUN
+
+    state = get_state(dbConn, doc_id)
+    if state is None:
+        return MISSING
+
+    print(f"Could not claim stage '{stage}' for doc_id {doc_id} (status: {state['status']}, attempts: {state[STAGES[stage]['attempts_column']]})")
+    return BUSY
+
+
+@tracing.traced('datatier.resume')
+def resume(dbConn, s3_client, bucket, doc_id):
+    sql = """
+    SELECT original_bucket_key, processed_bucket_key, extracted_text_bucket_key, status
+    FROM documents
+    WHERE doc_id = %s;
+    """
+    row = datatier.retrieve_one_row(dbConn, sql, [doc_id])
+    if not row:
+        return None
+
+    original_key = row[0]
+    processed_key = row[1] or original_key.replace('organa-original/', 'organa-processed/')
+    extracted_key = row[2] or processed_key.replace('organa-processed/', 'organa-extracted-text/').replace('.pdf', '.txt')
+
+    # resume from the furthest stage whose artifact is already in S3
+    if uploads.object_exists(s3_client, bucket, extracted_key):
+        status, next_stage, next_key = 'extracted', 'embed', extracted_key
+    elif uploads.object_exists(s3_client, bucket, processed_key):
+        status, next_stage, next_key = 'processed', 'extract', processed_key
+    elif uploads.object_exists(s3_client, bucket, original_key):
+        status, next_stage, next_key = 'uploaded', 'process', original_key
+    else:
+        return {'doc_id': doc_id, 'status': row[3], 'next_stage': None, 'key': None}
+
+    sql_reset = """
+    UPDATE documents
+    SET status = %s,
+        processed_bucket_key = %s,
+        extracted_text_bucket_key = %s,
+        failed_stage = NULL,
+        last_error = NULL,
+        process_attempts = IF(%s = 'process', 0, process_attempts),
+        extract_attempts = IF(%s IN ('process', 'extract'), 0, extract_attempts)
+    WHERE doc_id = %s;
+    """
+    datatier.perform_action(dbConn, sql_reset, [
+        status,
+        processed_key if status in ('processed', 'extracted') else None,
+        extracted_key if status == 'extracted' else None,
+        next_stage,
+        next_stage,
+        doc_id
+    ])
+    print(f"Resuming doc_id {doc_id} at stage '{next_stage}' from status '{status}'")
+    return {'doc_id': doc_id, 'status': status, 'next_stage': next_stage, 'key': next_key}
@@ -0,0 +1,94 @@
+import searchcache
+import tracing
+
+MIN_SUGGESTION_SIZE = 2
+SUGGESTION_MEMBERS = 10
+
+def get_suggestions(conn, user_id, members_limit=SUGGESTION_MEMBERS):
+    # "suggested" clusters become new groups; "accepted" ones offer their newer members to the group
+    sql = """
+        SELECT
+            c.cluster_id,
+            c.label,
+            c.status,
+            c.group_id,
+            COUNT(*) AS pending,
+            (ARRAY_AGG(m.doc_id ORDER BY m.distance))[1:%s] AS doc_ids
+        FROM document_clusters c
+        JOIN document_cluster_members m ON m.cluster_id = c.cluster_id
+        LEFT JOIN document_group_assignments a ON a.group_id = c.group_id AND a.doc_id = m.doc_id
+        WHERE c.user_id = %s AND c.status <> 'dismissed' AND a.doc_id IS NULL
+        GROUP BY c.cluster_id
+        HAVING c.group_id IS NOT NULL OR COUNT(*) >= %s
+        ORDER BY COUNT(*) DESC
+    """
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='group_suggestions'):
+        cur.execute(sql, (members_limit, user_id, MIN_SUGGESTION_SIZE))
+        rows = cur.fetchall()
+
+    return [{
+        'cluster_id': str(row['cluster_id']),
+        'kind': 'add_to_group' if row['group_id'] else 'new_group',
+        'group_id': str(row['group_id']) if row['group_id'] else None,
+        'label': row['label'],
+        'document_count': row['pending'],
+        'doc_ids': [str(doc_id) for doc_id in row['doc_ids']]
+    } for row in rows]
+
+def accept(conn, user_id, cluster_id, group_name=None):
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("""
+            SELECT cluster_id, label, group_id
+            FROM document_clusters
+            WHERE cluster_id = %s AND user_id = %s AND status <> 'dismissed'
+            FOR UPDATE
+        """, (cluster_id, user_id))
+        cluster = cur.fetchone()
+        if cluster is None:
+            return None
+
+        group_id = cluster['group_id']
+        if group_id is None:
+            # a suggestion named like an existing group is merged into that group
+            with tracing.span('psycopg.execute', query='accept_create_group'):
+                cur.execute("""
+                    INSERT INTO document_groups (user_id, group_name, description)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id, group_name) DO UPDATE SET group_name = EXCLUDED.group_name, updated_at = NOW()
+                    RETURNING group_id
+                """, (user_id, group_name or cluster['label'], 'Created from a suggested group'))
+                group_id = cur.fetchone()['group_id']
+
+        with tracing.span('psycopg.execute', query='accept_assign') as assign_span:
+            cur.execute("""
+                INSERT INTO document_group_assignments (doc_id, group_id)
+                SELECT doc_id, %s FROM document_cluster_members WHERE cluster_id = %s
+                ON CONFLICT DO NOTHING
+            """, (group_id, cluster_id))
+            assigned = cur.rowcount
+            assign_span['rows'] = assigned
+        if assigned:
+            searchcache.bump_corpus_version(conn, [user_id])
+
+        cur.execute("""
+            UPDATE document_clusters
+            SET status = 'accepted', group_id = %s, updated_at = NOW()
+            WHERE cluster_id = %s
+        """, (group_id, cluster_id))
+
+    return {
+        'cluster_id': str(cluster_id),
+        'group_id': str(group_id),
+        'assigned': assigned
+    }
+
+def dismiss(conn, user_id, cluster_ids):
+    if not cluster_ids:
+        return 0
+    with conn.cursor() as cur, tracing.span('psycopg.execute', query='dismiss_suggestions'):
+        cur.execute("""
+            UPDATE document_clusters
+            SET status = 'dismissed', updated_at = NOW()
+            WHERE user_id = %s AND cluster_id = ANY(%s::uuid[]) AND status = 'suggested'
+        """, (user_id, list(cluster_ids)))
+        return cur.rowcount
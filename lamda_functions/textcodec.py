@@ -0,0 +1,154 @@
+import codecs
+import gzip
+import zlib
+import coldstart
+import tracing
+
+try:
+    zstandard = coldstart.lazy_import('zstandard')
+except ModuleNotFoundError:
+    # optional: gzip needs nothing beyond the standard library
+    zstandard = None
+
+# Content-Encoding values; objects written before compression have none and are read as identity
+IDENTITY = 'identity'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+ENCODINGS = [IDENTITY, GZIP, ZSTD]
+DEFAULT_ENCODING = GZIP
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 6
+READ_CHUNK_SIZE = 256 * 1024
+# decoded bytes a reader accepts from one object; a corrupt or hostile object fails instead of filling memory
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+
+TEXT_CONTENT_TYPE = 'text/plain; charset=utf-8'
+# uncompressed size, so readers can size buffers and inline limits without decoding
+METADATA_TEXT_LENGTH = 'text-length'
+
+def configured_encoding(configur):
+    # [s3] text_encoding = zstd | gzip | identity
+    encoding = configur.get('s3', 'text_encoding', fallback=DEFAULT_ENCODING)
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown text_encoding: {encoding}")
+    if encoding == ZSTD and zstandard is None:
+        raise ValueError("text_encoding = zstd needs the zstandard package in the function's layers")
+    return encoding
+
+def encode(data, encoding):
+    if encoding == GZIP:
+        # mtime=0 keeps the output deterministic, so identical text gives an identical object
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+def put_text(s3_client, bucketname, key, text, encoding=DEFAULT_ENCODING, metadata=None):
+    data = text.encode('utf-8')
+    with tracing.span('textcodec.encode', encoding=encoding) as encode_span:
+        body = encode(data, encoding)
+        encode_span['raw_bytes'] = len(data)
+        encode_span['stored_bytes'] = len(body)
+    extra = {'ContentEncoding': encoding} if encoding != IDENTITY else {}
+    with tracing.span('s3.put_object'):
+        s3_client.put_object(
+            Bucket=bucketname,
+            Key=key,
+            Body=body,
+            ContentType=TEXT_CONTENT_TYPE,
+            Metadata=dict(metadata or {}, **{METADATA_TEXT_LENGTH: str(len(data))}),
+            **extra
+        )
+    return len(body)
+
+def content_encoding(response):
+    return (response.get('ContentEncoding') or IDENTITY).lower()
+
+def text_length(response):
+    # None for objects written before the metadata existed
+    value = response.get('Metadata', {}).get(METADATA_TEXT_LENGTH)
+    return int(value) if value is not None else None
+
+def _decompressor(encoding):
+    if encoding == GZIP:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == ZSTD:
+        return zstandard.ZstdDecompressor().decompressobj()
+    if encoding == IDENTITY:
+        return None
+    raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+def _ranged(response):
+    # "bytes 0-65535/1048576": the body stops before the end of the object
+    content_range = response.get('ContentRange')
+    if not content_range:
+        return False
+    try:
+        first_last, total = content_range.split(' ', 1)[1].split('/')
+        return total == '*' or int(first_last.split('-')[1]) + 1 < int(total)
+    except (IndexError, ValueError):
+        return True
+
+def iter_bytes(response, chunk_size=READ_CHUNK_SIZE, max_length=MAX_DECODED_BYTES):
+    # decoded bytes of a GetObject body, chunk by chunk. A ranged (prefix) read decodes as far as it goes;
+    # a full read has to end exactly where its compressed stream does, so a truncated object raises
+    # instead of yielding part of its text
+    encoding = content_encoding(response)
+    decompressor = _decompressor(encoding)
+    body = response['Body']
+    size = 0
+    
+    def counted(data):
+        nonlocal size
+        size += len(data)
+        if max_length is not None and size > max_length:
+            body.close()
+            raise ValueError(f"Decoded object is larger than {max_length} bytes")
+        return data
+    
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor is None:
+            yield counted(chunk)
+            continue
+        while chunk:
+            if decompressor.eof:
+                raise ValueError(f"Unexpected data after the end of the {encoding} stream")
+            if encoding == GZIP:
+                # bounded output per call: a small compressed chunk can expand a thousandfold
+                data = decompressor.decompress(chunk, chunk_size)
+                chunk = decompressor.unconsumed_tail
+            else:
+                data, chunk = decompressor.decompress(chunk), b''
+            if data:
+                yield counted(data)
+    
+    if decompressor is None:
+        return
+    if encoding == GZIP:
+        data = decompressor.flush()
+        if data:
+            yield counted(data)
+    if decompressor.unused_data:
+        raise ValueError(f"Unexpected data after the end of the {encoding} stream")
+    if not decompressor.eof and not _ranged(response):
+        raise ValueError(f"Truncated {encoding} stream")
+
+def read_text(response, max_bytes=None, errors='strict', max_length=MAX_DECODED_BYTES):
+    # streams the body through the decompressor and an incremental UTF-8 decoder, so the compressed
+    # and decoded copies of the whole object are never held at the same time; max_bytes returns a prefix,
+    # max_length rejects an object that decodes to more
+    decoder = codecs.getincrementaldecoder('utf-8')(errors=errors)
+    parts, size = [], 0
+    for data in iter_bytes(response, max_length=max_length):
+        if max_bytes is not None and size + len(data) >= max_bytes:
+            parts.append(decoder.decode(data[:max_bytes - size]))
+            response['Body'].close()
+            return ''.join(parts)
+        parts.append(decoder.decode(data))
+        size += len(data)
+    parts.append(decoder.decode(b'', final=max_bytes is None))
+    return ''.join(parts)
@@ -0,0 +1,96 @@
+import contextlib
+import contextvars
+import functools
+import json
+import time
+
+NAMESPACE = 'Organa'
+DIMENSIONS = [['handler', 'stage', 'span'], ['stage', 'span']]
+
+# per thread (and per asyncio task): concurrent handlers driven from one process never see each other's fields
+_context = contextvars.ContextVar('tracing_context', default={})
+_sink = None
+
+
+def set_sink(sink):
+    # a list collects records locally (tests, benchmarks); None prints EMF lines for CloudWatch
+    global _sink
+    _sink = sink
+
+
+def set_context(**fields):
+    # the stored dict is never mutated, so a context copied into a worker keeps the fields it was bound with
+    _context.set(dict(_context.get(), **fields))
+
+
+def clear_context(*names):
+    # the main thread outlives the invocation in a warm container: handlers clear it first, record loops clear doc_id
+    if not names:
+        _context.set({})
+    else:
+        _context.set({name: value for name, value in _context.get().items() if name not in names})
+
+
+def bind(fn):
+    # pool threads start with an empty context; the bound function runs in a copy of the caller's,
+    # so spans emitted by workers keep the handler, stage and doc_id
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # one copy per call: a context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def emit(metrics, fields):
+    context = _context.get()
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': DIMENSIONS,
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()]
+            }]
+        },
+        'handler': context.get('handler', 'unknown'),
+        'stage': context.get('stage', 'unknown')
+    }
+    record.update(context)
+    record.update(fields)
+    for name, (value, _) in metrics.items():
+        record[name] = value
+
+    if _sink is not None:
+        _sink.append(record)
+    else:
+        print(json.dumps(record, default=str))
+
+
+def metric(name, value, unit='Count', **fields):
+    emit({name: (value, unit)}, dict(fields, span=fields.get('span', name)))
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        emit({'Duration': (round(duration_ms, 3), 'Milliseconds')}, dict(fields, span=name, error=error))
+
+
+def traced(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
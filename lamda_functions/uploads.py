@@ -0,0 +1,164 @@
+import math
+import pathlib
+import datatier
+import tracing
+
+ALLOWED_EXTENSIONS = [".pdf", ".docx", ".png", ".jpg"]
+PRESIGNED_URL_EXPIRY = 3600
+UPLOAD_CONTENT_TYPE = 'application/octet-stream'
+
+# S3 requires parts of at least 5 MB and at most 10,000 parts per upload
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+
+# user metadata (x-amz-meta-*) that every stage writes on its output, so the next stage knows
+# the document without parsing the key or looking it up by key
+METADATA_DOC_ID = 'doc-id'
+METADATA_USER_ID = 'user-id'
+
+def build_bucket_key(username, filename, doc_id):
+    basename = pathlib.Path(filename).stem
+    extension = pathlib.Path(filename).suffix
+    
+    if extension.lower() not in ALLOWED_EXTENSIONS:
+        raise Exception("Unsupported file type")
+    
+    return f"organa-original/{username}/{basename}-{doc_id}{extension}"
+
+def original_filename(bucket_key, doc_id):
+    # inverse of build_bucket_key: organa-original/{username}/{basename}-{doc_id}{ext} -> {basename}{ext}
+    path = pathlib.Path(bucket_key)
+    basename = path.stem
+    if doc_id and basename.endswith(f"-{doc_id}"):
+        basename = basename[:-len(doc_id) - 1]
+    return f"{basename}{path.suffix}"
+
+def object_metadata(doc_id, user_id=None):
+    metadata = {METADATA_DOC_ID: str(doc_id)}
+    if user_id:
+        metadata[METADATA_USER_ID] = str(user_id)
+    return metadata
+
+def read_metadata(s3_client, bucketname, bucket_key):
+    # for stages that never download their input (Textract reads the file itself)
+    with tracing.span('s3.head_object'):
+        response = s3_client.head_object(Bucket=bucketname, Key=bucket_key)
+    return response.get('Metadata', {})
+
+def presign_upload(s3_client, bucketname, bucket_key, file_size=None, metadata=None):
+    metadata = metadata or {}
+    if file_size is None or file_size < MULTIPART_THRESHOLD:
+        url = s3_client.generate_presigned_url(
+            'put_object',
+            Params={
+                'Bucket': bucketname,
+                'Key': bucket_key,
+                'ContentType': UPLOAD_CONTENT_TYPE,
+                'Metadata': metadata
+            },
+            ExpiresIn=PRESIGNED_URL_EXPIRY
+        )
+        # signed metadata headers have to be sent back verbatim with the PUT
+        headers = {'Content-Type': UPLOAD_CONTENT_TYPE}
+        headers.update({f"x-amz-meta-{name}": value for name, value in metadata.items()})
+        return {
+            'method': 'PUT',
+            'url': url,
+            'headers': headers
+        }
+    
+    part_size = max(MULTIPART_PART_SIZE, math.ceil(file_size / MULTIPART_MAX_PARTS))
+    part_count = math.ceil(file_size / part_size)
+    
+    response = s3_client.create_multipart_upload(
+        Bucket=bucketname,
+        Key=bucket_key,
+        ContentType=UPLOAD_CONTENT_TYPE,
+        Metadata=metadata
+    )
+    upload_id = response['UploadId']
+    
+    parts = []
+    for part_number in range(1, part_count + 1):
+        url = s3_client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': bucketname,
+                'Key': bucket_key,
+                'UploadId': upload_id,
+                'PartNumber': part_number
+            },
+            ExpiresIn=PRESIGNED_URL_EXPIRY
+        )
+        parts.append({'part_number': part_number, 'url': url})
+    
+    return {
+        'method': 'MULTIPART',
+        'upload_id': upload_id,
+        'part_size': part_size,
+        'parts': parts
+    }
+
+def complete_multipart_upload(s3_client, bucketname, bucket_key, upload_id, parts):
+    completed_parts = sorted(
+        [{'ETag': part['etag'], 'PartNumber': int(part['part_number'])} for part in parts],
+        key=lambda part: part['PartNumber']
+    )
+    s3_client.complete_multipart_upload(
+        Bucket=bucketname,
+        Key=bucket_key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': completed_parts}
+    )
+
+def object_exists(s3_client, bucketname, bucket_key):
+    # botocore is already loaded by the time a client exists; importing it here keeps it off the import path
+    from botocore.exceptions import ClientError
+    
+    try:
+        s3_client.head_object(Bucket=bucketname, Key=bucket_key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+def insert_documents(dbConn, rows):
+    # rows are (doc_id, userid, original_bucket_key, status) tuples; perform_many sends them as multi-row INSERTs
+    sql_insert = """
+    INSERT INTO documents (
+        doc_id, 
+        userid, 
+        original_bucket_key, 
+        processed_bucket_key, 
+        extracted_text_bucket_key, 
+        status, 
+        upload_date
+    )
+    VALUES (%s, %s, %s, NULL, NULL, %s, NOW())
+    """
+    return datatier.perform_many(dbConn, sql_insert, rows)
+
+def mark_uploaded(dbConn, doc_ids):
+    # only from 'pending': a processor that already picked the file up is not rolled back
+    if not doc_ids:
+        return 0
+    placeholders = ', '.join(['%s'] * len(doc_ids))
+    sql_update = f"""
+    UPDATE documents
+    SET status = 'uploaded'
+    WHERE status = 'pending' AND doc_id IN ({placeholders});
+    """
+    return datatier.perform_action(dbConn, sql_update, list(doc_ids))
+
+def discard_pending(dbConn, doc_ids):
+    # rows inserted ahead of an upload that never reached S3
+    if not doc_ids:
+        return 0
+    placeholders = ', '.join(['%s'] * len(doc_ids))
+    sql_delete = f"""
+    DELETE FROM documents
+    WHERE status = 'pending' AND doc_id IN ({placeholders});
+    """
+    return datatier.perform_action(dbConn, sql_delete, list(doc_ids))
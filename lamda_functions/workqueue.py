@@ -0,0 +1,392 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+STAGES = ['process', 'extract', 'embed']
+NEXT_STAGE = {
+    'process': 'extract',
+    'extract': 'embed',
+    'embed': None
+}
+
+# lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITIES = [PRIORITY_INTERACTIVE, PRIORITY_BULK]
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BULK: 'bulk'
+}
+
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_VISIBILITY_TIMEOUT = 300
+SQS_MAX_MESSAGES = 10
+# the smallest MaximumConcurrency a Lambda SQS event source mapping accepts
+MIN_MAXIMUM_CONCURRENCY = 2
+
+# one client per container; from_config runs on every invocation of the enqueuing handlers
+_sqs_client = None
+
+
+def make_body(bucket, key, doc_id=None, priority=PRIORITY_BULK):
+    return json.dumps({
+        'bucket': bucket,
+        'key': key,
+        'doc_id': doc_id,
+        'priority': priority
+    })
+
+
+def message_to_record(message):
+    body = json.loads(message['Body'])
+    return {
+        'bucket': body['bucket'],
+        'key': body['key'],
+        'doc_id': body.get('doc_id'),
+        'priority': body.get('priority', PRIORITY_BULK),
+        'receive_count': int(message.get('ReceiveCount', 1))
+    }
+
+
+def iter_records(event):
+    # stage handlers accept both S3 notifications and SQS deliveries of queued stage work
+    for record in event.get('Records', []):
+        if record.get('eventSource') == 'aws:sqs':
+            receive_count = (record.get('attributes') or {}).get('ApproximateReceiveCount', 1)
+            message = {'Body': record['body'], 'ReceiveCount': receive_count}
+            yield dict(message_to_record(message), message_id=record.get('messageId'))
+        else:
+            yield {
+                'bucket': record['s3']['bucket']['name'],
+                'key': record['s3']['object']['key'],
+                'doc_id': None,
+                'priority': PRIORITY_BULK,
+                'receive_count': 1,
+                'message_id': None
+            }
+
+
+def batch_item_failures(records):
+    # with ReportBatchItemFailures on the SQS event source mapping, only these messages are redelivered;
+    # S3 notifications have no message id and nothing to redeliver
+    return [{'itemIdentifier': record['message_id']} for record in records if record.get('message_id')]
+
+
+def can_redeliver(record, max_receives):
+    # only SQS deliveries can be handed back; an S3 notification that is not handled now is gone
+    return bool(record.get('message_id')) and record.get('receive_count', 1) < max_receives
+
+
+def all_items_failed(event):
+    # a handler that fails outright still returns normally, so every SQS message has to be reported
+    return [
+        {'itemIdentifier': record['messageId']}
+        for record in event.get('Records', [])
+        if record.get('eventSource') == 'aws:sqs' and record.get('messageId')
+    ]
+
+
+def lambda_stage_handler(lambda_handler):
+    # adapts a stage's lambda_handler so Orchestrator.run_stage can drive it locally
+    def handle(record):
+        event = {
+            'Records': [{
+                'eventSource': 'aws:sqs',
+                'messageId': str(uuid.uuid4()),
+                'attributes': {'ApproximateReceiveCount': str(record.get('receive_count', 1))},
+                'body': make_body(record['bucket'], record['key'], record.get('doc_id'), record['priority'])
+            }]
+        }
+        response = lambda_handler(event, None)
+        if response.get('statusCode', 200) >= 500 or response.get('batchItemFailures'):
+            raise Exception(f"Stage handler failed for {record['key']}: {response.get('body')}")
+        return response
+    return handle
+
+
+class LocalQueue:
+    """In-memory stand-in for an SQS queue pair with priority, visibility timeouts and a redrive policy."""
+
+    def __init__(self, clock=time.monotonic, max_receives=None, dead_letter_queue=None):
+        self._clock = clock
+        # like an SQS redrive policy: a message received max_receives times without being deleted
+        # is moved to dead_letter_queue (or dropped) instead of being made visible again
+        self.max_receives = max_receives
+        self.dead_letter_queue = dead_letter_queue
+        self._lock = threading.Lock()
+        self._ready = []
+        self._messages = {}
+        self._in_flight = {}
+        self._seq = itertools.count()
+
+    def send_message(self, body, priority=PRIORITY_BULK):
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self._messages[message_id] = {
+                'Body': body,
+                'Priority': priority,
+                'ReceiveCount': 0,
+                'VisibleAt': None
+            }
+            heapq.heappush(self._ready, (priority, next(self._seq), message_id))
+        return message_id
+
+    def _requeue_expired(self, now):
+        for receipt_handle, message_id in list(self._in_flight.items()):
+            message = self._messages[message_id]
+            if message['VisibleAt'] <= now:
+                del self._in_flight[receipt_handle]
+                if self.max_receives is not None and message['ReceiveCount'] >= self.max_receives:
+                    del self._messages[message_id]
+                    if self.dead_letter_queue is not None:
+                        self.dead_letter_queue.send_message(message['Body'], message['Priority'])
+                    print(f"Message {message_id} reached {message['ReceiveCount']} receives, moved to the dead-letter queue")
+                    continue
+                heapq.heappush(self._ready, (message['Priority'], next(self._seq), message_id))
+
+    def receive_messages(self, max_messages=1, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        received = []
+        with self._lock:
+            now = self._clock()
+            self._requeue_expired(now)
+            while self._ready and len(received) < max_messages:
+                _, _, message_id = heapq.heappop(self._ready)
+                message = self._messages[message_id]
+                message['ReceiveCount'] += 1
+                message['VisibleAt'] = now + visibility_timeout
+                receipt_handle = str(uuid.uuid4())
+                self._in_flight[receipt_handle] = message_id
+                received.append({
+                    'MessageId': message_id,
+                    'ReceiptHandle': receipt_handle,
+                    'Body': message['Body'],
+                    'Priority': message['Priority'],
+                    'ReceiveCount': message['ReceiveCount']
+                })
+        return received
+
+    def delete_message(self, message):
+        with self._lock:
+            message_id = self._in_flight.pop(message['ReceiptHandle'], None)
+            if message_id is not None:
+                del self._messages[message_id]
+
+    def change_message_visibility(self, message, visibility_timeout):
+        with self._lock:
+            message_id = self._in_flight.get(message['ReceiptHandle'])
+            if message_id is not None:
+                self._messages[message_id]['VisibleAt'] = self._clock() + visibility_timeout
+
+    def depth(self):
+        with self._lock:
+            return len(self._messages)
+
+
+class SqsQueue:
+    """One logical stage queue backed by an SQS queue per priority."""
+
+    def __init__(self, sqs_client, queue_urls):
+        self.sqs_client = sqs_client
+        self.queue_urls = queue_urls
+
+    def send_message(self, body, priority=PRIORITY_BULK):
+        queue_url = self.queue_urls.get(priority) or next(iter(self.queue_urls.values()))
+        response = self.sqs_client.send_message(
+            QueueUrl=queue_url,
+            MessageBody=body
+        )
+        return response['MessageId']
+
+    def receive_messages(self, max_messages=1, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        received = []
+        for priority in PRIORITIES:
+            if priority not in self.queue_urls:
+                continue
+            remaining = max_messages - len(received)
+            if remaining <= 0:
+                break
+            response = self.sqs_client.receive_message(
+                QueueUrl=self.queue_urls[priority],
+                MaxNumberOfMessages=min(remaining, SQS_MAX_MESSAGES),
+                VisibilityTimeout=visibility_timeout,
+                AttributeNames=['ApproximateReceiveCount']
+            )
+            for message in response.get('Messages', []):
+                received.append({
+                    'MessageId': message['MessageId'],
+                    'ReceiptHandle': message['ReceiptHandle'],
+                    'Body': message['Body'],
+                    'Priority': priority,
+                    'ReceiveCount': int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1)),
+                    'QueueUrl': self.queue_urls[priority]
+                })
+        return received
+
+    def delete_message(self, message):
+        self.sqs_client.delete_message(
+            QueueUrl=message['QueueUrl'],
+            ReceiptHandle=message['ReceiptHandle']
+        )
+
+    def change_message_visibility(self, message, visibility_timeout):
+        self.sqs_client.change_message_visibility(
+            QueueUrl=message['QueueUrl'],
+            ReceiptHandle=message['ReceiptHandle'],
+            VisibilityTimeout=visibility_timeout
+        )
+
+
+class Orchestrator:
+    """Routes pipeline work between stage queues and drains them with per-stage concurrency caps."""
+
+    def __init__(self, queues, batch_size=DEFAULT_BATCH_SIZE, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, concurrency=None):
+        self.queues = queues
+        self.batch_size = batch_size
+        self.visibility_timeout = visibility_timeout
+        self.concurrency = {stage: 1 for stage in STAGES}
+        if concurrency:
+            self.concurrency.update(concurrency)
+
+    def enqueue(self, stage, bucket, key, doc_id=None, priority=PRIORITY_BULK):
+        if stage not in self.queues:
+            return None
+        message_id = self.queues[stage].send_message(make_body(bucket, key, doc_id, priority), priority)
+        print(f"Enqueued {key} for stage '{stage}' with {PRIORITY_NAMES[priority]} priority")
+        return message_id
+
+    def advance(self, stage, record, next_key, doc_id=None):
+        next_stage = NEXT_STAGE[stage]
+        if next_stage is None:
+            return None
+        return self.enqueue(next_stage, record['bucket'], next_key, doc_id or record.get('doc_id'), record['priority'])
+
+    def run_stage(self, stage, handler, max_batches=None):
+        queue = self.queues[stage]
+        processed = 0
+        batches = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency[stage]) as executor:
+            while max_batches is None or batches < max_batches:
+                messages = queue.receive_messages(self.batch_size, self.visibility_timeout)
+                if not messages:
+                    break
+                batches += 1
+
+                futures = [(message, executor.submit(handler, message_to_record(message))) for message in messages]
+                for message, future in futures:
+                    try:
+                        future.result()
+                        queue.delete_message(message)
+                        processed += 1
+                    except Exception as e:
+                        # left in flight so the queue redelivers it after the visibility timeout
+                        print(f"Error in stage '{stage}' for message {message['MessageId']}: {str(e)}")
+
+        return processed
+
+
+def queue_urls(configur, stage):
+    urls = {}
+    for priority, name in PRIORITY_NAMES.items():
+        option = f"{stage}_{name}_url"
+        if configur.has_option('queue', option):
+            urls[priority] = configur.get('queue', option)
+    return urls
+
+
+def stage_concurrency(configur, stage, priority=PRIORITY_INTERACTIVE):
+    concurrency = configur.getint('queue', f"{stage}_concurrency", fallback=1)
+    if priority == PRIORITY_BULK:
+        concurrency = configur.getint('queue', f"{stage}_bulk_concurrency", fallback=concurrency)
+    return concurrency
+
+
+def event_source_settings(configur, stage, priority):
+    # the [queue] settings the local driver applies itself, as a Lambda SQS event source mapping update;
+    # Lambda polls every queue on its own, so bulk is held back by its lower concurrency cap
+    return {
+        'BatchSize': configur.getint('queue', 'batch_size', fallback=DEFAULT_BATCH_SIZE),
+        'FunctionResponseTypes': ['ReportBatchItemFailures'],
+        'ScalingConfig': {
+            'MaximumConcurrency': max(MIN_MAXIMUM_CONCURRENCY, stage_concurrency(configur, stage, priority))
+        }
+    }
+
+
+def configure_event_sources(configur, functions, lambda_client, sqs_client):
+    # functions maps stage -> Lambda function name; run at deploy time, once the SQS triggers exist
+    visibility_timeout = configur.getint('queue', 'visibility_timeout', fallback=DEFAULT_VISIBILITY_TIMEOUT)
+    updated = []
+    for stage, function_name in functions.items():
+        for priority, queue_url in queue_urls(configur, stage).items():
+            sqs_client.set_queue_attributes(
+                QueueUrl=queue_url,
+                Attributes={'VisibilityTimeout': str(visibility_timeout)}
+            )
+            queue_arn = sqs_client.get_queue_attributes(
+                QueueUrl=queue_url,
+                AttributeNames=['QueueArn']
+            )['Attributes']['QueueArn']
+            mappings = lambda_client.list_event_source_mappings(
+                EventSourceArn=queue_arn,
+                FunctionName=function_name
+            )['EventSourceMappings']
+            if not mappings:
+                raise Exception(f"No event source mapping from {queue_arn} to {function_name}")
+            for mapping in mappings:
+                lambda_client.update_event_source_mapping(
+                    UUID=mapping['UUID'],
+                    **event_source_settings(configur, stage, priority)
+                )
+                updated.append(mapping['UUID'])
+    return updated
+
+
+def from_config(configur, sqs_client=None):
+    global _sqs_client
+
+    if not configur.has_section('queue'):
+        return None
+
+    if sqs_client is None:
+        if _sqs_client is None:
+            import boto3
+            _sqs_client = boto3.client('sqs')
+        sqs_client = _sqs_client
+
+    queues = {}
+    concurrency = {}
+    for stage in STAGES:
+        urls = queue_urls(configur, stage)
+        if urls:
+            queues[stage] = SqsQueue(sqs_client, urls)
+        concurrency[stage] = stage_concurrency(configur, stage)
+
+    return Orchestrator(
+        queues,
+        batch_size=configur.getint('queue', 'batch_size', fallback=DEFAULT_BATCH_SIZE),
+        visibility_timeout=configur.getint('queue', 'visibility_timeout', fallback=DEFAULT_VISIBILITY_TIMEOUT),
+        concurrency=concurrency
+    )
+
+
+if __name__ == '__main__':
+    import argparse
+    import boto3
+    import coldstart
+
+    parser = argparse.ArgumentParser(description="Apply the [queue] settings to the stages' SQS event source mappings")
+    parser.add_argument('--config', default='organa-config.ini')
+    parser.add_argument('--process', default='organa-pdf-processing-handler')
+    parser.add_argument('--extract', default='organa-text-extraction-handler')
+    parser.add_argument('--embed', default='organa-embeddings-handler')
+    args = parser.parse_args()
+
+    configur = coldstart.load_config(args.config)
+    functions = {stage: getattr(args, stage) for stage in STAGES}
+    for mapping_uuid in configure_event_sources(configur, functions, boto3.client('lambda'), boto3.client('sqs')):
+        print(f"Updated event source mapping {mapping_uuid}")
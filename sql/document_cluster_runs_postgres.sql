@@ -0,0 +1,9 @@
+-- unclustered documents left over by each user's last clustering pass (lamda_functions/clustering.py);
+-- an unmatched document only triggers another pass once REGROW_DOCUMENTS more have arrived
+CREATE TABLE document_cluster_runs (
+    user_id VARCHAR(64) PRIMARY KEY,
+    unclustered INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE document_cluster_runs TO "organa-read-write";
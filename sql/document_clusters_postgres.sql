@@ -0,0 +1,25 @@
+CREATE TABLE document_clusters (
+    cluster_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id VARCHAR(64) NOT NULL,
+    centroid VECTOR NOT NULL,
+    member_count INT NOT NULL DEFAULT 0,
+    label VARCHAR(100),
+    status VARCHAR(16) NOT NULL DEFAULT 'suggested' CHECK (status IN ('suggested', 'accepted', 'dismissed')),
+    group_id UUID REFERENCES document_groups(group_id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX document_clusters_user_idx ON document_clusters (user_id);
+
+CREATE TABLE document_cluster_members (
+    doc_id UUID PRIMARY KEY REFERENCES document_embeddings(doc_id) ON DELETE CASCADE,
+    cluster_id UUID NOT NULL REFERENCES document_clusters(cluster_id) ON DELETE CASCADE,
+    distance DOUBLE PRECISION,
+    assigned_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX document_cluster_members_cluster_idx ON document_cluster_members (cluster_id, distance);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE document_clusters TO "organa-read-write";
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE document_cluster_members TO "organa-read-write";
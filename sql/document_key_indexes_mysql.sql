@@ -0,0 +1,8 @@
+-- lookups and fallback UPDATEs by S3 key (stagestate.fail_by_key, the embeddings stage for objects
+-- written before doc-id/user-id object metadata) would otherwise scan documents;
+-- doc_id is the primary key, so InnoDB already stores it in every secondary index
+CREATE INDEX documents_original_key_idx
+    ON documents (original_bucket_key, userid, processed_bucket_key);
+
+CREATE INDEX documents_processed_key_idx
+    ON documents (processed_bucket_key);
@@ -0,0 +1,13 @@
+CREATE TABLE document_neighbors (
+    doc_id UUID NOT NULL REFERENCES document_embeddings(doc_id) ON DELETE CASCADE,
+    neighbor_id UUID NOT NULL REFERENCES document_embeddings(doc_id) ON DELETE CASCADE,
+    user_id VARCHAR(64) NOT NULL,
+    similarity DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (doc_id, neighbor_id)
+);
+
+CREATE INDEX document_neighbors_doc_similarity_idx ON document_neighbors (doc_id, similarity DESC);
+CREATE INDEX document_neighbors_user_idx ON document_neighbors (user_id);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE document_neighbors TO "organa-read-write";
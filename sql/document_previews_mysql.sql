@@ -0,0 +1,3 @@
+-- number of page previews the PDF processor stored under organa-previews/ (0 or NULL: none yet)
+ALTER TABLE documents 
+    ADD COLUMN preview_pages INT NULL;
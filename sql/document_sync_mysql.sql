@@ -0,0 +1,9 @@
+-- change tracking for the delta-sync API (organa-changes-handler) and the document list ETag
+-- (organa-retrieve-handler); every UPDATE, including each status transition, moves updated_at
+ALTER TABLE documents
+    ADD COLUMN updated_at DATETIME(6) NOT NULL
+        DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+-- "changed since" and COUNT/MAX per user are answered from this index alone
+CREATE INDEX documents_user_updated_idx
+    ON documents (userid, updated_at);
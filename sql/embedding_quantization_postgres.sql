@@ -0,0 +1,27 @@
+-- requires pgvector 0.7+ (halfvec, bit, binary_quantize)
+
+-- 1. compact columns next to the float vector
+ALTER TABLE document_embeddings
+    ADD COLUMN embedding_half halfvec(1536),
+    ADD COLUMN embedding_bits bit(1536);
+
+-- 2. dual write: set `dual_write = half, binary` under [embeddings] in organa-config.ini,
+--    then backfill existing rows; repeat until it updates 0 rows
+UPDATE document_embeddings
+SET embedding_half = embedding::halfvec(1536),
+    embedding_bits = binary_quantize(embedding)::bit(1536)
+WHERE doc_id IN (
+    SELECT doc_id FROM document_embeddings
+    WHERE embedding_half IS NULL OR embedding_bits IS NULL
+    LIMIT 1000
+);
+
+-- 3. indexes on the compact columns
+CREATE INDEX CONCURRENTLY document_embeddings_half_hnsw_idx
+    ON document_embeddings USING hnsw (embedding_half halfvec_l2_ops);
+CREATE INDEX CONCURRENTLY document_embeddings_bits_hnsw_idx
+    ON document_embeddings USING hnsw (embedding_bits bit_hamming_ops);
+
+-- 4. switch reads with `search_mode = half` or `binary` under [embeddings] (or ?mode= per request),
+--    and compare with benchmarks/quantization_bench.py --postgres before dropping anything.
+--    Re-ranking reads the float column, so keep it for binary mode.
@@ -0,0 +1,49 @@
+-- which embedding model produced each vector; new models are backfilled beside the live vectors
+-- and swapped in by `organa-reembed-handler` ({"action": "cutover"}) in one transaction
+
+-- 1. record the model of every existing vector
+ALTER TABLE document_embeddings
+    ADD COLUMN model_version VARCHAR(64) NOT NULL DEFAULT 'text-embedding-ada-002';
+
+CREATE TABLE embedding_models (
+    model_version VARCHAR(64) PRIMARY KEY,
+    status VARCHAR(16) NOT NULL DEFAULT 'backfilling' CHECK (status IN ('active', 'backfilling', 'retired')),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    activated_at TIMESTAMP WITH TIME ZONE
+);
+
+-- at most one active version
+CREATE UNIQUE INDEX embedding_models_active_idx ON embedding_models (status) WHERE status = 'active';
+
+INSERT INTO embedding_models (model_version, status, activated_at)
+VALUES ('text-embedding-ada-002', 'active', NOW());
+
+-- 2. vectors from versions that are not live: the one being backfilled, and the ones replaced at cutover
+CREATE TABLE document_embedding_versions (
+    doc_id UUID NOT NULL REFERENCES document_embeddings(doc_id) ON DELETE CASCADE,
+    model_version VARCHAR(64) NOT NULL REFERENCES embedding_models(model_version),
+    user_id VARCHAR(64) NOT NULL,
+    embedding VECTOR(1536) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (doc_id, model_version)
+);
+
+CREATE TABLE embedding_backfill_checkpoints (
+    model_version VARCHAR(64) PRIMARY KEY REFERENCES embedding_models(model_version),
+    last_doc_id UUID NOT NULL,
+    embedded INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    completed_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- 3. versioned indexes: one partial HNSW index per model on the live table, matched by the
+--    `model_version = ...` predicate every search carries. {"action": "start"} creates the new
+--    version's (empty) index before cutover; drop the retired one once there is no going back.
+CREATE INDEX CONCURRENTLY document_embeddings_text_embedding_ada_002_hnsw_idx
+    ON document_embeddings USING hnsw (embedding vector_l2_ops)
+    WHERE model_version = 'text-embedding-ada-002';
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE embedding_models TO "organa-read-write";
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE document_embedding_versions TO "organa-read-write";
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE embedding_backfill_checkpoints TO "organa-read-write";
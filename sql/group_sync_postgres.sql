@@ -0,0 +1,13 @@
+-- change tracking for the delta-sync API (organa-changes-handler) and the group list ETag
+-- (organa-list-group-handler); assignments are insert-only, so assigned_at already serves
+
+-- 1. groups: set on insert and by every UPDATE that writes it (suggestions.accept merging into a group)
+ALTER TABLE document_groups
+    ADD COLUMN updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+CREATE INDEX CONCURRENTLY document_groups_user_updated_idx
+    ON document_groups (user_id, updated_at);
+
+-- 2. the UNIQUE (doc_id, group_id) index does not serve lookups by group
+CREATE INDEX CONCURRENTLY document_group_assignments_group_idx
+    ON document_group_assignments (group_id, assigned_at);
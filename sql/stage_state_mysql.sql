@@ -0,0 +1,5 @@
+ALTER TABLE documents 
+    ADD COLUMN failed_stage VARCHAR(16) NULL,
+    ADD COLUMN last_error VARCHAR(512) NULL,
+    ADD COLUMN process_attempts INT NOT NULL DEFAULT 0,
+    ADD COLUMN extract_attempts INT NOT NULL DEFAULT 0;
@@ -0,0 +1,2 @@
+ALTER TABLE documents 
+    MODIFY status ENUM('pending', 'uploaded', 'processing', 'processed', 'extracting', 'extracted', 'failed') NOT NULL;
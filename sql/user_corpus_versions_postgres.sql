@@ -0,0 +1,9 @@
+-- per-user counter behind the search result cache (lamda_functions/searchcache.py); bumped in the
+-- same transaction as every embeddings write and group assignment, read by every search
+CREATE TABLE user_corpus_versions (
+    user_id VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE user_corpus_versions TO "organa-read-write";